@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -40,12 +42,16 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
     # 'authentication',
     'purchase'
 ]
 
 MIDDLEWARE = [
+    'purchase.instrumentation.InstrumentationMiddleware',
+    'purchase.compression.CompressionMiddleware',
+    'purchase.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -103,6 +109,15 @@ DATABASES = {
     }
 }
 
+# Read replicas, as aliases of DATABASES mapped to weights. purchase.routers.ReplicaRouter sends the
+# reads of GET/HEAD/OPTIONS requests to one of them and everything else to 'default'; a client that
+# writes reads from 'default' for the next REPLICA_PIN_SECONDS, which should cover replication lag.
+# A replica that cannot be reached is skipped for REPLICA_RETRY_SECONDS.
+DATABASE_ROUTERS = ['purchase.routers.ReplicaRouter']
+DATABASE_REPLICAS = {}
+REPLICA_PIN_SECONDS = 5
+REPLICA_RETRY_SECONDS = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -150,18 +165,22 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'purchase.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    # JSON is encoded and parsed with orjson when it is installed; the browsable API is for development only.
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'purchase.renderers.FastJSONRenderer',
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
     ],
     'DEFAULT_PARSER_CLASSES': [
-        'rest_framework.parsers.JSONParser',
+        'purchase.renderers.FastJSONParser',
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser'
-    ]
+    ],
+    # Cursor pagination on (ordering, id); pass ?offset=/?limit= for offset based paging.
+    'DEFAULT_PAGINATION_CLASS': 'purchase.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
 CORS_ALLOWED_ORIGINS = [
@@ -170,6 +189,8 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
     "http://127.0.0.1:5173"
 ]
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key', 'prefer')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed', 'Location', 'Preference-Applied']
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -180,4 +201,86 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True
-}
\ No newline at end of file
+}
+
+# Users authenticated by CachedJWTAuthentication are kept in a per-process LRU for reads; changes
+# made in another process reach it after at most AUTH_USER_CACHE_TTL seconds. Blacklisted tokens
+# are cached in CATALOG_CACHE_ALIAS, so share that cache between processes.
+AUTH_USER_CACHE_SIZE = 1024
+AUTH_USER_CACHE_TTL = 60
+
+# Document number formats and how many numbers each worker reserves per counter lock.
+# See purchase/sequences.py for the defaults, e.g.
+# DOCUMENT_SEQUENCES = {'SO': {'format': 'SO-{number:06d}', 'block_size': 50}}
+DOCUMENT_SEQUENCES = {}
+
+# 'tokens' keeps a prefix-searchable token table in sync on save; 'fulltext' uses MySQL FULLTEXT.
+# 'auto' picks FULLTEXT on MySQL and the token table elsewhere.
+PRODUCT_SEARCH_BACKEND = 'auto'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sea-lion',
+    }
+}
+
+# Cache alias used for product and warehouse API responses; point it at a shared backend such as
+# Redis or Memcached when running more than one process.
+CATALOG_CACHE_ALIAS = 'default'
+
+# Queue a job generating every product image rendition right after upload; when False renditions
+# are only rendered on first request.
+IMAGE_RENDITIONS_EAGER = True
+
+# How far behind the clock compact_stock_ledger takes its snapshots, so that movements written by
+# transactions that have not committed yet still land after the snapshot.
+STOCK_SNAPSHOT_LAG = timedelta(minutes=5)
+
+# Per-request instrumentation of the purchase API (purchase.instrumentation). Server-Timing headers
+# show query count, DB time, serializer time and total latency; query budgets declared with
+# @query_budget raise instead of only being recorded when QUERY_BUDGETS_ENFORCED is set, as the
+# test suite does.
+SERVER_TIMING_ENABLED = True
+QUERY_BUDGETS_ENFORCED = False
+
+# The async read views under /api/async/ run independent queries of a request (a page and its
+# summary aggregates) at the same time, each on a worker thread with its own connection. Set
+# CONN_MAX_AGE to keep those connections open between requests.
+ASYNC_READ_CONCURRENT_QUERIES = True
+
+# purchase.compression.CompressionMiddleware encodes text and JSON responses of at least
+# COMPRESSION_MIN_SIZE bytes, streamed exports included, with Brotli when the Brotli package is
+# installed and the client accepts it, else gzip.
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 4
+
+# Stock reservations (POST /api/reservations/) hold stock for a checkout for RESERVATION_TTL, or a
+# client-chosen ttl of up to RESERVATION_MAX_TTL. Held units are not available to other orders.
+RESERVATION_TTL = timedelta(minutes=10)
+RESERVATION_MAX_TTL = timedelta(hours=1)
+
+# Seconds POST /api/stock/availability/ answers are cached for; 0 disables the cache. Stock changes
+# and new or released reservations invalidate answers early, reservations that expire do not.
+STOCK_AVAILABILITY_CACHE_TTL = 0
+
+# Sales order creation and purchase order creation/receipt honour an Idempotency-Key header
+# (purchase.idempotency). Responses are replayed to retries for IDEMPOTENCY_KEY_TTL, after which
+# purge_idempotency_keys deletes them; a request that dies mid-way releases its key after
+# IDEMPOTENCY_LOCK_TIMEOUT.
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+IDEMPOTENCY_LOCK_TIMEOUT = timedelta(seconds=60)
+
+# Background jobs (purchase.jobs) are queued in the database and run by `manage.py run_jobs`, on
+# JOB_WORKER_CONCURRENCY threads or, with JOB_WORKER_MODE = 'process', processes. Requests sent with
+# `Prefer: respond-async` to the receive and import actions are answered 202 with the job to poll at
+# /api/jobs/<id>/. Failed jobs are retried JOB_MAX_ATTEMPTS times in all, JOB_RETRY_BACKOFF apart
+# and doubling up to JOB_RETRY_BACKOFF_MAX; a job whose worker stops renewing its JOB_LEASE is requeued.
+JOB_WORKER_CONCURRENCY = 4
+JOB_WORKER_MODE = 'thread'
+JOB_POLL_INTERVAL = 1.0
+JOB_LEASE = timedelta(minutes=5)
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = timedelta(seconds=10)
+JOB_RETRY_BACKOFF_MAX = timedelta(hours=1)
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class PurchaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'purchase'
+
+    def ready(self):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+        from . import signals, tasks  # noqa: F401
+        from .instrumentation import install_query_counter
+
+        connection_created.connect(install_query_counter, dispatch_uid='purchase.install_query_counter')
+        for connection in connections.all(initialized_only=True):
+            install_query_counter(connection=connection)
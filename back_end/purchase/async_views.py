@@ -0,0 +1,127 @@
+import asyncio
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from django.views import View
+from rest_framework.response import Response
+
+from .cache import CachedResponseMixin, get_cache
+from .instrumentation import query_budget, serialized
+from .views import ProductViewSet, WarehouseStockViewSet, SalesOrderViewSet
+
+
+def on_own_connection(func):
+    def call():
+        # Worker threads are reused, so their connections follow CONN_MAX_AGE like request threads do.
+        close_old_connections()
+        try:
+            return func()
+        finally:
+            close_old_connections()
+    return call
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    Run blocking ORM work off the event loop. With ASYNC_READ_CONCURRENT_QUERIES each call gets a
+    worker thread and connection of its own, so gathered calls run their queries at the same time;
+    otherwise calls share Django's one sync thread, and the connection of an enclosing transaction.
+    """
+    func = partial(func, *args, **kwargs)
+    if getattr(settings, 'ASYNC_READ_CONCURRENT_QUERIES', True):
+        return await sync_to_async(on_own_connection(func), thread_sensitive=False)()
+    return await sync_to_async(func)()
+
+
+class AsyncReadView(View):
+    """
+    Async counterpart of a read action of a DRF viewset. Authentication, permissions, filtering,
+    pagination, serialization and response caching are the viewset's own, so the body matches the
+    sync endpoint; list views add a ``summary`` of aggregates queried concurrently with the page.
+    """
+    viewset_class = None
+    action = None
+    summary = None
+
+    async def get(self, request, *args, **kwargs):
+        viewset = self.viewset_class(action_map={'get': self.action}, args=args, kwargs=kwargs, format_kwarg=None)
+        viewset.request = request = viewset.initialize_request(request, *args, **kwargs)
+        viewset.headers = viewset.default_response_headers
+        try:
+            await run_sync(viewset.initial, request, *args, **kwargs)
+            if isinstance(viewset, CachedResponseMixin) and request.accepted_renderer.format == 'json':
+                response = await self.cached_response(viewset, request)
+            else:
+                response = await self.respond(viewset, request)
+        except Exception as exc:
+            response = viewset.handle_exception(exc)
+        response = viewset.finalize_response(request, response, *args, **kwargs)
+        return response.render() if hasattr(response, 'render') else response
+
+    async def cached_response(self, viewset, request):
+        kind = 'list' if self.action == 'list' else 'detail'
+        key = await run_sync(viewset.cache_key, request, kind, viewset.kwargs)
+        entry = await get_cache().aget(key)
+        response = None
+        if entry is None:
+            viewset.cache_objects = []
+            response = await self.respond(viewset, request)
+            if response.status_code != 200:
+                return response
+            response = viewset.finalize_response(request, response, *viewset.args, **viewset.kwargs)
+            entry = await run_sync(viewset.store_response, key, response)
+        return viewset.conditional_response(request, entry, response)
+
+    async def respond(self, viewset, request):
+        if self.action == 'retrieve':
+            return await run_sync(self.retrieve, viewset)
+        queryset = await run_sync(lambda: viewset.filter_queryset(viewset.get_queryset()))
+        if not self.summary:
+            return await run_sync(self.page, viewset, queryset)
+        response, summary = await asyncio.gather(
+            run_sync(self.page, viewset, queryset),
+            run_sync(lambda: queryset.order_by().aggregate(**self.summary)),
+        )
+        response.data['summary'] = summary
+        return response
+
+    def page(self, viewset, queryset):
+        page = viewset.paginate_queryset(queryset)
+        if page is None:
+            return Response(serialized(viewset.get_serializer(queryset, many=True)))
+        return viewset.get_paginated_response(serialized(viewset.get_serializer(page, many=True)))
+
+    def retrieve(self, viewset):
+        return Response(serialized(viewset.get_serializer(viewset.get_object())))
+
+
+# List budgets are one query over the sync action's, for the summary aggregate.
+@query_budget(get=3)
+class ProductListView(AsyncReadView):
+    viewset_class = ProductViewSet
+    action = 'list'
+    summary = {'products': Count('id'), 'units': Coalesce(Sum('stock'), 0)}
+
+
+@query_budget(get=1)
+class ProductDetailView(AsyncReadView):
+    viewset_class = ProductViewSet
+    action = 'retrieve'
+
+
+@query_budget(get=2)
+class WarehouseListView(AsyncReadView):
+    viewset_class = WarehouseStockViewSet
+    action = 'list'
+    summary = {'products': Count('id'), 'units': Coalesce(Sum('quantity'), 0)}
+
+
+@query_budget(get=4)
+class SalesOrderListView(AsyncReadView):
+    viewset_class = SalesOrderViewSet
+    action = 'list'
+    summary = {'orders': Count('id'), 'revenue': Sum('total_amount')}
@@ -0,0 +1,128 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import datetime_from_epoch, get_md5_hash_password
+
+from .cache import get_cache
+
+# How long a "not blacklisted" answer is trusted by processes that did not see the blacklisting.
+REVOCATION_CHECK_TTL = 60
+
+
+class UserCache:
+    """
+    Thread-safe LRU of users by id, bounded by AUTH_USER_CACHE_SIZE; entries expire after
+    AUTH_USER_CACHE_TTL seconds. Ids are keyed as strings, as token claims may carry either form.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, pk):
+        pk = str(pk)
+        with self._lock:
+            entry = self._entries.get(pk)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires < time.monotonic():
+                del self._entries[pk]
+                return None
+            self._entries.move_to_end(pk)
+        return copy.copy(user)
+
+    def set(self, pk, user):
+        pk, ttl = str(pk), getattr(settings, 'AUTH_USER_CACHE_TTL', 60)
+        with self._lock:
+            self._entries[pk] = (copy.copy(user), time.monotonic() + ttl)
+            self._entries.move_to_end(pk)
+            while len(self._entries) > getattr(settings, 'AUTH_USER_CACHE_SIZE', 1024):
+                self._entries.popitem(last=False)
+
+    def discard(self, pk):
+        with self._lock:
+            self._entries.pop(str(pk), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def revoked_key(jti):
+    return f'auth:revoked:{jti}'
+
+
+def mark_revoked(jti, expires_at):
+    timeout = max(1, int((expires_at - timezone.now()).total_seconds()))
+    get_cache().set(revoked_key(jti), True, timeout)
+
+
+def is_revoked(jti):
+    """Whether the token is blacklisted; one indexed lookup on the jti, then cached."""
+    revoked = get_cache().get(revoked_key(jti))
+    if revoked is None:
+        revoked = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        get_cache().set(revoked_key(jti), revoked, None if revoked else REVOCATION_CHECK_TTL)
+    return revoked
+
+
+def revoke_token(token):
+    """Blacklist any validated token, including access tokens, which simplejwt does not track."""
+    outstanding, _ = OutstandingToken.objects.get_or_create(jti=token[api_settings.JTI_CLAIM], defaults={
+        'user_id': token.get(api_settings.USER_ID_CLAIM),
+        'token': str(token),
+        'created_at': timezone.now(),
+        'expires_at': datetime_from_epoch(token['exp']),
+    })
+    return BlacklistedToken.objects.get_or_create(token=outstanding)[0]
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without per-request queries. The signed claims are trusted for reads, which
+    take the user from an in-process cache that signal handlers clear when a user, their groups or
+    permissions change; writes always load the user from the database. Blacklisted tokens are
+    rejected through a cached lookup.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return self.get_user(validated_token, cached=request.method in SAFE_METHODS), validated_token
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        if jti is not None and is_revoked(jti):
+            raise InvalidToken(_('Token is blacklisted'))
+        return validated_token
+
+    def get_user(self, validated_token, cached=False):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = user_cache.get(user_id) if cached and user_id is not None else None
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        elif api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
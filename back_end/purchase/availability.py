@@ -0,0 +1,48 @@
+import hashlib
+
+from django.conf import settings
+from django.db.models import Q
+
+from .cache import get_cache
+from .models import Product
+
+# Bumped when reservations change what is available; stock changes bump the warehouse generation.
+AVAILABILITY_GENERATION = 'catalog:availability'
+STOCK_GENERATION = 'catalog:warehouse'
+
+
+def lookup(ids, codes):
+    products = Product.objects.filter(Q(pk__in=ids) | Q(product_code__in=codes)).with_available()
+    rows = list(products.order_by('id').values('id', 'product_code', 'name', 'price', 'stock', 'available'))
+    for row in rows:
+        # Stock adjusted below what is held leaves nothing available rather than a negative amount.
+        row['available'] = max(row['available'], 0)
+    found_ids = {row['id'] for row in rows}
+    found_codes = {row['product_code'] for row in rows}
+    return {
+        'results': rows,
+        'not_found': {'ids': [pk for pk in ids if pk not in found_ids],
+                      'codes': [code for code in codes if code not in found_codes]},
+    }
+
+
+def stock_availability(ids=(), codes=()):
+    """
+    Stock and price of the products with the given ids or product codes, from one query. With
+    STOCK_AVAILABILITY_CACHE_TTL set, answers are cached for that many seconds; stock changes and
+    new or released reservations invalidate them sooner, but holds that expire do not.
+    """
+    ids, codes = list(dict.fromkeys(ids)), list(dict.fromkeys(codes))
+    ttl = getattr(settings, 'STOCK_AVAILABILITY_CACHE_TTL', 0)
+    if not ttl:
+        return lookup(ids, codes)
+    cache = get_cache()
+    generations = cache.get_many([STOCK_GENERATION, AVAILABILITY_GENERATION])
+    raw = f'{sorted(ids)}:{sorted(codes)}'
+    key = f'availability:{generations.get(STOCK_GENERATION, 0)}.{generations.get(AVAILABILITY_GENERATION, 0)}:' \
+          f'{hashlib.md5(raw.encode()).hexdigest()}'
+    data = cache.get(key)
+    if data is None:
+        data = lookup(ids, codes)
+        cache.set(key, data, ttl)
+    return data
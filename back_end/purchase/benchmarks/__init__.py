@@ -0,0 +1,4 @@
+"""
+Synthetic data generation and an endpoint benchmark runner, driven by the ``seed_benchmark_data``
+and ``run_benchmarks`` management commands. Run them against a dedicated database: both write.
+"""
@@ -0,0 +1,286 @@
+import json
+import platform
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import timedelta
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ..cache import get_cache
+from ..instrumentation import RequestMetrics
+from ..models import Product, PurchaseOrder, SalesOrder, StockMovement, SalesOrderItem
+
+Scenario = namedtuple('Scenario', 'name method build')
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+SEARCH_TERMS = ('syringe', 'glove', 'sterile cath', 'pump', 'mask', 'infusion')
+
+
+class Samples:
+    """Ids the scenarios pick from, loaded once before a run."""
+
+    def __init__(self, size=1000):
+        self.products = list(Product.objects.order_by('-id').values_list('id', flat=True)[:size])
+        self.stocked = list(Product.objects.with_stock().filter(stock__gte=10).order_by('-id').values_list('id', flat=True)[:size])
+        self.purchase_orders = list(PurchaseOrder.objects.order_by('-id').values_list('id', flat=True)[:size])
+        self.sales_orders = list(SalesOrder.objects.order_by('-id').values_list('id', flat=True)[:size])
+        self.movements = list(StockMovement.objects.order_by('-id').values_list('id', flat=True)[:size])
+        self.pending = list(PurchaseOrder.objects.filter(status=PurchaseOrder.OrderStatus.PENDING)
+                            .order_by('id').values_list('id', flat=True)[:size * 10])
+        self.lock = threading.Lock()
+
+    def pop_pending(self):
+        with self.lock:
+            return self.pending.pop() if self.pending else None
+
+
+def days_ago(days):
+    return (timezone.localdate() - timedelta(days=days)).isoformat()
+
+
+def get(path, **params):
+    return ('GET', f'{path}?{urlencode(params)}' if params else path, None)
+
+
+def sales_order_payload(samples, rng):
+    products = rng.sample(samples.stocked, min(3, len(samples.stocked)))
+    return {'customer_name': 'Benchmark Customer',
+            'items': [{'product': product, 'quantity': 1} for product in products]}
+
+
+def receive(samples, rng):
+    pk = samples.pop_pending()
+    return None if pk is None else ('POST', f'/api/purchase-orders/{pk}/receive/', None)
+
+
+def availability(samples, rng):
+    # The stock check of a fifty-line order.
+    return ('POST', '/api/stock/availability/', {'ids': rng.sample(samples.products, min(50, len(samples.products)))})
+
+
+# Each builder returns (method, path, json body), or None when the scenario has nothing left to do.
+SCENARIOS = [
+    Scenario('products.list', 'GET', lambda s, r: get('/api/products/')),
+    Scenario('products.list.by_stock', 'GET', lambda s, r: get('/api/products/', ordering='-stock')),
+    Scenario('products.search', 'GET', lambda s, r: get('/api/products/', search=r.choice(SEARCH_TERMS))),
+    Scenario('products.retrieve', 'GET', lambda s, r: get(f'/api/products/{r.choice(s.products)}/')),
+    Scenario('purchase-orders.list', 'GET', lambda s, r: get('/api/purchase-orders/')),
+    Scenario('purchase-orders.retrieve', 'GET',
+             lambda s, r: get(f'/api/purchase-orders/{r.choice(s.purchase_orders)}/')),
+    Scenario('purchase-orders.export', 'GET',
+             lambda s, r: get('/api/purchase-orders/export/', format='ndjson', date_from=days_ago(1))),
+    Scenario('purchase-orders.receive', 'POST', receive),
+    Scenario('warehouse.list', 'GET', lambda s, r: get('/api/warehouse/')),
+    Scenario('warehouse.as_of', 'GET', lambda s, r: get('/api/warehouse/', as_of=days_ago(r.randint(1, 90)))),
+    Scenario('stock-movements.list', 'GET', lambda s, r: get('/api/stock-movements/')),
+    Scenario('stock-movements.retrieve', 'GET', lambda s, r: get(f'/api/stock-movements/{r.choice(s.movements)}/')),
+    Scenario('sales-orders.list', 'GET', lambda s, r: get('/api/sales-orders/')),
+    Scenario('sales-orders.retrieve', 'GET', lambda s, r: get(f'/api/sales-orders/{r.choice(s.sales_orders)}/')),
+    Scenario('sales-orders.export', 'GET',
+             lambda s, r: get('/api/sales-orders/export/', format='ndjson', date_from=days_ago(1))),
+    Scenario('sales-orders.create', 'POST',
+             lambda s, r: ('POST', '/api/sales-orders/', sales_order_payload(s, r))),
+    Scenario('products.list.async', 'GET', lambda s, r: get('/api/async/products/')),
+    Scenario('products.retrieve.async', 'GET', lambda s, r: get(f'/api/async/products/{r.choice(s.products)}/')),
+    Scenario('warehouse.list.async', 'GET', lambda s, r: get('/api/async/warehouse/')),
+    Scenario('sales-orders.list.async', 'GET', lambda s, r: get('/api/async/sales-orders/')),
+    Scenario('reports.sales', 'GET', lambda s, r: get('/api/reports/sales/', date_from=days_ago(365), interval='week')),
+    Scenario('reports.top-products', 'GET', lambda s, r: get('/api/reports/top-products/', date_from=days_ago(90))),
+    Scenario('reports.top-customers', 'GET', lambda s, r: get('/api/reports/top-customers/', date_from=days_ago(90))),
+    Scenario('jobs.list', 'GET', lambda s, r: get('/api/jobs/')),
+    Scenario('reservations.list', 'GET', lambda s, r: get('/api/reservations/')),
+    Scenario('stock.availability', 'POST', availability),
+]
+
+
+class InProcessClient:
+    """Calls the API through the Django handler in this process; queries are counted on every connection."""
+
+    def __init__(self, user):
+        host = next((host for host in settings.ALLOWED_HOSTS if host not in ('*',) and not host.startswith('.')),
+                    'localhost')
+        self.client = APIClient(SERVER_NAME=host)
+        self.client.raise_request_exception = False
+        self.client.force_authenticate(user=user)
+
+    def request(self, method, path, body):
+        metrics = RequestMetrics()
+        with ExitStack() as stack:
+            for db in connections.all():
+                stack.enter_context(db.execute_wrapper(metrics.record_query))
+            response = self.client.generic(method, path, json.dumps(body) if body is not None else '',
+                                           content_type='application/json')
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+        return response.status_code, metrics.queries
+
+    def close(self):
+        connection.close()
+
+
+class HttpClient:
+    """Calls a running server over HTTP with a JWT; query counts come from its Server-Timing header."""
+
+    def __init__(self, base_url, token):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+
+    @classmethod
+    def login(cls, base_url, username, password):
+        request = urllib.request.Request(f'{base_url.rstrip("/")}/api/token/', method='POST',
+                                         data=json.dumps({'username': username, 'password': password}).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)['access']
+
+    def request(self, method, path, body):
+        request = urllib.request.Request(
+            self.base_url + path, method=method, data=json.dumps(body).encode() if body is not None else None,
+            headers={'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/json',
+                     'Accept': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status, timing = response.status, response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as error:
+            error.read()
+            status, timing = error.code, error.headers.get('Server-Timing', '')
+        match = SERVER_TIMING_QUERIES.search(timing)
+        return status, int(match.group(1)) if match else None
+
+    def close(self):
+        pass
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, queries, errors, skipped, elapsed):
+    latencies = sorted(latencies)
+    queries = sorted(value for value in queries if value is not None)
+    ms = lambda value: None if value is None else round(value * 1000, 2)  # noqa: E731
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'skipped': skipped,
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed and latencies else None,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1] if latencies else None),
+        'queries_p50': percentile(queries, 0.50),
+        'queries_max': queries[-1] if queries else None,
+    }
+
+
+class BenchmarkRunner:
+    def __init__(self, make_client, requests=50, warmup=3, concurrency=1, cold_cache=False, seed=1,
+                 scenarios=None, log=None):
+        self.make_client = make_client
+        self.requests = requests
+        self.warmup = warmup
+        self.concurrency = concurrency
+        self.cold_cache = cold_cache
+        self.seed = seed
+        self.scenarios = [scenario for scenario in SCENARIOS if not scenarios or scenario.name in scenarios]
+        self.log = log or (lambda message: None)
+
+    def worker(self, scenario, samples, count, warmup, worker_index, close=True):
+        rng = random.Random(f'{self.seed}:{scenario.name}:{worker_index}')
+        client = self.make_client()
+        latencies, queries, errors, skipped = [], [], 0, 0
+        try:
+            for iteration in range(warmup + count):
+                request = scenario.build(samples, rng)
+                if request is None:
+                    skipped += 1
+                    continue
+                if self.cold_cache:
+                    get_cache().clear()
+                started = time.perf_counter()
+                try:
+                    status, query_count = client.request(*request)
+                except Exception:
+                    status, query_count = None, None
+                elapsed = time.perf_counter() - started
+                if iteration < warmup:
+                    continue
+                latencies.append(elapsed)
+                queries.append(query_count)
+                if status is None or status >= 400:
+                    errors += 1
+        finally:
+            if close:
+                client.close()
+        return latencies, queries, errors, skipped
+
+    def run_scenario(self, scenario, samples):
+        shares = [self.requests // self.concurrency + (index < self.requests % self.concurrency)
+                  for index in range(self.concurrency)]
+        started = time.perf_counter()
+        if self.concurrency == 1:
+            # Run in this thread, on this thread's connection, which is left open.
+            results = [self.worker(scenario, samples, self.requests, self.warmup, 0, close=False)]
+        else:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                results = list(executor.map(
+                    lambda index: self.worker(scenario, samples, shares[index], self.warmup if index == 0 else 0,
+                                              index),
+                    range(self.concurrency),
+                ))
+        elapsed = time.perf_counter() - started
+        latencies = [value for result in results for value in result[0]]
+        queries = [value for result in results for value in result[1]]
+        return summarize(latencies, queries, sum(result[2] for result in results),
+                         sum(result[3] for result in results), elapsed)
+
+    def run(self):
+        samples = Samples()
+        report = {
+            'meta': {
+                'started_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'requests': self.requests,
+                'warmup': self.warmup,
+                'concurrency': self.concurrency,
+                'cold_cache': self.cold_cache,
+                'seed': self.seed,
+                'rows': {model.__name__: model.objects.count()
+                         for model in (Product, PurchaseOrder, SalesOrder, SalesOrderItem, StockMovement)},
+            },
+            'scenarios': {},
+        }
+        for scenario in self.scenarios:
+            report['scenarios'][scenario.name] = result = self.run_scenario(scenario, samples)
+            self.log(f'{scenario.name}: p50 {result["p50_ms"]} ms, p95 {result["p95_ms"]} ms, '
+                     f'{result["throughput_rps"]} req/s, {result["errors"]} error(s)')
+        return report
+
+
+def benchmark_user(username):
+    user, created = User.objects.get_or_create(username=username, defaults={'is_staff': True})
+    if created:
+        user.set_unusable_password()
+        user.save()
+    return user
@@ -0,0 +1,175 @@
+import math
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from ..cache import bump
+from ..ledger import compact_ledger
+from ..models import Product, PurchaseOrder, SalesOrder, SalesOrderItem, StockMovement
+from ..rollups import rebuild_rollups
+from ..search import rebuild_search_index, search_backend
+from ..sequences import allocator, format_document_number
+
+WORDS = (
+    'sterile', 'disposable', 'surgical', 'nitrile', 'latex', 'adult', 'pediatric', 'infusion', 'syringe', 'needle',
+    'catheter', 'gauze', 'bandage', 'mask', 'glove', 'gown', 'pump', 'monitor', 'sensor', 'cuff', 'scalpel', 'suture',
+    'dressing', 'tube', 'valve', 'filter', 'cannula', 'oxygen', 'thermometer', 'stethoscope', 'kit', 'tray',
+)
+SUPPLIERS = ('Medline', 'Cardinal Health', 'B. Braun', 'Becton Dickinson', 'Mindray', 'Terumo', 'Nipro', 'Smiths')
+# Generated sales orders share one order_date per this many rows, so dates take few UPDATEs to spread.
+DATE_BATCH = 500
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+class Seeder:
+    """
+    Bulk-generates a reproducible catalog, purchase order and sales history for benchmarks. Rows
+    are written with explicit primary keys in large batches, bypassing model saves, and history is
+    generated in time order so stock never goes negative at any point of the ledger.
+    """
+
+    def __init__(self, products, purchase_orders, sales_lines, lines_per_order=5, customers=500, days=365,
+                 batch_size=5000, seed=1, log=None):
+        self.products = products
+        self.purchase_orders = purchase_orders
+        self.sales_orders = math.ceil(sales_lines / lines_per_order) if sales_lines else 0
+        self.lines_per_order = lines_per_order
+        self.customers = [f'Customer {index:05d}' for index in range(customers)]
+        self.days = days
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.log = log or (lambda message: None)
+        self.product_ids = []
+        self.prices = []
+        self.available = []
+
+    def run(self):
+        started = timezone.now()
+        self.seed_products()
+        self.seed_history()
+        self.log('Rebuilding derived data')
+        # Snapshot the seeded history, as compact_stock_ledger would, so stock reads stay O(1).
+        compact_ledger()
+        rebuild_rollups()
+        if search_backend() == 'tokens':
+            rebuild_search_index()
+        bump('catalog:products', 'catalog:warehouse')
+        return timezone.now() - started
+
+    def seed_products(self):
+        first_id = next_id(Product)
+        for start in range(0, self.products, self.batch_size):
+            count = min(self.batch_size, self.products - start)
+            numbers = allocator.reserve('PROD', count)
+            batch = []
+            for offset, number in enumerate(numbers):
+                pk = first_id + start + offset
+                words = self.random.sample(WORDS, 3)
+                price = Decimal(self.random.randint(100, 250000)) / 100
+                batch.append(Product(
+                    id=pk, product_code=format_document_number('PROD', number),
+                    name=f'{" ".join(words).title()} {pk}', description=' '.join(self.random.choices(WORDS, k=12)),
+                    price=price,
+                ))
+                self.product_ids.append(pk)
+                self.prices.append(price)
+                self.available.append(0)
+            Product.objects.bulk_create(batch)
+            self.log(f'Products: {start + count}/{self.products}')
+
+    def seed_history(self):
+        if not self.product_ids:
+            return
+        steps = max(1, math.ceil(max(self.purchase_orders, self.sales_orders) / self.batch_size))
+        start = timezone.now() - timedelta(days=self.days)
+        step_length = timedelta(days=self.days) / steps
+        next_po_id = next_id(PurchaseOrder)
+        next_order_id = next_id(SalesOrder)
+        next_line_id = next_id(SalesOrderItem)
+        for step in range(steps):
+            step_start = start + step_length * step
+            purchase_count = self.share(self.purchase_orders, steps, step)
+            order_count = self.share(self.sales_orders, steps, step)
+            with transaction.atomic():
+                self.seed_purchase_orders(next_po_id, purchase_count, step_start)
+                next_line_id = self.seed_sales_orders(next_order_id, next_line_id, order_count, step_start,
+                                                      step_length)
+            next_po_id += purchase_count
+            next_order_id += order_count
+            self.log(f'History: step {step + 1}/{steps}')
+
+    @staticmethod
+    def share(total, steps, step):
+        return total * (step + 1) // steps - total * step // steps
+
+    def seed_purchase_orders(self, first_id, count, when):
+        if not count:
+            return
+        orders = []
+        receipts = []
+        for offset, number in enumerate(allocator.reserve('PO', count)):
+            index = self.random.randrange(len(self.product_ids))
+            quantity = self.random.randint(10, 500)
+            received = self.random.random() < 0.9
+            orders.append(PurchaseOrder(
+                id=first_id + offset, po_number=format_document_number('PO', number),
+                product_id=self.product_ids[index], supplier=self.random.choice(SUPPLIERS), quantity=quantity,
+                unit_price=(self.prices[index] * Decimal('0.6')).quantize(Decimal('0.01')),
+                status=PurchaseOrder.OrderStatus.RECEIVED if received else PurchaseOrder.OrderStatus.PENDING,
+            ))
+            if received:
+                self.available[index] += quantity
+                receipts.append(StockMovement(product_id=self.product_ids[index], kind=StockMovement.Kind.RECEIPT,
+                                              quantity=quantity, purchase_order_id=first_id + offset, created_at=when))
+        PurchaseOrder.objects.bulk_create(orders, batch_size=2000)
+        # order_date is auto_now_add, so bulk_create stamps it with the current time.
+        PurchaseOrder.objects.filter(id__gte=first_id, id__lt=first_id + count).update(order_date=when)
+        StockMovement.objects.bulk_create(receipts, batch_size=2000)
+
+    def pick_lines(self):
+        lines = {}
+        for _ in range(self.lines_per_order * 2):
+            if len(lines) == self.lines_per_order:
+                break
+            index = self.random.randrange(len(self.product_ids))
+            if index in lines or not self.available[index]:
+                continue
+            quantity = min(self.random.randint(1, 5), self.available[index])
+            self.available[index] -= quantity
+            lines[index] = quantity
+        return lines
+
+    def seed_sales_orders(self, first_id, next_line_id, count, step_start, step_length):
+        if not count:
+            return next_line_id
+        orders = []
+        lines = []
+        sales = []
+        for offset, number in enumerate(allocator.reserve('SO', count)):
+            order_id = first_id + offset
+            when = step_start + step_length * (offset // DATE_BATCH * DATE_BATCH + 1) / (count + 1)
+            total = Decimal('0.00')
+            for index, quantity in self.pick_lines().items():
+                price = self.prices[index]
+                total += price * quantity
+                lines.append(SalesOrderItem(id=next_line_id, sales_order_id=order_id,
+                                            product_id=self.product_ids[index], quantity=quantity, price=price))
+                sales.append(StockMovement(product_id=self.product_ids[index], kind=StockMovement.Kind.SALE,
+                                           quantity=-quantity, sales_order_id=order_id, created_at=when))
+                next_line_id += 1
+            orders.append((when, SalesOrder(id=order_id, so_number=format_document_number('SO', number),
+                                            customer_name=self.random.choice(self.customers), total_amount=total)))
+        SalesOrder.objects.bulk_create([order for _, order in orders], batch_size=2000)
+        for start in range(0, count, DATE_BATCH):
+            SalesOrder.objects.filter(id__gte=first_id + start, id__lt=first_id + min(start + DATE_BATCH, count)) \
+                .update(order_date=orders[start][0])
+        SalesOrderItem.objects.bulk_create(lines, batch_size=2000)
+        StockMovement.objects.bulk_create(sales, batch_size=2000)
+        return next_line_id
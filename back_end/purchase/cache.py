@@ -0,0 +1,154 @@
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+
+CACHE_TIMEOUT = 300
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def changed_at_key(key):
+    return f'{key}:changed_at'
+
+
+def bump(*keys):
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+    cache.set_many({changed_at_key(key): time.time() for key in keys}, None)
+
+
+def generations(keys):
+    """
+    The values of the generation ``keys`` and when the latest of them was bumped. A generation with
+    no recorded bump, as after a cache flush, counts as changed now.
+    """
+    cache = get_cache()
+    found = cache.get_many([*keys, *map(changed_at_key, keys)])
+    for key in map(changed_at_key, keys):
+        if key not in found:
+            cache.add(key, time.time(), None)
+            found[key] = cache.get(key, time.time())
+    changed_at = max(found[changed_at_key(key)] for key in keys)
+    return [found.get(key, 0) for key in keys], datetime.fromtimestamp(changed_at, dt_timezone.utc)
+
+
+def invalidate_products(product_ids):
+    """Drop cached catalog pages, the products' detail pages and warehouse pages."""
+    keys = ['catalog:products', 'catalog:warehouse'] + [f'catalog:products:{pk}' for pk in set(product_ids)]
+    bump(*keys)
+    # Bump again after commit so a page cached from pre-commit data by another request is dropped too.
+    transaction.on_commit(lambda: bump(*keys))
+
+
+def is_not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        # Weak comparison, as the compression middleware marks the ETags of encoded bodies weak.
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return etag.removeprefix('W/') in tags or if_none_match.strip() == '*'
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since and last_modified:
+        try:
+            return int(last_modified.timestamp()) <= int(parsedate_to_datetime(if_modified_since).timestamp())
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class CachedResponseMixin:
+    """
+    Serves list and detail JSON responses from the catalog cache, keyed on the query string and a
+    generation counter that signal handlers bump when the underlying rows change. Responses carry
+    an ETag and Last-Modified so repeat requests can be answered with 304 without a database hit.
+    Last-Modified is never earlier than the generation's last bump, so deleting a row, which
+    leaves the ``updated_at`` of the rest alone, still counts as a modification.
+    """
+    cache_namespace = None
+    # Key detail pages on the object's own generation so unrelated writes leave them cached.
+    cache_detail_by_object = False
+    last_modified_field = 'updated_at'
+
+    def cache_generation_keys(self, kind, kwargs):
+        if kind == 'detail' and self.cache_detail_by_object:
+            return [f'catalog:{self.cache_namespace}:{kwargs[self.lookup_field]}']
+        return [f'catalog:{self.cache_namespace}']
+
+    def get_last_modified(self, objects):
+        field = self.last_modified_field
+        updated_at = max((obj[field] if isinstance(obj, dict) else getattr(obj, field) for obj in objects),
+                         default=None)
+        return max(updated_at, self.cache_changed_at) if updated_at else self.cache_changed_at
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, 'list', super().list, args, kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, 'detail', super().retrieve, args, kwargs)
+
+    def cache_key(self, request, kind, kwargs):
+        values, self.cache_changed_at = generations(self.cache_generation_keys(kind, kwargs))
+        generations_part = '.'.join(str(value) for value in values)
+        raw = f'{request.get_host()}:{request.get_full_path()}'
+        digest = hashlib.md5(raw.encode()).hexdigest()
+        return f'catalog:{self.cache_namespace}:{generations_part}:{digest}'
+
+    def cached_response(self, request, kind, handler, args, kwargs):
+        if request.accepted_renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+
+        key = self.cache_key(request, kind, kwargs)
+        entry = get_cache().get(key)
+        response = None
+        if entry is None:
+            self.cache_objects = []
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            response = self.finalize_response(request, response, *args, **kwargs)
+            entry = self.store_response(key, response)
+        return self.conditional_response(request, entry, response)
+
+    def store_response(self, key, response):
+        response.render()
+        entry = {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'etag': f'"{hashlib.md5(response.content).hexdigest()}"',
+            'last_modified': self.get_last_modified(self.cache_objects),
+        }
+        get_cache().set(key, entry, CACHE_TIMEOUT)
+        return entry
+
+    def conditional_response(self, request, entry, response=None):
+        """Answer from a cache entry: 304 if the client has it, else ``response`` or the cached body."""
+        if is_not_modified(request, entry['etag'], entry['last_modified']):
+            response = HttpResponseNotModified()
+        elif response is None:
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+        response['ETag'] = entry['etag']
+        if entry['last_modified']:
+            response['Last-Modified'] = format_datetime(entry['last_modified'].astimezone(dt_timezone.utc), usegmt=True)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        self.cache_objects = page if page is not None else []
+        return page
+
+    def get_object(self):
+        obj = super().get_object()
+        self.cache_objects = [obj]
+        return obj
@@ -0,0 +1,53 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+
+from .ledger import check_stock
+from .models import SalesOrder, SalesOrderItem, StockMovement
+from .reservations import end_holds, held_quantities, mark_consumed
+from .rollups import record_sales_order
+from .signals import products_changed
+
+
+@transaction.atomic
+def place_sales_order(customer_name, items, reservation=None, **order_fields):
+    """
+    Create a sales order and take its stock by appending sale movements to the stock ledger, in a
+    fixed number of queries however many lines it has. Units the order's ``reservation`` holds
+    were set aside for it when the reservation was made, so they are taken without a check; only
+    quantities beyond them are checked under lock against the stock other clients' reservations
+    leave available. The reservation's holds end once the order has consumed it.
+    """
+    requested = defaultdict(int)
+    for item in items:
+        requested[item['product']] += item['quantity']
+    held = held_quantities(reservation) if reservation is not None else {}
+    check_stock({product.pk: held.get(product.pk, 0) - quantity for product, quantity in requested.items()},
+                respect_holds=True)
+
+    total_amount = sum((item['product'].price * item['quantity'] for item in items), Decimal('0.00'))
+    sales_order = SalesOrder.objects.create(customer_name=customer_name, total_amount=total_amount, **order_fields)
+    if reservation is not None:
+        mark_consumed(reservation, sales_order)
+    SalesOrderItem.objects.bulk_create([
+        SalesOrderItem(sales_order=sales_order, product=item['product'], quantity=item['quantity'],
+                       price=item['product'].price)
+        for item in items
+    ])
+    StockMovement.objects.bulk_create([
+        StockMovement(product=product, kind=StockMovement.Kind.SALE, quantity=-quantity, sales_order=sales_order)
+        for product, quantity in requested.items()
+    ])
+    if reservation is not None:
+        end_holds(reservation)
+    product_ids = [product.pk for product in requested]
+    products_changed.send(sender=SalesOrder, product_ids=product_ids)
+    lines = [(item['product'].pk, item['quantity'], item['product'].price) for item in items]
+
+    # Not a functools.partial: robust on_commit logs failures by the callback's __qualname__.
+    def update_rollups():
+        record_sales_order(sales_order, lines)
+
+    transaction.on_commit(update_rollups, robust=True)
+    return sales_order
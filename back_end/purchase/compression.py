@@ -0,0 +1,125 @@
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/x-ndjson', 'application/javascript',
+                      'application/xml', 'image/svg+xml')
+
+
+def offered_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def accepted_encoding(request):
+    """The offered coding with the highest q-value in Accept-Encoding, preferring Brotli on ties."""
+    weights = {}
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.strip().lower().partition(';')
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding.strip()] = weight
+    ranked = [(weights.get(coding, weights.get('*', 0.0)), coding) for coding in offered_encodings()]
+    weight, coding = max(ranked, key=lambda item: item[0])
+    return coding if weight > 0 else None
+
+
+def compressor(encoding):
+    """``(compress, finish)`` of a streaming compressor for ``encoding``."""
+    if encoding == 'br':
+        stream = brotli.Compressor(quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+        return stream.process, stream.finish
+    # wbits=31 writes a gzip header, with no file name or timestamp, so bodies are reproducible.
+    stream = zlib.compressobj(getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6), zlib.DEFLATED, 31)
+    return stream.compress, stream.flush
+
+
+def compress(encoding, content):
+    compress_chunk, finish = compressor(encoding)
+    return compress_chunk(content) + finish()
+
+
+def compress_stream(encoding, chunks):
+    compress_chunk, finish = compressor(encoding)
+    for chunk in chunks:
+        data = compress_chunk(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+async def acompress_stream(encoding, chunks):
+    compress_chunk, finish = compressor(encoding)
+    async for chunk in chunks:
+        data = compress_chunk(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware:
+    """
+    Compresses text and JSON responses of at least COMPRESSION_MIN_SIZE bytes with the best coding
+    the client accepts: Brotli when the Brotli package is installed, else gzip. Streaming responses,
+    such as exports, are compressed as they stream. Works in both the sync and the async handler chain.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def is_compressible(self, response):
+        if response.has_header('Content-Encoding') or response.status_code < 200 or response.status_code in (204, 304):
+            return False
+        content_type = response.get('Content-Type', '').partition(';')[0].strip().lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        return response.streaming or len(response.content) >= getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+
+    def process_response(self, request, response):
+        if not self.is_compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = accepted_encoding(request)
+        if encoding is None:
+            return response
+        if response.streaming:
+            stream = acompress_stream if response.is_async else compress_stream
+            response.streaming_content = stream(encoding, response.streaming_content)
+            del response['Content-Length']
+        else:
+            content = compress(encoding, response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+        # The encoded body differs byte for byte, so its validator is only weakly equal.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+        response['Content-Encoding'] = encoding
+        return response
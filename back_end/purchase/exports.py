@@ -0,0 +1,136 @@
+import csv
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+from rest_framework.decorators import action
+
+from .models import SalesOrderItem
+from .renderers import CSVRenderer, NDJSONRenderer
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def parse_bound(value, end_of_day=False):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise serializers.ValidationError({'date': [f"'{value}' is not a valid date or datetime."]})
+        parsed = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_value(value):
+    """``value`` as both export formats write it: ISO 8601 at full precision, and decimals as strings."""
+    if isinstance(value, datetime):
+        text = value.isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: export_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [export_value(item) for item in value]
+    return value
+
+
+def stream_csv(columns, records):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for record in records:
+        yield writer.writerow([export_value(record[column]) for column in columns])
+
+
+def stream_ndjson(records):
+    encoder = DjangoJSONEncoder()
+    for record in records:
+        yield encoder.encode(export_value(record)) + '\n'
+
+
+class ExportMixin:
+    """
+    Adds a streaming `export/` list action that honours the viewset's filter backends plus
+    `date_from`/`date_to` on `export_date_field`, and writes CSV or NDJSON row by row from a
+    chunked queryset iterator.
+    """
+    export_date_field = None
+    # Output column name -> ORM lookup.
+    export_fields = {}
+
+    def export_queryset(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        date_from = request.query_params.get('date_from')
+        date_to = request.query_params.get('date_to')
+        if date_from:
+            queryset = queryset.filter(**{f'{self.export_date_field}__gte': parse_bound(date_from)})
+        if date_to:
+            queryset = queryset.filter(**{f'{self.export_date_field}__lte': parse_bound(date_to, end_of_day=True)})
+        return queryset
+
+    def export_records(self, queryset):
+        fields = [name for name, lookup in self.export_fields.items() if name == lookup]
+        expressions = {name: F(lookup) for name, lookup in self.export_fields.items() if name != lookup}
+        return queryset.values(*fields, **expressions).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    def export_csv_columns(self):
+        return list(self.export_fields)
+
+    def export_csv_rows(self, records):
+        return records
+
+    @action(detail=False, methods=['get'], url_path='export', renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        records = self.export_records(self.export_queryset(request))
+        renderer = request.accepted_renderer
+        if renderer.format == 'csv':
+            body = stream_csv(self.export_csv_columns(), self.export_csv_rows(records))
+        else:
+            body = stream_ndjson(records)
+        response = StreamingHttpResponse(body, content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{self.basename}-export.{renderer.format}"'
+        return response
+
+
+class SalesOrderExportMixin(ExportMixin):
+    """Exports one record per order in NDJSON and one row per order line in CSV."""
+    export_date_field = 'order_date'
+    export_fields = {name: name for name in ['so_number', 'customer_name', 'order_date', 'total_amount']}
+    export_item_columns = ['product_code', 'product_name', 'quantity', 'price']
+
+    def export_records(self, queryset):
+        orders = queryset.prefetch_related(None).only('id', *self.export_fields) \
+            .prefetch_related(Prefetch('items', queryset=SalesOrderItem.objects.select_related('product')
+                                       .order_by('id').only('sales_order', 'quantity', 'price',
+                                                            'product__product_code', 'product__name')))
+        for order in orders.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            record = {name: getattr(order, name) for name in self.export_fields}
+            record['items'] = [
+                {'product_code': item.product.product_code, 'product_name': item.product.name,
+                 'quantity': item.quantity, 'price': item.price}
+                for item in order.items.all()
+            ]
+            yield record
+
+    def export_csv_columns(self):
+        return list(self.export_fields) + self.export_item_columns
+
+    def export_csv_rows(self, records):
+        empty_item = dict.fromkeys(self.export_item_columns, '')
+        for record in records:
+            for item in record['items'] or [empty_item]:
+                yield {**record, **item}
@@ -0,0 +1,195 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+FIELDSET_PARAMS = ('fields', 'omit', 'expand')
+
+
+def path_tree(paths):
+    """``['id', 'product.name', 'product.id']`` -> ``{'id': {}, 'product': {'name': {}, 'id': {}}}``."""
+    tree = {}
+    for path in paths:
+        node = tree
+        for name in path.split('.'):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def freeze(tree):
+    return tuple(sorted((name, freeze(child)) for name, child in tree.items()))
+
+
+class Fieldset:
+    """
+    The ``fields``, ``omit`` and ``expand`` query parameters of a read request, as trees of field
+    names. Dotted names reach into nested serializers: ``fields=id,product.name`` keeps the id and
+    the product's name, ``omit=items`` drops the order lines and ``expand=product`` swaps a related
+    field for the serializer named in the serializer's ``Meta.expandable_fields``.
+    """
+
+    def __init__(self, fields=None, omit=None, expand=None):
+        self.fields = fields
+        self.omit = omit or {}
+        self.expand = expand or {}
+        self.key = (freeze(fields) if fields is not None else None, freeze(self.omit), freeze(self.expand))
+
+    @classmethod
+    def from_query_params(cls, params):
+        values = {name: [part.strip() for value in params.getlist(name) for part in value.split(',') if part.strip()]
+                  for name in FIELDSET_PARAMS}
+        if not any(values.values()):
+            return None
+        return cls(path_tree(values['fields']) if values['fields'] else None,
+                   path_tree(values['omit']), path_tree(values['expand']))
+
+    def includes(self, name):
+        if self.fields is not None and name not in self.fields:
+            return False
+        return self.omit.get(name) != {}
+
+    def expands(self, name):
+        return name in self.expand
+
+    def child(self, name):
+        """The fieldset of the nested serializer under ``name``, or None when it is unrestricted."""
+        fields = self.fields.get(name) or None if self.fields is not None else None
+        fieldset = Fieldset(fields, self.omit.get(name), self.expand.get(name))
+        return fieldset if fieldset.fields is not None or fieldset.omit or fieldset.expand else None
+
+
+class FieldsetSerializerMixin:
+    """
+    Serializer fields filtered by the ``fieldset`` in the serializer context. Nested serializers
+    read the part of the root's fieldset under their own field name.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.get_fieldset()
+        if fieldset is None:
+            return fields
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name in list(fields):
+            if not fieldset.includes(name):
+                del fields[name]
+            elif fieldset.expands(name) and name in expandable:
+                serializer_class, kwargs = expandable[name]
+                fields[name] = serializer_class(**kwargs)
+        return fields
+
+    def get_fieldset(self):
+        path, node = [], self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        fieldset = self.context.get('fieldset')
+        for name in reversed(path):
+            if fieldset is None:
+                break
+            fieldset = fieldset.child(name)
+        return fieldset
+
+
+def view_columns(view):
+    """Columns a list view reads from its rows besides the serializer's: ordering and Last-Modified."""
+    ordering = list(view.ordering or []) + list(getattr(view, 'ordering_fields', None) or [])
+    columns = [field.lstrip('-') for field in ordering if field.lstrip('-') not in ('pk', '?')]
+    last_modified = getattr(view, 'last_modified_field', None)
+    return columns + [last_modified] if last_modified else columns
+
+
+def source_path(model, attrs):
+    """The ORM path of a dotted source through forward relations, or None if it isn't one."""
+    path = []
+    for attr in attrs:
+        try:
+            field = model._meta.get_field(attr) if model is not None else None
+        except FieldDoesNotExist:
+            return None
+        if field is None or field.many_to_many or field.one_to_many:
+            return None
+        path.append(attr)
+        model = field.related_model
+    return path
+
+
+def field_plan(serializer, prefix='', annotations=()):
+    """
+    ``(only, select_related, prefetches)`` loading what ``serializer`` reads and nothing else.
+    ``only`` is None when a field reads something other than model fields, such as a property.
+    """
+    model = serializer.Meta.model
+    only, related, prefetches = [], [], []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            child = field.child
+            link = model._meta.get_field(field.source).field.name
+            child_only, child_related, child_prefetches = field_plan(child)
+            queryset = child.Meta.model.objects.select_related(*child_related).prefetch_related(*child_prefetches)
+            if child_only is not None:
+                queryset = queryset.only(link, *child_only)
+            prefetches.append(Prefetch(prefix + field.source, queryset=queryset))
+        elif isinstance(field, serializers.BaseSerializer):
+            nested_prefix = prefix
+            if field.source != '*':
+                related.append(prefix + field.source)
+                nested_prefix = f'{prefix}{field.source}__'
+            nested_only, nested_related, nested_prefetches = field_plan(field, nested_prefix, annotations)
+            only = None if only is None or nested_only is None else only + nested_only
+            related += nested_related
+            prefetches += nested_prefetches
+        else:
+            path = source_path(model, field.source_attrs)
+            if path is None:
+                # Annotations are selected whatever ``only`` lists; anything else may need any column.
+                if not (prefix == '' and field.source in annotations):
+                    only = None
+                continue
+            if len(path) > 1:
+                related.append(prefix + '__'.join(path[:-1]))
+            if only is not None:
+                # Fields such as ImageSrcsetField also read fields next to their source.
+                siblings = [prefix + '__'.join([*path[:-1], name]) for name in getattr(field, 'sibling_fields', ())]
+                only += [prefix + '__'.join(path), *siblings]
+    return only, list(dict.fromkeys(related)), prefetches
+
+
+class FieldsetMixin:
+    """
+    Applies the ``fields``, ``omit`` and ``expand`` query parameters to the list and retrieve
+    actions: the serializer drops or expands fields, and the queryset loads only the columns and
+    relations the remaining fields read.
+    """
+    fieldset_actions = ('list', 'retrieve')
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = None
+            if getattr(self, 'action', None) in self.fieldset_actions:
+                self._fieldset = Fieldset.from_query_params(self.request.query_params)
+        return self._fieldset
+
+    def requests_field(self, name):
+        fieldset = self.get_fieldset()
+        return fieldset is None or fieldset.includes(name)
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'fieldset': self.get_fieldset()}
+
+    def filter_queryset(self, queryset):
+        # Planned here rather than in get_queryset so annotations added by the view are known.
+        queryset = super().filter_queryset(queryset)
+        if self.get_fieldset() is None:
+            return queryset
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        only, related, prefetches = field_plan(serializer, annotations=queryset.query.annotations)
+        queryset = queryset.select_related(None).prefetch_related(None)
+        queryset = queryset.select_related(*related).prefetch_related(*prefetches)
+        if only is None:
+            return queryset
+        # Annotations are selected anyway, and only() takes model fields alone.
+        return queryset.only(*only, *(column for column in view_columns(self)
+                                      if column not in queryset.query.annotations))
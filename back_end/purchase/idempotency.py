@@ -0,0 +1,131 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from .instrumentation import extend_query_budget
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+# Queries a keyed request runs on top of the action's own: claiming or taking over the key, the
+# savepoints around the claim and the work, and storing the response.
+KEY_QUERIES = 9
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed; retry shortly.'
+    default_code = 'idempotency_key_in_use'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+def key_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', timedelta(hours=24))
+
+
+def lock_timeout():
+    return getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', timedelta(seconds=60))
+
+
+def fingerprint(request):
+    """Hash of the method, path and parsed body, so reformatted retries of a request still match."""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def claim(user, key, digest):
+    """
+    Take the key for a new request and return its row, or return the finished row of an earlier
+    request with the same key. The claim is committed on its own so concurrent retries see it.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key, fingerprint=digest,
+                                                 locked_until=now + lock_timeout(), expires_at=now + key_ttl())
+    except IntegrityError:
+        pass
+    entry = IdempotencyKey.objects.get(user=user, key=key)
+    if entry.expires_at <= now or (entry.status_code is None and entry.locked_until <= now):
+        # An expired key, or one whose request died without finishing: take it over, unless
+        # another retry got there first.
+        current = IdempotencyKey.objects.filter(pk=entry.pk, locked_until=entry.locked_until,
+                                                expires_at=entry.expires_at)
+        taken = current.update(fingerprint=digest, status_code=None, response=None,
+                               locked_until=now + lock_timeout(), expires_at=now + key_ttl())
+        if taken:
+            entry.fingerprint, entry.status_code, entry.response = digest, None, None
+            return entry
+        entry.refresh_from_db()
+    if entry.fingerprint != digest:
+        raise IdempotencyKeyReused()
+    if entry.status_code is None:
+        raise IdempotencyKeyInUse()
+    return entry
+
+
+def run_idempotent(request, key, handler):
+    extend_query_budget(KEY_QUERIES)
+    entry = claim(request.user, key, fingerprint(request))
+    if entry.status_code is not None:
+        return Response(entry.response, status=entry.status_code, headers={REPLAYED_HEADER: 'true'})
+    try:
+        # The response is stored in the transaction that does the work, so a committed request
+        # always leaves its response behind for retries.
+        with transaction.atomic():
+            response = handler()
+            if response.status_code < 500:
+                IdempotencyKey.objects.filter(pk=entry.pk).update(status_code=response.status_code,
+                                                                  response=response.data)
+                return response
+    except BaseException:
+        IdempotencyKey.objects.filter(pk=entry.pk, status_code=None).delete()
+        raise
+    IdempotencyKey.objects.filter(pk=entry.pk, status_code=None).delete()
+    return response
+
+
+def idempotent(view_method):
+    """
+    Make a DRF action safe to retry: requests carrying an ``Idempotency-Key`` header run once per
+    key and user, and retries get the stored response back instead of redoing the work. A retry
+    that arrives while the first request is still running gets 409, one with a different body 422.
+    Responses with a server error status are not stored, so those requests can be retried.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view_method(self, request, *args, **kwargs)
+        if not key or len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            raise serializers.ValidationError({HEADER: ['Must be between 1 and 255 characters.']})
+        return run_idempotent(request, key, lambda: view_method(self, request, *args, **kwargs))
+    return wrapper
+
+
+def purge_expired_keys(batch_size=1000):
+    """Delete expired keys in batches and return how many were removed."""
+    deleted = 0
+    while True:
+        expired = IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+        ids = list(expired.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,133 @@
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import ExifTags, Image, ImageOps
+
+from .jobs import enqueue
+
+# Preset name -> longest edge in pixels.
+RENDITION_PRESETS = {
+    'thumb': 64,
+    'small': 320,
+    'medium': 800,
+}
+# URL format -> (Pillow format, content type, save options).
+RENDITION_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+RENDITION_ROOT = 'renditions'
+SOURCE_PREFIX = 'products/'
+
+def is_valid_source(name):
+    return name.startswith(SOURCE_PREFIX) and '..' not in name.split('/') and not name.startswith('/')
+
+
+def rendition_name(source_name, preset, fmt):
+    stem = posixpath.splitext(source_name)[0]
+    return f'{RENDITION_ROOT}/{preset}/{stem}.{fmt}'
+
+
+def image_size(image):
+    """
+    Width and height of ``image`` (a file or file field) as displayed, with its EXIF orientation
+    applied, or None if it cannot be read. Only the header is read.
+    """
+    try:
+        with Image.open(image) as source:
+            width, height = source.size
+            # Orientations 5 to 8 are rotated a quarter turn.
+            if source.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+                width, height = height, width
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    finally:
+        image.seek(0)
+    return width, height
+
+
+def rendition_size(width, height, preset):
+    """Size of the ``preset`` rendition of a ``width`` x ``height`` image; smaller images are not enlarged."""
+    edge = RENDITION_PRESETS[preset]
+    if width <= edge and height <= edge:
+        return width, height
+    scale = edge / max(width, height)
+    return max(round(width * scale), 1), max(round(height * scale), 1)
+
+
+def render(source, preset, fmt):
+    pil_format, _, options = RENDITION_FORMATS[fmt]
+    image = ImageOps.exif_transpose(source)
+    size = rendition_size(*image.size, preset)
+    if size != image.size:
+        image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def save_rendition(name, content):
+    saved = default_storage.save(name, ContentFile(content))
+    if saved != name:
+        # Another worker produced the same rendition first; keep theirs.
+        default_storage.delete(saved)
+
+
+def ensure_rendition(source_name, preset, fmt):
+    """Return the storage name of a rendition, generating and caching it on first use."""
+    name = rendition_name(source_name, preset, fmt)
+    if not default_storage.exists(name):
+        with default_storage.open(source_name) as handle, Image.open(handle) as source:
+            save_rendition(name, render(source, preset, fmt))
+    return name
+
+
+def generate_renditions(source_name):
+    missing = [(preset, fmt) for preset in RENDITION_PRESETS for fmt in RENDITION_FORMATS
+               if not default_storage.exists(rendition_name(source_name, preset, fmt))]
+    if not missing:
+        return
+    with default_storage.open(source_name) as handle, Image.open(handle) as source:
+        source.load()
+        for preset, fmt in missing:
+            save_rendition(rendition_name(source_name, preset, fmt), render(source, preset, fmt))
+
+
+def schedule_renditions(image):
+    """Queue generating every rendition of a freshly uploaded image, to run once the upload commits."""
+    if not image or not getattr(settings, 'IMAGE_RENDITIONS_EAGER', True):
+        return
+    enqueue('images.generate_renditions', {'name': image.name})
+
+
+def rendition_url(source_name, preset, fmt, request=None):
+    url = reverse('image-rendition', kwargs={'preset': preset, 'fmt': fmt, 'name': source_name})
+    return request.build_absolute_uri(url) if request else url
+
+
+def srcset(image, request=None, width=None, height=None):
+    """
+    Map each format to an HTML ``srcset`` string giving the real width of each rendition of
+    ``image`` (a storage name or file), whose displayed size is ``width`` x ``height``. Presets
+    that come out no wider than a smaller one, as for sources smaller than the preset, are left
+    out. Without the size no widths can be given, and there is no srcset.
+    """
+    if not image or not width or not height:
+        return None
+    name = getattr(image, 'name', image)
+    widths = {}
+    for preset in RENDITION_PRESETS:
+        widths.setdefault(rendition_size(width, height, preset)[0], preset)
+    return {
+        fmt: ', '.join(f'{rendition_url(name, preset, fmt, request)} {rendition_width}w'
+                       for rendition_width, preset in widths.items())
+        for fmt in RENDITION_FORMATS
+    }
@@ -0,0 +1,220 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Q
+from rest_framework import serializers
+
+from .models import Product, PurchaseOrder
+from .search import index_products
+from .sequences import allocator, format_document_number, lock_sequence, parse_document_number
+from .signals import products_changed
+from .serializers import ProductImportSerializer, PurchaseOrderImportSerializer
+
+FORMATS = ('csv', 'ndjson')
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+def guess_format(filename, default='csv'):
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def iter_records(stream, fmt):
+    """Yield ``(line_number, record)`` pairs from a binary CSV or NDJSON stream without reading it all."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported import format '{fmt}'. Use one of: {', '.join(FORMATS)}.")
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    line_number = 0
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(text)
+            for record in reader:
+                line_number = reader.line_num
+                yield line_number, {key: value for key, value in record.items() if key}
+        else:
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except (ValueError, RecursionError) as exc:
+                    record = exc
+                yield line_number, record
+    except (UnicodeDecodeError, csv.Error) as exc:
+        # The rest of the file can't be read past this point; report it on the line it broke at.
+        yield line_number + 1, exc
+    finally:
+        # Hand the stream back to its owner instead of closing it with the wrapper.
+        text.detach()
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+class BaseImporter:
+    serializer_class = None
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.report = ImportReport()
+
+    def validate(self, rows):
+        serializer = self.serializer_class()
+        valid = []
+        for line, record in rows:
+            if isinstance(record, Exception):
+                self.report.add_error(line, {'non_field_errors': [f'Invalid record: {record}']})
+                continue
+            if not isinstance(record, dict):
+                self.report.add_error(line, {'non_field_errors': [
+                    f'Invalid record: expected an object, got {type(record).__name__}.']})
+                continue
+            try:
+                valid.append((line, serializer.run_validation(record)))
+            except serializers.ValidationError as exc:
+                self.report.add_error(line, exc.detail)
+        return valid
+
+    def run(self, stream, fmt):
+        for rows in chunked(iter_records(stream, fmt), self.chunk_size):
+            valid = self.validate(rows)
+            if valid:
+                with transaction.atomic():
+                    self.import_chunk(valid)
+        return self.report.as_dict()
+
+    def import_chunk(self, rows):
+        raise NotImplementedError
+
+
+class ProductImporter(BaseImporter):
+    """Upserts products by ``product_code``, or by ``name`` for rows without a code."""
+    serializer_class = ProductImportSerializer
+
+    def import_chunk(self, rows):
+        codes = {data['product_code'] for _, data in rows if data.get('product_code')}
+        names = {data['name'] for _, data in rows}
+        existing = Product.objects.filter(Q(product_code__in=codes) | Q(name__in=names)) \
+            .values_list('product_code', 'name')
+        code_by_name = {name: code for code, name in existing}
+        existing_codes = set(code_by_name.values())
+
+        # Later rows win when a chunk repeats a product.
+        products, lines = {}, {}
+        for line, data in rows:
+            owner = code_by_name.get(data['name'])
+            key = data.get('product_code') or owner or ('new', data['name'])
+            if owner and owner != key:
+                self.report.add_error(line, {'name': [f"Name is already used by product {owner}."]})
+                continue
+            code_by_name[data['name']] = key
+            products[key] = data
+            lines[key] = line
+
+        self.claim_product_codes(products, lines, existing_codes)
+        new_keys = [key for key in products if isinstance(key, tuple)]
+        for key, number in zip(new_keys, allocator.reserve('PROD', len(new_keys))):
+            products[format_document_number('PROD', number)] = products.pop(key)
+
+        objs = [Product(product_code=code, name=data['name'], description=data.get('description'),
+                        price=data['price']) for code, data in products.items()]
+        options = {}
+        if connection.features.supports_update_conflicts_with_target:
+            options['unique_fields'] = ['product_code']
+        Product.objects.bulk_create(objs, update_conflicts=True, update_fields=['name', 'description', 'price',
+                                                                                'updated_at'], **options)
+        imported = list(Product.objects.filter(product_code__in=products)
+                        .only('id', 'product_code', 'name', 'description'))
+        index_products(imported)
+        products_changed.send(sender=Product, product_ids=[product.pk for product in imported])
+        updated = sum(1 for code in products if code in existing_codes)
+        self.report.updated += updated
+        self.report.created += len(products) - updated
+
+    def claim_product_codes(self, products, lines, existing_codes):
+        """
+        Move the PROD sequence past new products whose code is in its format, so it never issues
+        those codes again. Codes it may already have handed out are rejected instead.
+        """
+        numbers = {code: parse_document_number('PROD', code) for code in products
+                   if not isinstance(code, tuple) and code not in existing_codes}
+        numbers = {code: number for code, number in numbers.items() if number is not None}
+        if not numbers:
+            return
+        sequence = lock_sequence('PROD')
+        for code, number in numbers.items():
+            if number <= sequence.last_value:
+                self.report.add_error(lines[code], {'product_code': [
+                    f"{code} is reserved for products created without a code; leave product_code empty."]})
+                del products[code]
+        highest = max(numbers.values())
+        if highest > sequence.last_value:
+            sequence.last_value = highest
+            sequence.save(update_fields=['last_value', 'updated_at'])
+
+
+class PurchaseOrderImporter(BaseImporter):
+    """Creates purchase orders in batches; rows reference products by ``product_id`` or ``product_code``."""
+    serializer_class = PurchaseOrderImportSerializer
+
+    def import_chunk(self, rows):
+        ids = {data['product_id'] for _, data in rows if data.get('product_id')}
+        codes = {data['product_code'] for _, data in rows if data.get('product_code')}
+        products = Product.objects.filter(Q(pk__in=ids) | Q(product_code__in=codes)).values_list('pk', 'product_code')
+        product_ids = set()
+        product_id_by_code = {}
+        for pk, code in products:
+            product_ids.add(pk)
+            product_id_by_code[code] = pk
+
+        orders = []
+        for line, data in rows:
+            product_id = data.get('product_id') or product_id_by_code.get(data.get('product_code'))
+            if product_id not in product_ids:
+                self.report.add_error(line, {'product': ['Product does not exist.']})
+                continue
+            orders.append(PurchaseOrder(product_id=product_id, supplier=data.get('supplier', 'Default Supplier'),
+                                        quantity=data['quantity'], unit_price=data['unit_price']))
+
+        for order, number in zip(orders, allocator.reserve('PO', len(orders))):
+            order.po_number = format_document_number('PO', number)
+        PurchaseOrder.objects.bulk_create(orders)
+        self.report.created += len(orders)
+
+
+IMPORTERS = {
+    'products': ProductImporter,
+    'purchase-orders': PurchaseOrderImporter,
+}
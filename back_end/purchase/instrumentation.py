@@ -0,0 +1,280 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework import mixins, status, viewsets
+from rest_framework.response import Response
+
+# Upper bounds of the histogram buckets; the last bucket is unbounded.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_current = ContextVar('purchase_request_metrics', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.total_time = 0.0
+        # Queries the request may run beyond its view's budget, granted with extend_query_budget().
+        self.extra_queries = 0
+        # Async views run a request's queries on several threads at once.
+        self._lock = threading.Lock()
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.db_time += elapsed
+                self.queries += 1
+
+    def finish(self):
+        self.total_time = time.perf_counter() - self.started
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+
+def count_current_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.record_query(execute, sql, params, many, context)
+
+
+def install_query_counter(sender=None, connection=None, **kwargs):
+    """
+    ``connection_created`` receiver counting every query towards the request being served. The
+    request's metrics live in a context variable, which follows it into the threads sync views and
+    ``sync_to_async`` calls run on, so queries are counted on whichever connection runs them.
+    """
+    if count_current_query not in connection.execute_wrappers:
+        # First, so the pop() of an execute_wrapper() block active right now removes its own wrapper.
+        connection.execute_wrappers.insert(0, count_current_query)
+
+
+@contextmanager
+def timed_serialization():
+    metrics = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.serialize_time += time.perf_counter() - started
+
+
+def extend_query_budget(queries):
+    """Let the current request run ``queries`` more than its view's budget."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.extra_queries += queries
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.total += value
+
+    def as_dict(self):
+        # Cumulative counts per upper bound, as in the Prometheus exposition format.
+        cumulative = []
+        running = 0
+        for count in self.counts:
+            running += count
+            cumulative.append(running)
+        buckets = {str(bound): count for bound, count in zip(self.buckets, cumulative)}
+        buckets['+Inf'] = cumulative[-1]
+        return {'buckets': buckets, 'count': cumulative[-1], 'sum': round(self.total, 3)}
+
+
+class MetricsRegistry:
+    """Per-process histograms of request latency, DB time, serializer time and query count per view."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, metrics, status_code):
+        with self._lock:
+            entry = self._views.get(view)
+            if entry is None:
+                entry = self._views[view] = {
+                    'responses': {},
+                    'latency_ms': Histogram(LATENCY_BUCKETS_MS),
+                    'db_ms': Histogram(LATENCY_BUCKETS_MS),
+                    'serialize_ms': Histogram(LATENCY_BUCKETS_MS),
+                    'queries': Histogram(QUERY_BUCKETS),
+                }
+            status_class = f'{status_code // 100}xx'
+            entry['responses'][status_class] = entry['responses'].get(status_class, 0) + 1
+            entry['latency_ms'].observe(metrics.total_time * 1000)
+            entry['db_ms'].observe(metrics.db_time * 1000)
+            entry['serialize_ms'].observe(metrics.serialize_time * 1000)
+            entry['queries'].observe(metrics.queries)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                view: {name: value.as_dict() if isinstance(value, Histogram) else dict(value)
+                       for name, value in entry.items()}
+                for view, entry in sorted(self._views.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = MetricsRegistry()
+
+
+def query_budget(**budgets):
+    """Class decorator giving viewset actions a maximum number of queries per request."""
+    def decorate(view_class):
+        view_class.query_budgets = {**getattr(view_class, 'query_budgets', {}), **budgets}
+        return view_class
+    return decorate
+
+
+def resolve_view(request):
+    """Return ``(label, view class, action)`` for requests served by this app's views, else None."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    view_class = getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None)
+    target = view_class or match.func
+    if not target.__module__.startswith('purchase.'):
+        return None
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    label = f'{target.__name__}.{action}' if view_class else target.__name__
+    return label, view_class, action
+
+
+class InstrumentationMiddleware:
+    """
+    Records query count, DB time, serializer time and total latency for every request served by
+    the purchase API, reports them in a ``Server-Timing`` header and in the metrics registry, and
+    checks the view's query budget. Works in both the sync and the async handler chain.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.process_metrics(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.process_metrics(request, response, metrics)
+
+    def process_metrics(self, request, response, metrics):
+        metrics.finish()
+
+        view = resolve_view(request)
+        if view is None:
+            return response
+        label, view_class, action = view
+        registry.observe(label, metrics, response.status_code)
+        if getattr(settings, 'SERVER_TIMING_ENABLED', True):
+            response['Server-Timing'] = metrics.server_timing()
+        response.request_metrics = metrics
+
+        budget = getattr(view_class, 'query_budgets', {}).get(action)
+        if budget is not None:
+            budget += metrics.extra_queries
+        if budget is not None and metrics.queries > budget and getattr(settings, 'QUERY_BUDGETS_ENFORCED', False):
+            raise QueryBudgetExceeded(f'{label} ran {metrics.queries} queries, over its budget of {budget}.')
+        return response
+
+
+def serialized(serializer):
+    """``serializer.data``, counted as serializer time."""
+    with timed_serialization():
+        return serializer.data
+
+
+class TimedListModelMixin(mixins.ListModelMixin):
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialized(self.get_serializer(page, many=True)))
+        return Response(serialized(self.get_serializer(queryset, many=True)))
+
+
+class TimedRetrieveModelMixin(mixins.RetrieveModelMixin):
+    def retrieve(self, request, *args, **kwargs):
+        return Response(serialized(self.get_serializer(self.get_object())))
+
+
+class TimedCreateModelMixin(mixins.CreateModelMixin):
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        data = serialized(serializer)
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
+
+
+class TimedUpdateModelMixin(mixins.UpdateModelMixin):
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        if getattr(instance, '_prefetched_objects_cache', None):
+            # Prefetched relations may have changed with the update, as in DRF's own update().
+            instance._prefetched_objects_cache = {}
+        return Response(serialized(serializer))
+
+
+class TimedReadOnlyModelViewSet(TimedRetrieveModelMixin, TimedListModelMixin, viewsets.GenericViewSet):
+    """ReadOnlyModelViewSet whose actions count the time spent in ``serializer.data`` as serializer time."""
+
+
+class TimedModelViewSet(TimedCreateModelMixin, TimedRetrieveModelMixin, TimedUpdateModelMixin,
+                        mixins.DestroyModelMixin, TimedListModelMixin, viewsets.GenericViewSet):
+    """ModelViewSet whose actions count the time spent in ``serializer.data`` as serializer time."""
@@ -0,0 +1,183 @@
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Task name -> (function, max attempts).
+TASKS = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a task whose failure a retry cannot fix; the job fails without further attempts."""
+
+
+def task(name, max_attempts=None):
+    """Register a function as a job task. It is called with the job's payload as keyword arguments."""
+    def register(func):
+        TASKS[name] = (func, max_attempts)
+        return func
+    return register
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(task_name, payload=None, created_by=None, run_after=None):
+    """
+    Queue ``task_name`` with ``payload`` (a JSON object). The job is written in the current
+    transaction, so work queued by a request that rolls back never runs.
+    """
+    if task_name not in TASKS:
+        raise ValueError(f"Unknown job task '{task_name}'.")
+    max_attempts = TASKS[task_name][1] or setting('JOB_MAX_ATTEMPTS', 5)
+    return Job.objects.create(task=task_name, payload=payload or {}, max_attempts=max_attempts,
+                              created_by=created_by, run_after=run_after or timezone.now())
+
+
+def prefers_async(request):
+    """Whether the request asked to be answered before its work is done, with ``Prefer: respond-async``."""
+    preferences = request.headers.get('Prefer', '')
+    return any(part.split(';')[0].strip().lower() == 'respond-async' for part in preferences.split(','))
+
+
+def retry_delay(attempts):
+    """Exponential backoff after the ``attempts``-th failed attempt, capped at JOB_RETRY_BACKOFF_MAX."""
+    delay = setting('JOB_RETRY_BACKOFF', timedelta(seconds=10)) * 2 ** (attempts - 1)
+    return min(delay, setting('JOB_RETRY_BACKOFF_MAX', timedelta(hours=1)))
+
+
+def lease():
+    return setting('JOB_LEASE', timedelta(minutes=5))
+
+
+def recover_stale_jobs():
+    """Requeue jobs whose worker stopped renewing its lease, or fail them when out of attempts."""
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.Status.RUNNING, locked_until__lt=now)
+    released = {'locked_by': '', 'locked_until': None, 'error': 'The worker running this job stopped.'}
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(status=Job.Status.FAILED, finished_at=now,
+                                                                 **released)
+    return failed + stale.update(status=Job.Status.QUEUED, run_after=now, **released)
+
+
+def claim_jobs(worker, limit):
+    """Mark up to ``limit`` due jobs as run by ``worker`` and return their ids, oldest first."""
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.Status.QUEUED, run_after__lte=now).order_by('run_after', 'id')
+    claimed = {'status': Job.Status.RUNNING, 'locked_by': worker, 'locked_until': now + lease(), 'started_at': now,
+               'attempts': F('attempts') + 1}
+    database = router.db_for_write(Job)
+    with transaction.atomic(using=database):
+        if connections[database].features.has_select_for_update_skip_locked:
+            # Concurrent workers skip each other's rows instead of waiting on them.
+            ids = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=ids).update(**claimed)
+        else:
+            # Without SKIP LOCKED (SQLite), each job is claimed by a conditional update, which
+            # matches nothing when another worker claimed the job first.
+            ids = [pk for pk in due.values_list('pk', flat=True)[:limit]
+                   if Job.objects.filter(pk=pk, status=Job.Status.QUEUED).update(**claimed)]
+    return ids
+
+
+def renew_leases(worker, ids):
+    if ids:
+        Job.objects.filter(pk__in=ids, locked_by=worker, status=Job.Status.RUNNING) \
+            .update(locked_until=timezone.now() + lease())
+
+
+def run_job(job, worker):
+    """Run a claimed job and record its result, or queue its retry."""
+    owned = Job.objects.filter(pk=job.pk, locked_by=worker, status=Job.Status.RUNNING)
+    released = {'locked_by': '', 'locked_until': None}
+    try:
+        if job.task not in TASKS:
+            raise PermanentJobError(f"Unknown job task '{job.task}'.")
+        result = TASKS[job.task][0](**job.payload)
+    except Exception as exc:
+        logger.exception('Job %s (%s) failed on attempt %s', job.pk, job.task, job.attempts)
+        error = ''.join(traceback.format_exception_only(exc)).strip()
+        now = timezone.now()
+        if isinstance(exc, PermanentJobError) or job.attempts >= job.max_attempts:
+            owned.update(status=Job.Status.FAILED, error=error, finished_at=now, **released)
+        else:
+            owned.update(status=Job.Status.QUEUED, error=error, run_after=now + retry_delay(job.attempts),
+                         **released)
+        return False
+    owned.update(status=Job.Status.SUCCEEDED, result=result, error='', finished_at=timezone.now(), **released)
+    return True
+
+
+def execute(job_id, worker):
+    """Pool entry point: run one claimed job on this thread's or process's own connection."""
+    close_old_connections()
+    try:
+        job = Job.objects.filter(pk=job_id, locked_by=worker, status=Job.Status.RUNNING).first()
+        return run_job(job, worker) if job is not None else False
+    finally:
+        close_old_connections()
+
+
+class Worker:
+    """
+    Claims due jobs and runs them on a pool of JOB_WORKER_CONCURRENCY threads, or processes with
+    ``mode='process'`` for CPU-bound tasks, renewing the lease of running jobs as it polls.
+    """
+
+    def __init__(self, concurrency=None, mode=None, poll_interval=None, name=None):
+        self.concurrency = concurrency or setting('JOB_WORKER_CONCURRENCY', 4)
+        self.mode = mode or setting('JOB_WORKER_MODE', 'thread')
+        self.poll_interval = poll_interval if poll_interval is not None else setting('JOB_POLL_INTERVAL', 1.0)
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+
+    def make_pool(self):
+        if self.mode == 'process':
+            # Spawned processes start from a clean interpreter with no inherited connections.
+            return ProcessPoolExecutor(self.concurrency, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=django.setup)
+        return ThreadPoolExecutor(self.concurrency, thread_name_prefix='jobs')
+
+    def stop(self):
+        """Stop claiming jobs; ``run`` returns once the running ones finish."""
+        self.stopping.set()
+
+    def run(self, once=False):
+        """Run jobs until stopped, or with ``once`` until none are due. Returns how many jobs ran."""
+        running, finished = {}, 0
+        with self.make_pool() as pool:
+            while True:
+                close_old_connections()
+                recover_stale_jobs()
+                renew_leases(self.name, list(running.values()))
+                free = self.concurrency - len(running)
+                if free and not self.stopping.is_set():
+                    for job_id in claim_jobs(self.name, free):
+                        running[pool.submit(execute, job_id, self.name)] = job_id
+                if not running:
+                    if once or self.stopping.is_set():
+                        return finished
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    finished += 1
+                    if future.exception() is not None:
+                        # The job stays claimed and is requeued once its lease runs out.
+                        logger.error('Job %s could not be run', job_id, exc_info=future.exception())
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from purchase.importers import IMPORTERS, FORMATS, DEFAULT_CHUNK_SIZE, guess_format
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or NDJSON file of products or purchase orders into the database in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        try:
+            with open(options['path'], 'rb') as stream:
+                report = IMPORTERS[options['kind']](chunk_size=options['chunk_size']).run(stream, fmt)
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        for error in report['errors']:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']}, updated {report['updated']}, {report['error_count']} row(s) rejected."
+        ))
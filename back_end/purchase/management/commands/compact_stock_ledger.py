@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from purchase.ledger import compact_ledger
+
+
+class Command(BaseCommand):
+    help = 'Snapshot product stock from the stock ledger so stock-as-of queries only replay recent movements.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of products snapshotted per transaction.')
+
+    def handle(self, *args, **options):
+        created = compact_ledger(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {created} stock snapshot(s).'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from purchase.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key responses whose retry window has passed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of keys deleted per statement.')
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency key(s).'))
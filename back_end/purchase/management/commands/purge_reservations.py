@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from purchase.reservations import purge_reservations
+
+
+class Command(BaseCommand):
+    help = 'Delete stock reservations, and their holds, that expired more than --days ago.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Days to keep ended reservations for.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of reservations deleted per statement.')
+
+    def handle(self, *args, **options):
+        deleted = purge_reservations(timedelta(days=options['days']), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} reservation(s).'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from purchase.models import SalesOrder
+
+
+class Command(BaseCommand):
+    help = 'Check the stored SalesOrder.total_amount column against the order lines and rebuild it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report orders whose total has drifted.')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of orders recomputed per transaction.')
+
+    def handle(self, *args, **options):
+        drifted = SalesOrder.objects.total_drift().values_list('so_number', 'total_amount', 'items_total')
+        drift_count = 0
+        for so_number, total_amount, items_total in drifted.iterator(chunk_size=2000):
+            drift_count += 1
+            self.stdout.write(f'{so_number}: stored {total_amount}, items {items_total}')
+
+        if options['check']:
+            if drift_count:
+                raise CommandError(f'{drift_count} sales order(s) have out of sync totals.')
+            self.stdout.write(self.style.SUCCESS('Order totals are in sync.'))
+            return
+
+        # Walk the table in primary key batches so a large rebuild never holds one long transaction.
+        batch_size = options['batch_size']
+        last_id = 0
+        updated = 0
+        while True:
+            ids = list(SalesOrder.objects.filter(id__gt=last_id).order_by('id')
+                       .values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                updated += SalesOrder.objects.filter(id__in=ids).sync_totals()
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt totals for {updated} order(s), {drift_count} corrected.'))
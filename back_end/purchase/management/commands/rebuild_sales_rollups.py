@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from purchase.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollup tables behind the reporting API from the sales orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-days', type=int, default=31, help='Number of days recomputed per transaction.')
+
+    def handle(self, *args, **options):
+        days = rebuild_rollups(batch_days=options['batch_days'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sales rollups for {days} day(s).'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from purchase.search import rebuild_search_index, search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search token table from the catalog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if search_backend() != 'tokens':
+            self.stdout.write('Product search uses the database FULLTEXT index; nothing to rebuild.')
+            return
+        indexed = rebuild_search_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} product(s).'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from purchase.ledger import compact_ledger
+from purchase.models import Product, StockSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Check stock read from the ledger snapshots against a full replay of the movements and rebuild it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report products whose stock has drifted.')
+
+    def handle(self, *args, **options):
+        drifted = list(Product.objects.stock_drift().values_list('pk', 'product_code', 'stock', 'replayed_stock'))
+        for pk, product_code, stock, replayed_stock in drifted:
+            self.stdout.write(f'{product_code}: snapshot {stock}, ledger {replayed_stock}')
+
+        if options['check']:
+            if drifted:
+                raise CommandError(f'{len(drifted)} product(s) have out of sync stock.')
+            self.stdout.write(self.style.SUCCESS('Stock is in sync.'))
+            return
+
+        # Snapshots that missed movements are dropped and taken again from the movements.
+        with transaction.atomic():
+            StockSnapshot.objects.filter(product__in=[pk for pk, *_ in drifted]).delete()
+        created = compact_ledger()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {created} stock snapshot(s), {len(drifted)} product(s) corrected.'))
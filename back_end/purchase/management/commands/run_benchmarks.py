@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from purchase.benchmarks.runner import BenchmarkRunner, HttpClient, InProcessClient, SCENARIOS, benchmark_user
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every API endpoint in-process or against a running server and write a JSON report.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--concurrency', type=int, default=1, help='Number of concurrent clients.')
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=[s.name for s in SCENARIOS],
+                            help='Only run this scenario; may be repeated.')
+        parser.add_argument('--cold-cache', action='store_true', help='Clear the catalog cache before each request.')
+        parser.add_argument('--url', help='Base URL of a running server; requests are made in-process if omitted.')
+        parser.add_argument('--username', default='benchmark')
+        parser.add_argument('--password', help='Password for --url runs.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write the JSON report here instead of to stdout.')
+
+    def handle(self, *args, **options):
+        if options['url']:
+            if not options['password']:
+                raise CommandError('--password is required with --url.')
+            token = HttpClient.login(options['url'], options['username'], options['password'])
+            make_client = lambda: HttpClient(options['url'], token)  # noqa: E731
+        else:
+            user = benchmark_user(options['username'])
+            make_client = lambda: InProcessClient(user)  # noqa: E731
+
+        runner = BenchmarkRunner(
+            make_client, requests=options['requests'], warmup=options['warmup'],
+            concurrency=options['concurrency'], cold_cache=options['cold_cache'], seed=options['seed'],
+            scenarios=options['scenarios'], log=lambda message: self.stderr.write(message),
+        )
+        report = runner.run()
+        report['meta']['mode'] = 'http' if options['url'] else 'in-process'
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f'Wrote {options["output"]}.'))
+        else:
+            self.stdout.write(output)
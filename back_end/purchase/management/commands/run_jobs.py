@@ -0,0 +1,31 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from purchase.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs until stopped with SIGINT or SIGTERM, which let running jobs finish.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, help='Jobs run at once (default: JOB_WORKER_CONCURRENCY).')
+        parser.add_argument('--mode', choices=['thread', 'process'],
+                            help='Run jobs on a thread pool or a process pool (default: JOB_WORKER_MODE).')
+        parser.add_argument('--poll-interval', type=float,
+                            help='Seconds between polls for due jobs (default: JOB_POLL_INTERVAL).')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due instead of polling.')
+
+    def handle(self, *args, **options):
+        worker = Worker(concurrency=options['concurrency'], mode=options['mode'],
+                        poll_interval=options['poll_interval'])
+        handlers = {signum: signal.signal(signum, lambda *_: worker.stop())
+                    for signum in (signal.SIGINT, signal.SIGTERM)}
+        self.stdout.write(f'Worker {worker.name} running up to {worker.concurrency} job(s) at once '
+                          f'on a {worker.mode} pool.')
+        try:
+            finished = worker.run(once=options['once'])
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f'Ran {finished} job(s).'))
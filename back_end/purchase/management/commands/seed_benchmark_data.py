@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from purchase.benchmarks.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = 'Bulk-generate a reproducible catalog, purchase order and sales history for benchmarking.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--purchase-orders', type=int, default=50000)
+        parser.add_argument('--sales-lines', type=int, default=100000)
+        parser.add_argument('--lines-per-order', type=int, default=5)
+        parser.add_argument('--customers', type=int, default=500)
+        parser.add_argument('--days', type=int, default=365, help='Length of the generated order history.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows generated per transaction.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        seeder = Seeder(
+            products=options['products'], purchase_orders=options['purchase_orders'],
+            sales_lines=options['sales_lines'], lines_per_order=options['lines_per_order'],
+            customers=options['customers'], days=options['days'], batch_size=options['batch_size'],
+            seed=options['seed'], log=lambda message: self.stdout.write(message) if options['verbosity'] > 1 else None,
+        )
+        elapsed = seeder.run()
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {options["products"]} product(s), {options["purchase_orders"]} purchase order(s) and '
+            f'{seeder.sales_orders} sales order(s) in {elapsed.total_seconds():.1f}s.'
+        ))
@@ -0,0 +1,107 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_product_codes(apps, schema_editor):
+    Product = apps.get_model('purchase', 'Product')
+    # Codes in the format later issued from the PROD sequence, which 0003 starts after.
+    products = list(Product.objects.filter(product_code__isnull=True).only('id'))
+    for product in products:
+        product.product_code = f'PROD-{product.id:03d}'
+    Product.objects.bulk_update(products, ['product_code'], batch_size=1000)
+
+
+def backfill_stock(apps, schema_editor):
+    Product = apps.get_model('purchase', 'Product')
+    WarehouseItem = apps.get_model('purchase', 'WarehouseItem')
+    totals = WarehouseItem.objects.filter(product=OuterRef('pk')).order_by().values('product') \
+        .annotate(total=Sum('quantity')).values('total')
+    Product.objects.update(stock=Coalesce(Subquery(totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='PurchaseOrderItem',
+        ),
+        migrations.DeleteModel(
+            name='PurchaseOrder',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='product_code',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.RunPython(backfill_product_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='product_code',
+            field=models.CharField(blank=True, max_length=20, unique=True),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to='products/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='name',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='stock',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='PurchaseOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('po_number', models.CharField(blank=True, max_length=20, unique=True)),
+                ('supplier', models.CharField(default='Default Supplier', max_length=255)),
+                ('quantity', models.PositiveIntegerField()),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order_date', models.DateTimeField(auto_now_add=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RECEIVED', 'Received')], default='PENDING', max_length=10)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='purchase.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WarehouseItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('added_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='warehouseitems', to='purchase.product')),
+                ('purchase_order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='purchase.purchaseorder')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('so_number', models.CharField(blank=True, max_length=20, unique=True)),
+                ('customer_name', models.CharField(max_length=255)),
+                ('order_date', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesOrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='purchase.product')),
+                ('sales_order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='purchase.salesorder')),
+            ],
+        ),
+        migrations.RunPython(backfill_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+import re
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+DOCUMENT_NUMBER_FIELDS = [
+    ('PROD', 'Product', 'product_code'),
+    ('PO', 'PurchaseOrder', 'po_number'),
+    ('SO', 'SalesOrder', 'so_number'),
+]
+
+
+def backfill_sequences(apps, schema_editor):
+    DocumentSequence = apps.get_model('purchase', 'DocumentSequence')
+    for prefix, model_name, field_name in DOCUMENT_NUMBER_FIELDS:
+        model = apps.get_model('purchase', model_name)
+        # Numbers used to be derived from the last id, so start after both the highest id and
+        # the highest number already issued.
+        last_value = model.objects.aggregate(last=Max('id'))['last'] or 0
+        pattern = re.compile(rf'^{prefix}-(\d+)$')
+        codes = model.objects.filter(**{f'{field_name}__startswith': f'{prefix}-'}).values_list(field_name, flat=True)
+        for code in codes.iterator(chunk_size=2000):
+            match = pattern.match(code)
+            if match:
+                last_value = max(last_value, int(match.group(1)))
+        DocumentSequence.objects.update_or_create(prefix=prefix, defaults={'last_value': last_value})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase', '0002_warehouse_sales_and_product_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=10, unique=True)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    SalesOrder = apps.get_model('purchase', 'SalesOrder')
+    SalesOrderItem = apps.get_model('purchase', 'SalesOrderItem')
+    totals = SalesOrderItem.objects.filter(sales_order=OuterRef('pk')).order_by().values('sales_order') \
+        .annotate(total=Sum(F('quantity') * F('price'))).values('total')
+    SalesOrder.objects.update(total_amount=Coalesce(
+        Subquery(totals), Decimal('0.00'), output_field=models.DecimalField(max_digits=12, decimal_places=2)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase', '0003_documentsequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salesorder',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['total_amount', 'id'], name='purchase_sa_total_a_1620e0_idx'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
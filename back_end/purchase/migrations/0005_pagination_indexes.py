@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase', '0004_salesorder_total_amount'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['-order_date', 'id'], name='purchase_pu_order_d_737839_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesorder',
+            index=models.Index(fields=['-order_date', 'id'], name='purchase_sa_order_d_cdc3a1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warehouseitem',
+            index=models.Index(fields=['-added_at', 'id'], name='purchase_wa_added_a_10a9c8_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.3 on 2026-10-17 20:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            'CREATE FULLTEXT INDEX purchase_product_search_ft ON purchase_product (product_code, name, description)'
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX purchase_product_search_ft ON purchase_product')
+
+
+def backfill_tokens(apps, schema_editor):
+    from purchase.search import product_tokens
+
+    if schema_editor.connection.vendor == 'mysql':
+        return
+    Product = apps.get_model('purchase', 'Product')
+    ProductSearchToken = apps.get_model('purchase', 'ProductSearchToken')
+    tokens = []
+    for product in Product.objects.only('id', 'product_code', 'name', 'description').iterator(chunk_size=2000):
+        tokens.extend(ProductSearchToken(product_id=product.id, token=token, weight=weight)
+                      for token, weight in product_tokens(product).items())
+        if len(tokens) >= 5000:
+            ProductSearchToken.objects.bulk_create(tokens)
+            tokens = []
+    ProductSearchToken.objects.bulk_create(tokens)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase', '0005_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='purchase.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'product'], name='purchase_pr_token_1b0168_idx')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(backfill_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    # Carry each warehouse row over as an opening adjustment so the ledger matches Product.stock.
+    WarehouseItem = apps.get_model('purchase', 'WarehouseItem')
+    StockMovement = apps.get_model('purchase', 'StockMovement')
+    rows = WarehouseItem.objects.filter(quantity__gt=0).order_by('id').iterator(chunk_size=2000)
+    batch = []
+    for row in rows:
+        batch.append(StockMovement(product_id=row.product_id, kind='ADJUSTMENT', quantity=row.quantity,
+                                   purchase_order_id=row.purchase_order_id, note='Opening balance',
+                                   created_at=row.added_at))
+        if len(batch) >= 2000:
+            StockMovement.objects.bulk_create(batch)
+            batch = []
+    StockMovement.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase', '0006_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('RECEIPT', 'Receipt'), ('SALE', 'Sale'), ('ADJUSTMENT', 'Adjustment')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('taken_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-updated_at', 'id'], name='purchase_pr_updated_61fc1d_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='purchase.product'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='purchase_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='purchase.purchaseorder'),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='sales_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='purchase.salesorder'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='purchase.product'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['product', 'created_at'], name='purchase_st_product_a86547_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('product', 'taken_at'), name='unique_stock_snapshot'),
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='warehouseitem',
+            name='product',
+        ),
+        migrations.RemoveField(
+            model_name='warehouseitem',
+            name='purchase_order',
+        ),
+        migrations.DeleteModel(
+            name='WarehouseItem',
+        ),
+    ]
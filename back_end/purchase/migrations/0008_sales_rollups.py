@@ -0,0 +1,65 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    SalesOrderItem = apps.get_model('purchase', 'SalesOrderItem')
+    DailyProductSales = apps.get_model('purchase', 'DailyProductSales')
+    DailyCustomerSales = apps.get_model('purchase', 'DailyCustomerSales')
+    items = SalesOrderItem.objects.annotate(day=TruncDate('sales_order__order_date')).order_by()
+    aggregates = {
+        'total_quantity': Sum('quantity'),
+        'total_revenue': Sum(F('quantity') * F('price')),
+        'orders': Count('sales_order', distinct=True),
+    }
+    DailyProductSales.objects.bulk_create([
+        DailyProductSales(day=row['day'], product_id=row['product'], quantity=row['total_quantity'],
+                          revenue=row['total_revenue'], order_count=row['orders'])
+        for row in items.values('day', 'product').annotate(**aggregates).iterator(chunk_size=2000)
+    ], batch_size=2000)
+    DailyCustomerSales.objects.bulk_create([
+        DailyCustomerSales(day=row['day'], customer_name=row['sales_order__customer_name'],
+                           quantity=row['total_quantity'], revenue=row['total_revenue'], order_count=row['orders'])
+        for row in items.values('day', 'sales_order__customer_name').annotate(**aggregates).iterator(chunk_size=2000)
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase', '0007_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCustomerSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('customer_name', models.CharField(max_length=255)),
+                ('quantity', models.PositiveBigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'customer_name'), name='unique_daily_customer_sales')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.PositiveBigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='purchase.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'product'), name='unique_daily_product_sales')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
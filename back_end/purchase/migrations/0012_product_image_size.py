@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:01
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def backfill_image_sizes(apps, schema_editor):
+    from purchase.images import image_size
+
+    Product = apps.get_model('purchase', 'Product')
+    for product in Product.objects.exclude(image='').exclude(image=None).only('id', 'image').iterator(chunk_size=500):
+        try:
+            with default_storage.open(product.image.name) as handle:
+                size = image_size(handle)
+        except OSError:
+            continue
+        if size:
+            Product.objects.filter(pk=product.pk).update(image_width=size[0], image_height=size[1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase', '0011_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_image_sizes, migrations.RunPython.noop),
+    ]
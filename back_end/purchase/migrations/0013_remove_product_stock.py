@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase', '0012_product_image_size'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='product',
+            name='stock',
+        ),
+    ]
@@ -1,6 +1,77 @@
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
 from django.db import models, transaction
-from django.db.models import Sum
+from django.db.models import Sum, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Now
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .sequences import next_document_number
+
+
+class DocumentSequence(models.Model):
+    prefix = models.CharField(max_length=10, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.prefix} ({self.last_value})'
+
+
+LEDGER_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def latest_snapshots(product, when=None):
+    snapshots = StockSnapshot.objects.filter(product=product).order_by('-taken_at')
+    return snapshots.filter(taken_at__lte=when) if when else snapshots
+
+
+def ledger_stock(when=None, product='pk'):
+    """
+    Stock from the product's latest snapshot (as of ``when``) plus the movements recorded after it.
+    ``product`` is the outer query's field holding the product id.
+    """
+    snapshot_taken_at = Subquery(latest_snapshots(OuterRef('product'), when).values('taken_at')[:1])
+    movements = StockMovement.objects.filter(product=OuterRef(product),
+                                             created_at__gt=Coalesce(snapshot_taken_at, Value(LEDGER_EPOCH)))
+    if when:
+        movements = movements.filter(created_at__lte=when)
+    delta = movements.order_by().values('product').annotate(total=Sum('quantity')).values('total')
+    snapshot = latest_snapshots(OuterRef(product), when).values('quantity')[:1]
+    return Coalesce(Subquery(snapshot), 0, output_field=models.IntegerField()) + \
+        Coalesce(Subquery(delta), 0, output_field=models.IntegerField())
+
+
+def active_holds():
+    """Units of the product held by unexpired reservations, summed from the holds' covering index."""
+    held = ReservationItem.objects.filter(product=OuterRef('pk'), expires_at__gt=Now()) \
+        .order_by().values('product').annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(held), 0, output_field=models.IntegerField())
+
+
+def replayed_stock():
+    """Stock summed over every movement of the product, ignoring snapshots."""
+    total = StockMovement.objects.filter(product=OuterRef('pk')).order_by().values('product') \
+        .annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(total), 0, output_field=models.IntegerField())
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_stock(self):
+        return self.annotate(stock=ledger_stock())
+
+    def stock_drift(self):
+        # Products whose latest snapshot disagrees with a full replay of their movements.
+        return self.with_stock().annotate(replayed_stock=replayed_stock()).exclude(stock=models.F('replayed_stock'))
+
+    def with_stock_at(self, when):
+        return self.annotate(stock_at=ledger_stock(when))
+
+    def with_available(self):
+        return self.with_stock().annotate(available=models.F('stock') - active_holds())
 
 
 class Product(models.Model):
@@ -9,25 +80,62 @@ class Product(models.Model):
     description = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Displayed size of the image, for the widths of its renditions; set when an image is uploaded.
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    @property
-    def stock(self):
-        total_stock = self.warehouseitems.aggregate(total=Sum('quantity'))['total']
-        return total_stock or 0
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['-updated_at', 'id'])]
 
     def save(self, *args, **kwargs):
+        # Imported here because the search and image modules build on these models.
+        from .images import image_size
+        from .search import index_products
+
         if not self.product_code:
-            last_product = Product.objects.all().order_by('id').last()
-            new_id = (last_product.id + 1) if last_product else 1
-            self.product_code = f'PROD-{new_id:03d}'
-        super().save(*args, **kwargs)
+            self.product_code = next_document_number('PROD')
+        if not self.image:
+            self.image_width = self.image_height = None
+        elif not self.image._committed:
+            self.image_width, self.image_height = image_size(self.image) or (None, None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            index_products([self])
+
+    @cached_property
+    def stock(self):
+        """
+        Stock on hand from the ledger. Stock writes only append movements, so it is no column:
+        querysets read it for every row at once with ``with_stock()``, which sets this attribute.
+        """
+        return Product.objects.with_stock().values_list('stock', flat=True).get(pk=self.pk)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # A full refresh reads stock again too; loading one deferred field leaves it alone.
+        if fields is None:
+            self.__dict__.pop('stock', None)
+        super().refresh_from_db(using, fields, from_queryset)
+
+    def stock_at(self, when):
+        return Product.objects.with_stock_at(when).values_list('stock_at', flat=True).get(pk=self.pk)
 
     def __str__(self):
         return self.name
 
 
+class ProductSearchToken(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=64)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [models.Index(fields=['token', 'product'])]
+
+
 class PurchaseOrder(models.Model):
     class OrderStatus(models.TextChoices):
         PENDING = 'PENDING', 'Pending'
@@ -41,35 +149,81 @@ class PurchaseOrder(models.Model):
     order_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=OrderStatus.choices, default=OrderStatus.PENDING)
 
+    class Meta:
+        indexes = [models.Index(fields=['-order_date', 'id'])]
+
     def save(self, *args, **kwargs):
         if not self.po_number:
-            last_order = PurchaseOrder.objects.all().order_by('id').last()
-            new_id = (last_order.id + 1) if last_order else 1
-            self.po_number = f'PO-{new_id:04d}'
+            self.po_number = next_document_number('PO')
         super().save(*args, **kwargs)
 
 
-class WarehouseItem(models.Model):
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='warehouseitems')
-    quantity = models.PositiveIntegerField()
-    purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.SET_NULL, null=True, blank=True)
-    added_at = models.DateTimeField(auto_now_add=True)
+class StockMovement(models.Model):
+    """Append-only stock ledger entry; ``quantity`` is positive for stock in and negative for stock out."""
+    class Kind(models.TextChoices):
+        RECEIPT = 'RECEIPT', 'Receipt'
+        SALE = 'SALE', 'Sale'
+        ADJUSTMENT = 'ADJUSTMENT', 'Adjustment'
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    quantity = models.IntegerField()
+    purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.SET_NULL, null=True, blank=True,
+                                       related_name='stock_movements')
+    sales_order = models.ForeignKey('SalesOrder', on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='stock_movements')
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['product', 'created_at'])]
+
+    def __str__(self):
+        return f'{self.kind} {self.quantity:+d} {self.product_id}'
+
+
+class StockSnapshot(models.Model):
+    """A product's stock covering every movement created at or before ``taken_at``."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    quantity = models.IntegerField()
+    taken_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['product', 'taken_at'], name='unique_stock_snapshot')]
+
+
+def items_total():
+    totals = SalesOrderItem.objects.filter(sales_order=OuterRef('pk')).order_by().values('sales_order') \
+        .annotate(total=Sum(models.F('quantity') * models.F('price'))).values('total')
+    return Coalesce(Subquery(totals), Decimal('0.00'), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+
+
+class SalesOrderQuerySet(models.QuerySet):
+    def sync_totals(self):
+        # Recompute the stored order totals from the order lines in a single UPDATE.
+        return self.update(total_amount=items_total())
+
+    def total_drift(self):
+        return self.annotate(items_total=items_total()).exclude(total_amount=models.F('items_total'))
 
 
 class SalesOrder(models.Model):
     so_number = models.CharField(max_length=20, unique=True, blank=True)
     customer_name = models.CharField(max_length=255)
     order_date = models.DateTimeField(auto_now_add=True)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
 
-    @property
-    def total_amount(self):
-        return self.items.aggregate(total=Sum(models.F('quantity') * models.F('price')))['total'] or 0
+    objects = SalesOrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['total_amount', 'id']),
+            models.Index(fields=['-order_date', 'id']),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.so_number:
-            last_order = SalesOrder.objects.all().order_by('id').last()
-            new_id = (last_order.id + 1) if last_order else 1
-            self.so_number = f'SO-{new_id:04d}'
+            self.so_number = next_document_number('SO')
         super().save(*args, **kwargs)
 
 
@@ -84,8 +238,130 @@ class SalesOrderItem(models.Model):
             raise ValidationError(
                 f"Not enough stock for {self.product.name}. Available: {self.product.stock}, Requested: {self.quantity}")
 
+    @transaction.atomic
     def save(self, *args, **kwargs):
         if not self.pk:
             self.price = self.product.price
         self.clean()
         super().save(*args, **kwargs)
+        SalesOrder.objects.filter(pk=self.sales_order_id).sync_totals()
+
+    @transaction.atomic
+    def delete(self, *args, **kwargs):
+        sales_order_id = self.sales_order_id
+        result = super().delete(*args, **kwargs)
+        SalesOrder.objects.filter(pk=sales_order_id).sync_totals()
+        return result
+
+
+class DailyProductSales(models.Model):
+    """Sales rollup per product and day, maintained by purchase.rollups."""
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    quantity = models.PositiveBigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['day', 'product'], name='unique_daily_product_sales')]
+
+
+class DailyCustomerSales(models.Model):
+    """Sales rollup per customer and day, maintained by purchase.rollups."""
+    day = models.DateField()
+    customer_name = models.CharField(max_length=255)
+    quantity = models.PositiveBigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['day', 'customer_name'], name='unique_daily_customer_sales')]
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client's ``Idempotency-Key`` and the response its first request produced, maintained by
+    purchase.idempotency. ``status_code`` is null while that request is still running; the
+    running request holds the key until ``locked_until``.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    locked_until = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key')]
+
+
+class Job(models.Model):
+    """
+    Background work run by ``manage.py run_jobs`` (see purchase.jobs). A running job belongs to
+    the worker in ``locked_by`` until ``locked_until``; failed attempts are retried at ``run_after``.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'QUEUED', 'Queued'
+        RUNNING = 'RUNNING', 'Running'
+        SUCCEEDED = 'SUCCEEDED', 'Succeeded'
+        FAILED = 'FAILED', 'Failed'
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL,
+                                   related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+
+class Reservation(models.Model):
+    """
+    Stock a client holds for a checkout until ``expires_at`` (see purchase.reservations). Placing a
+    sales order with the reservation consumes it; its holds end either way once it expires.
+    """
+    class Status(models.TextChoices):
+        ACTIVE = 'ACTIVE', 'Active'
+        CONSUMED = 'CONSUMED', 'Consumed'
+        RELEASED = 'RELEASED', 'Released'
+        # Shown for active reservations past expires_at; never stored.
+        EXPIRED = 'EXPIRED', 'Expired'
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reservations')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.ACTIVE)
+    sales_order = models.ForeignKey(SalesOrder, null=True, blank=True, on_delete=models.SET_NULL,
+                                    related_name='reservations')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    @property
+    def current_status(self):
+        if self.status == self.Status.ACTIVE and self.expires_at <= timezone.now():
+            return self.Status.EXPIRED
+        return self.status
+
+
+class ReservationItem(models.Model):
+    """A hold on ``quantity`` units of a product, which counts against availability until ``expires_at``."""
+    reservation = models.ForeignKey(Reservation, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='holds')
+    quantity = models.PositiveIntegerField()
+    # The reservation's expiry, moved to the present when it is consumed or released, so the
+    # active holds of a product are a range of one covering index.
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['product', 'expires_at', 'quantity'])]
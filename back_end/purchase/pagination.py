@@ -0,0 +1,145 @@
+import json
+from base64 import b64decode, b64encode
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination, _reverse_ordering
+from rest_framework.utils.urls import replace_query_param
+
+
+class OffsetCompatPagination(LimitOffsetPagination):
+    default_limit = 50
+    max_limit = 500
+
+
+def cursor_value(value):
+    # Full precision: DjangoJSONEncoder cuts datetimes to milliseconds, which would repeat rows.
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def after(ordering, position):
+    """
+    Rows past ``position`` (the values of the ``ordering`` fields of the last row read), as the
+    tuple comparison ``(a, b, id) > (x, y, z)`` spelled out per field so mixed directions work.
+    """
+    condition, equal = Q(), Q()
+    for field, value in zip(ordering, position):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset pagination over the view's ordering with ``id`` appended, so the ordering is unique.
+    Cursors carry the values of every ordering field of the row they continue from, and each page
+    is read with a tuple comparison on them rather than an offset, however many rows tie on the
+    first field (``?ordering=stock``, ``-search_rank``).
+
+    Requests that pass ``offset`` or ``limit`` are served by OffsetCompatPagination instead, for
+    clients that still page by offset.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-id',)
+    offset_pagination_class = OffsetCompatPagination
+
+    def __init__(self):
+        self.offset_paginator = None
+
+    def uses_offsets(self, request):
+        offset_paginator = self.offset_pagination_class
+        return offset_paginator.offset_query_param in request.query_params \
+            or offset_paginator.limit_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.uses_offsets(request):
+            self.offset_paginator = self.offset_pagination_class()
+            return self.offset_paginator.paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse, position = self.cursor if self.cursor is not None else (False, None)
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(after(ordering, position))
+            except (TypeError, ValueError, ValidationError):
+                # Values that do not fit the fields, such as a cursor made for another ordering.
+                raise NotFound(self.invalid_cursor_message)
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+        # A page read backwards always has rows after it, and one read forwards rows before it.
+        self.has_next = bool(self.page) and (has_more if not reverse else position is not None)
+        self.has_previous = bool(self.page) and (has_more if reverse else position is not None)
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_paginated_response(self, data):
+        if self.offset_paginator is not None:
+            return self.offset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_ordering(self, request, queryset, view):
+        if 'search_rank' in queryset.query.annotations and 'ordering' not in request.query_params:
+            return ('-search_rank', 'id')
+        self.ordering = getattr(view, 'ordering', None) or self.ordering
+        ordering = tuple(field.replace('pk', 'id') if field.lstrip('-') == 'pk' else field
+                         for field in super().get_ordering(request, queryset, view))
+        if not {'id', '-id'} & set(ordering):
+            ordering += ('id',)
+        # Fields after the id never decide the order, and would only lengthen the comparison.
+        return ordering[:next(i for i, field in enumerate(ordering) if field.lstrip('-') == 'id') + 1]
+
+    def position(self, row):
+        return [cursor_value(row[field.lstrip('-')] if isinstance(row, dict) else getattr(row, field.lstrip('-')))
+                for field in self.ordering]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(b64decode(encoded.encode('ascii')))
+            reverse, position = bool(cursor['r']), cursor['p']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
+
+    def encode_cursor(self, reverse, row):
+        cursor = json.dumps({'r': int(reverse), 'p': self.position(row)}, separators=(',', ':'))
+        return replace_query_param(self.base_url, self.cursor_query_param, b64encode(cursor.encode()).decode('ascii'))
+
+    def get_next_link(self):
+        return self.encode_cursor(False, self.page[-1]) if self.has_next else None
+
+    def get_previous_link(self):
+        return self.encode_cursor(True, self.page[0]) if self.has_previous else None
+
+    def to_html(self):
+        if self.offset_paginator is not None:
+            return self.offset_paginator.to_html()
+        return super().to_html()
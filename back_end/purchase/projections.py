@@ -0,0 +1,154 @@
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .fieldsets import view_columns
+from .images import srcset
+from .instrumentation import timed_serialization
+from .serializers import ImageSrcsetField
+
+PLAIN, PK, FILE, SRCSET, NESTED, CHILDREN = range(6)
+# Fieldsets compiled per projection before the oldest are dropped.
+COMPILED_FIELDSETS = 128
+
+
+class Projection:
+    """
+    Read-only serializer compiled from a DRF serializer class. The field objects are built once,
+    rows are read with ``.values()`` rather than as model instances, and nested lists are loaded
+    with one grouped query per page. Output matches the serializer's ``data`` field for field.
+
+    Supported fields are plain model fields and annotations, primary-key related fields, file and
+    image fields, ``ImageSrcsetField``, nested serializers (including ``source='*'``) and nested
+    ``many=True`` serializers over a reverse foreign key. The serializer is compiled once per
+    fieldset (see ``fieldsets``), so sparse requests read fewer columns.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._compiled = {}
+
+    def compiled(self, fieldset=None):
+        key = fieldset.key if fieldset is not None else None
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = self.compile(self.serializer_class(context={'fieldset': fieldset}), '')
+            if len(self._compiled) >= COMPILED_FIELDSETS:
+                self._compiled.pop(next(iter(self._compiled), None), None)
+            self._compiled[key] = compiled
+        return compiled
+
+    def compile(self, serializer, prefix):
+        model = serializer.Meta.model
+        columns, steps = [], []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            path = prefix + '__'.join(field.source_attrs)
+            if isinstance(field, serializers.ListSerializer):
+                child_model = field.child.Meta.model
+                link = model._meta.get_field(field.source).field.name
+                child_columns, child_steps = self.compile(field.child, '')
+                steps.append((name, CHILDREN, (child_model, link, child_columns, child_steps), prefix + 'pk'))
+            elif isinstance(field, serializers.BaseSerializer):
+                nested_prefix = prefix if field.source == '*' else path + '__'
+                nested_columns, nested_steps = self.compile(field, nested_prefix)
+                columns += nested_columns
+                steps.append((name, NESTED, nested_steps, None if field.source == '*' else nested_prefix + 'pk'))
+                if field.source != '*':
+                    columns.append(nested_prefix + 'pk')
+            elif isinstance(field, serializers.PrimaryKeyRelatedField):
+                columns.append(path)
+                steps.append((name, PK, None, path))
+            elif isinstance(field, serializers.FileField):
+                columns.append(path)
+                steps.append((name, FILE, getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL), path))
+            elif isinstance(field, ImageSrcsetField):
+                owner = path[:-len(field.source_attrs[-1])]
+                sizes = [owner + sibling for sibling in field.sibling_fields]
+                columns += [path, *sizes]
+                steps.append((name, SRCSET, sizes, path))
+            else:
+                columns.append(path)
+                steps.append((name, PLAIN, field.to_representation, path))
+        if any(kind == CHILDREN for _, kind, _, _ in steps):
+            columns.append(prefix + 'pk')
+        return list(dict.fromkeys(columns)), steps
+
+    def rows(self, queryset, extra=(), fieldset=None):
+        """``queryset`` as value dicts carrying every column the projection and ``extra`` need."""
+        columns, _ = self.compiled(fieldset)
+        columns = dict.fromkeys([*columns, *extra, *queryset.query.annotation_select])
+        return queryset.prefetch_related(None).values(*columns)
+
+    def serialize(self, rows, context=None):
+        rows, context = list(rows), context or {}
+        _, steps = self.compiled(context.get('fieldset'))
+        children = self.load_children(steps, rows)
+        request = context.get('request')
+        return [self.build(steps, row, request, children) for row in rows]
+
+    def load_children(self, steps, rows):
+        children = {}
+        for name, kind, spec, key in steps:
+            if kind != CHILDREN:
+                continue
+            child_model, link, child_columns, child_steps = spec
+            grouped = defaultdict(list)
+            ids = {row[key] for row in rows}
+            queryset = child_model.objects.filter(**{f'{link}__in': ids}).order_by(link, 'pk') \
+                .values(link, *child_columns)
+            for child in queryset:
+                grouped[child[link]].append(child)
+            children[name] = (child_steps, grouped)
+        return children
+
+    def build(self, steps, row, request, children):
+        data = {}
+        for name, kind, spec, key in steps:
+            if kind == PLAIN:
+                value = row[key]
+                data[name] = None if value is None else spec(value)
+            elif kind == PK:
+                data[name] = row[key]
+            elif kind == FILE:
+                data[name] = file_representation(row[key], spec, request)
+            elif kind == SRCSET:
+                data[name] = srcset(row[key], request, *(row[size] for size in spec))
+            elif kind == NESTED:
+                data[name] = None if key is not None and row[key] is None else self.build(spec, row, request, {})
+            else:
+                child_steps, grouped = children[name]
+                data[name] = [self.build(child_steps, child, request, {}) for child in grouped[row[key]]]
+        return data
+
+
+def file_representation(name, use_url, request):
+    if not name:
+        return None
+    if not use_url:
+        return name
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+class ProjectedListMixin:
+    """
+    Serves the list action from ``list_projection`` (a Projection of the view's serializer) so
+    pages are built from value rows; every other action keeps using ``serializer_class``.
+    """
+    list_projection = None
+
+    def list(self, request, *args, **kwargs):
+        projection = self.list_projection
+        if projection is None:
+            return super().list(request, *args, **kwargs)
+        context = self.get_serializer_context()
+        rows = projection.rows(self.filter_queryset(self.get_queryset()), view_columns(self), context.get('fieldset'))
+        page = self.paginate_queryset(rows)
+        with timed_serialization():
+            data = projection.serialize(rows if page is None else page, context)
+        return Response(data) if page is None else self.get_paginated_response(data)
@@ -0,0 +1,37 @@
+from django.db import transaction
+
+from .ledger import record_movements
+from .models import PurchaseOrder, StockMovement
+
+RECEIVED = 'received'
+ALREADY_RECEIVED = 'already_received'
+NOT_FOUND = 'not_found'
+
+
+@transaction.atomic
+def receive_purchase_orders(ids):
+    """Receive every pending purchase order in ``ids`` and return a status per requested id."""
+    orders = list(PurchaseOrder.objects.select_for_update().filter(pk__in=ids).order_by('id')
+                  .only('id', 'po_number', 'product_id', 'quantity', 'status'))
+    orders_by_id = {order.pk: order for order in orders}
+    pending = [order for order in orders if order.status != PurchaseOrder.OrderStatus.RECEIVED]
+
+    if pending:
+        PurchaseOrder.objects.filter(pk__in=[order.pk for order in pending]) \
+            .update(status=PurchaseOrder.OrderStatus.RECEIVED)
+        record_movements([
+            StockMovement(product_id=order.product_id, kind=StockMovement.Kind.RECEIPT, quantity=order.quantity,
+                          purchase_order_id=order.pk)
+            for order in pending
+        ], sender=PurchaseOrder)
+
+    pending_ids = {order.pk for order in pending}
+    results = []
+    for pk in dict.fromkeys(ids):
+        order = orders_by_id.get(pk)
+        if order is None:
+            results.append({'id': pk, 'po_number': None, 'result': NOT_FOUND})
+        else:
+            result = RECEIVED if pk in pending_ids else ALREADY_RECEIVED
+            results.append({'id': pk, 'po_number': order.po_number, 'result': result})
+    return results
@@ -0,0 +1,65 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class PassthroughRenderer(BaseRenderer):
+    """Lets `?format=` and Accept negotiation pick a streaming export; the view builds the body itself."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class CSVRenderer(PassthroughRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+
+class NDJSONRenderer(PassthroughRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer on orjson, which encodes datetimes, dates, UUIDs and nested dicts natively and
+    hands anything else (Decimal, lazy strings, querysets) to DRF's encoder. The output is the
+    same as the stdlib renderer's, which still renders indented output and runs without orjson.
+    """
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact or \
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        content = orjson.dumps(data, default=JSONEncoder().default, option=self.options)
+        # Match the stdlib renderer, which escapes these so the output is also valid JavaScript.
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser on orjson when it is installed."""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        content = stream.read() if stream is not None else b''
+        try:
+            if encoding.lower().replace('-', '') != 'utf8':
+                content = content.decode(encoding)
+            return orjson.loads(content)
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,86 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Now
+from django.utils import timezone
+from rest_framework import serializers
+
+from .availability import AVAILABILITY_GENERATION
+from .cache import bump
+from .ledger import check_stock
+from .models import Reservation, ReservationItem
+
+
+def default_ttl():
+    return getattr(settings, 'RESERVATION_TTL', timedelta(minutes=10))
+
+
+def max_ttl():
+    return getattr(settings, 'RESERVATION_MAX_TTL', timedelta(hours=1))
+
+
+@transaction.atomic
+def reserve(user, items, ttl=None):
+    """
+    Hold the quantities of ``items`` (dicts with a ``product`` and a ``quantity``) for ``user``
+    until ``ttl`` from now. The products are locked only while their availability is checked and
+    the holds written, so checkouts with a reservation no longer compete for stock when they commit.
+    """
+    requested = defaultdict(int)
+    for item in items:
+        requested[item['product'].pk] += item['quantity']
+    check_stock({pk: -quantity for pk, quantity in requested.items()}, respect_holds=True)
+
+    expires_at = timezone.now() + min(ttl or default_ttl(), max_ttl())
+    reservation = Reservation.objects.create(user=user, expires_at=expires_at)
+    ReservationItem.objects.bulk_create([
+        ReservationItem(reservation=reservation, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in requested.items()
+    ])
+    transaction.on_commit(lambda: bump(AVAILABILITY_GENERATION))
+    return reservation
+
+
+def held_quantities(reservation):
+    """Units per product id that ``reservation`` holds; none once it is no longer active."""
+    return dict(ReservationItem.objects.filter(reservation=reservation, reservation__status=Reservation.Status.ACTIVE,
+                                               expires_at__gt=Now()).values_list('product_id', 'quantity'))
+
+
+def end_holds(reservation):
+    """End the holds of ``reservation`` now, so its stock counts as available again."""
+    ReservationItem.objects.filter(reservation=reservation, expires_at__gt=Now()).update(expires_at=Now())
+
+
+def mark_consumed(reservation, sales_order):
+    """
+    Record that ``sales_order`` used ``reservation``. Raises a validation error, rolling back the
+    order, when the reservation expired or was used by another order in the meantime.
+    """
+    consumed = Reservation.objects.filter(pk=reservation.pk, status=Reservation.Status.ACTIVE, expires_at__gt=Now()) \
+        .update(status=Reservation.Status.CONSUMED, sales_order=sales_order)
+    if not consumed:
+        raise serializers.ValidationError({'reservation': ['This reservation has expired or was already used.']})
+
+
+@transaction.atomic
+def release_reservation(reservation):
+    """Give the stock of an active reservation back before it expires."""
+    end_holds(reservation)
+    Reservation.objects.filter(pk=reservation.pk, status=Reservation.Status.ACTIVE) \
+        .update(status=Reservation.Status.RELEASED)
+    transaction.on_commit(lambda: bump(AVAILABILITY_GENERATION))
+
+
+def purge_reservations(older_than=timedelta(days=7), batch_size=1000):
+    """Delete reservations, and their holds, that ended more than ``older_than`` ago; returns how many."""
+    deleted = 0
+    while True:
+        ended = Reservation.objects.filter(expires_at__lte=timezone.now() - older_than)
+        ids = list(ended.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        ReservationItem.objects.filter(reservation__in=ids).delete()
+        deleted += Reservation.objects.filter(pk__in=ids).delete()[0]
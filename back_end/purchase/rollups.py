@@ -0,0 +1,176 @@
+import threading
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, When, F, Value, Sum, Count
+from django.db.models.functions import TruncDate, TruncWeek, TruncMonth
+from django.utils import timezone
+
+from .models import SalesOrder, SalesOrderItem, DailyProductSales, DailyCustomerSales
+
+# Rollup model -> the field its rows are keyed on besides the day.
+ROLLUPS = (
+    (DailyProductSales, 'product_id'),
+    (DailyCustomerSales, 'customer_name'),
+)
+
+
+def increment(model, day, key, totals):
+    """Add ``totals`` (key -> (quantity, revenue, orders)) to the rollup rows of ``day``."""
+    existing = set(model.objects.filter(day=day, **{f'{key}__in': totals}).values_list(key, flat=True))
+    if existing:
+        def delta(index):
+            return Case(*[When(**{key: value}, then=Value(totals[value][index])) for value in existing])
+
+        model.objects.filter(day=day, **{f'{key}__in': existing}).update(
+            quantity=F('quantity') + delta(0), revenue=F('revenue') + delta(1), order_count=F('order_count') + delta(2),
+        )
+    model.objects.bulk_create([
+        model(day=day, quantity=quantity, revenue=revenue, order_count=orders, **{key: value})
+        for value, (quantity, revenue, orders) in totals.items() if value not in existing
+    ])
+
+
+def record_sales_order(sales_order, lines):
+    """Add a newly placed order to the rollups; ``lines`` are (product id, quantity, price) tuples."""
+    products = defaultdict(lambda: [0, Decimal('0.00')])
+    for product_id, quantity, price in lines:
+        products[product_id][0] += quantity
+        products[product_id][1] += quantity * price
+    totals = {
+        DailyProductSales: {product_id: (quantity, revenue, 1) for product_id, (quantity, revenue) in products.items()},
+        DailyCustomerSales: {sales_order.customer_name: (sum(quantity for quantity, _ in products.values()),
+                                                         sum((revenue for _, revenue in products.values()),
+                                                             Decimal('0.00')), 1)},
+    }
+    day = timezone.localdate(sales_order.order_date)
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                for model, key in ROLLUPS:
+                    increment(model, day, key, totals[model])
+            return
+        except IntegrityError:
+            # A concurrent order created one of the rows first; the retry updates it instead.
+            if attempt:
+                raise
+
+
+def day_bounds(first_day, last_day):
+    tz = timezone.get_current_timezone()
+    return (timezone.make_aware(datetime.combine(first_day, time.min), tz),
+            timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min), tz))
+
+
+def refresh_range(first_day, last_day):
+    """Recompute every rollup row from ``first_day`` to ``last_day`` (inclusive) from the orders."""
+    start, end = day_bounds(first_day, last_day)
+    items = SalesOrderItem.objects.filter(sales_order__order_date__gte=start, sales_order__order_date__lt=end) \
+        .annotate(day=TruncDate('sales_order__order_date')).order_by()
+    aggregates = {
+        'total_quantity': Sum('quantity'),
+        'total_revenue': Sum(F('quantity') * F('price')),
+        'orders': Count('sales_order', distinct=True),
+    }
+    with transaction.atomic():
+        for model, key in ROLLUPS:
+            model.objects.filter(day__gte=first_day, day__lte=last_day).delete()
+        DailyProductSales.objects.bulk_create([
+            DailyProductSales(day=row['day'], product_id=row['product'], quantity=row['total_quantity'],
+                              revenue=row['total_revenue'], order_count=row['orders'])
+            for row in items.values('day', 'product').annotate(**aggregates).iterator(chunk_size=2000)
+        ], batch_size=2000)
+        DailyCustomerSales.objects.bulk_create([
+            DailyCustomerSales(day=row['day'], customer_name=row['sales_order__customer_name'],
+                               quantity=row['total_quantity'], revenue=row['total_revenue'], order_count=row['orders'])
+            for row in items.values('day', 'sales_order__customer_name').annotate(**aggregates)
+            .iterator(chunk_size=2000)
+        ], batch_size=2000)
+
+
+def rebuild_rollups(batch_days=31):
+    """Recompute the rollups for the whole order history, ``batch_days`` per transaction."""
+    first = SalesOrder.objects.order_by('order_date').values_list('order_date', flat=True).first()
+    last = SalesOrder.objects.order_by('-order_date').values_list('order_date', flat=True).first()
+    if first is None:
+        for model, _ in ROLLUPS:
+            model.objects.all().delete()
+        return 0
+    day, last_day = timezone.localdate(first), timezone.localdate(last)
+    for model, _ in ROLLUPS:
+        model.objects.exclude(day__gte=day, day__lte=last_day).delete()
+    days = 0
+    while day <= last_day:
+        batch_end = min(day + timedelta(days=batch_days - 1), last_day)
+        refresh_range(day, batch_end)
+        days += (batch_end - day).days + 1
+        day = batch_end + timedelta(days=1)
+    return days
+
+
+class PendingRefresh:
+    """Days touched by edits or deletions in a transaction, recomputed once it commits."""
+
+    def __init__(self, days):
+        self.days = set(days)
+        # Robust on_commit callbacks are logged by __qualname__ when they fail.
+        self.__qualname__ = type(self).__qualname__
+
+    def __call__(self):
+        for day in sorted(self.days):
+            refresh_range(day, day)
+
+    def is_live(self, connection):
+        return any(func is self for _, func, _ in connection.run_on_commit)
+
+
+_local = threading.local()
+
+
+def schedule_refresh(order_date):
+    day = timezone.localdate(order_date)
+    pending = getattr(_local, 'pending', None)
+    if pending is not None and pending.is_live(transaction.get_connection()):
+        pending.days.add(day)
+        return
+    _local.pending = PendingRefresh([day])
+    transaction.on_commit(_local.pending, robust=True)
+
+
+INTERVALS = {
+    'day': F('day'),
+    'week': TruncWeek('day'),
+    'month': TruncMonth('day'),
+}
+TOTALS = {
+    'quantity': Sum('quantity'),
+    'revenue': Sum('revenue'),
+    'order_count': Sum('order_count'),
+}
+
+
+def sales_series(first_day, last_day, interval='day', product=None, customer=None):
+    """Quantity, revenue and order count per period, read from the rollups only."""
+    if product is not None:
+        rows = DailyProductSales.objects.filter(product=product)
+    else:
+        # Every order has exactly one customer, so the customer rollup also gives store-wide order counts.
+        rows = DailyCustomerSales.objects.all()
+        if customer is not None:
+            rows = rows.filter(customer_name=customer)
+    return rows.filter(day__gte=first_day, day__lte=last_day).annotate(period=INTERVALS[interval]) \
+        .order_by().values('period').annotate(**TOTALS).order_by('period')
+
+
+def top_products(first_day, last_day, order_by='revenue', limit=10):
+    return DailyProductSales.objects.filter(day__gte=first_day, day__lte=last_day).order_by() \
+        .values('product', product_code=F('product__product_code'), product_name=F('product__name')) \
+        .annotate(**TOTALS) \
+        .order_by(f'-{order_by}', 'product')[:limit]
+
+
+def top_customers(first_day, last_day, order_by='revenue', limit=10):
+    return DailyCustomerSales.objects.filter(day__gte=first_day, day__lte=last_day).order_by() \
+        .values('customer_name').annotate(**TOTALS).order_by(f'-{order_by}', 'customer_name')[:limit]
@@ -0,0 +1,168 @@
+import hashlib
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .cache import get_cache
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_routing = ContextVar('purchase_db_routing', default=None)
+
+
+def primary_alias():
+    return getattr(settings, 'DATABASE_PRIMARY', DEFAULT_DB_ALIAS)
+
+
+def replica_weights():
+    return getattr(settings, 'DATABASE_REPLICAS', {})
+
+
+class ReplicaHealth:
+    """Replicas that failed to connect, skipped until REPLICA_RETRY_SECONDS have passed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._down_until = {}
+
+    def is_up(self, alias):
+        with self._lock:
+            return self._down_until.get(alias, 0) <= time.monotonic()
+
+    def mark_down(self, alias):
+        with self._lock:
+            self._down_until[alias] = time.monotonic() + getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+
+    def reset(self):
+        with self._lock:
+            self._down_until.clear()
+
+
+health = ReplicaHealth()
+
+
+def choose_replica(rng=random):
+    """A connected replica picked by weight, or None when none is available."""
+    candidates = {alias: weight for alias, weight in replica_weights().items() if weight > 0 and health.is_up(alias)}
+    while candidates:
+        alias = rng.choices(list(candidates), weights=list(candidates.values()))[0]
+        try:
+            connections[alias].ensure_connection()
+            return alias
+        except DatabaseError:
+            health.mark_down(alias)
+            del candidates[alias]
+    return None
+
+
+def client_key(request):
+    """Who a request is from, for pinning: its bearer token or session cookie, hashed."""
+    credentials = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    return hashlib.sha256(credentials.encode()).hexdigest() if credentials else None
+
+
+def pin_key(client):
+    return f'db:pinned:{client}'
+
+
+class RequestRouting:
+    """Where the queries of one request go; a request reads from at most one replica."""
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.replica = None
+        self.wrote = False
+
+    def read_alias(self):
+        primary = primary_alias()
+        # Reads after a write, or inside a transaction, must see that write.
+        if not self.use_replica or self.wrote or connections[primary].in_atomic_block:
+            return primary
+        if self.replica is None:
+            self.replica = choose_replica() or primary
+        return self.replica
+
+
+class ReplicaRouter:
+    """
+    Sends reads made while serving a safe-method request to a replica in DATABASE_REPLICAS, chosen
+    by weight, and everything else to the primary. Clients are pinned to the primary for
+    REPLICA_PIN_SECONDS after they write, so they read their own writes despite replication lag.
+    Reads outside a request, such as management commands, go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        return routing.read_alias() if routing is not None else primary_alias()
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return primary_alias()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {primary_alias(), *replica_weights()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def stream_with(routing, chunks):
+    # Streamed responses, such as exports, run their queries after the view has returned.
+    for chunk in chunks:
+        token = _routing.set(routing)
+        try:
+            yield chunk
+        finally:
+            _routing.reset(token)
+
+
+class ReplicaRoutingMiddleware:
+    """Sets up the ReplicaRouter state of each request and pins clients that wrote to the primary."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routing, client = self.start(request)
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(response, routing, client)
+
+    async def __acall__(self, request):
+        routing, client = self.start(request)
+        token = _routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.finish(response, routing, client)
+
+    def start(self, request):
+        client = client_key(request)
+        use_replica = bool(replica_weights()) and request.method in SAFE_METHODS
+        if use_replica and client is not None:
+            use_replica = get_cache().get(pin_key(client)) is None
+        return RequestRouting(use_replica), client
+
+    def finish(self, response, routing, client):
+        if routing.wrote and client is not None and replica_weights():
+            get_cache().set(pin_key(client), True, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+        if response.streaming and not response.is_async and routing.use_replica:
+            response.streaming_content = stream_with(routing, response.streaming_content)
+        return response
@@ -0,0 +1,139 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, When, F, Max, Q, Sum, OuterRef, Subquery, FloatField, IntegerField, Func
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Product, ProductSearchToken
+
+TOKEN_PATTERN = re.compile(r'\w+')
+MAX_TOKEN_LENGTH = 64
+MAX_DESCRIPTION_TOKENS = 200
+MAX_QUERY_TERMS = 8
+
+# How much a token found in each field counts towards a product's relevance.
+FIELD_WEIGHTS = (
+    ('product_code', 8),
+    ('name', 4),
+    ('description', 1),
+)
+
+
+def tokenize(text, limit=None):
+    tokens = []
+    for match in TOKEN_PATTERN.finditer((text or '').lower()):
+        token = match.group()[:MAX_TOKEN_LENGTH]
+        if token not in tokens:
+            tokens.append(token)
+            if limit and len(tokens) >= limit:
+                break
+    return tokens
+
+
+def product_tokens(product):
+    weights = {}
+    for field, weight in FIELD_WEIGHTS:
+        limit = MAX_DESCRIPTION_TOKENS if field == 'description' else None
+        for token in tokenize(getattr(product, field), limit):
+            weights[token] = max(weights.get(token, 0), weight)
+    return weights
+
+
+def search_backend():
+    backend = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'auto')
+    if backend == 'auto':
+        return 'fulltext' if connection.vendor == 'mysql' else 'tokens'
+    return backend
+
+
+def index_products(products):
+    """Rewrite the search tokens of ``products``; a no-op when MySQL FULLTEXT does the indexing."""
+    if search_backend() != 'tokens':
+        return
+    products = list(products)
+    ProductSearchToken.objects.filter(product__in=products).delete()
+    ProductSearchToken.objects.bulk_create([
+        ProductSearchToken(product=product, token=token, weight=weight)
+        for product in products
+        for token, weight in product_tokens(product).items()
+    ], batch_size=2000)
+
+
+def prefix_range(prefix):
+    # A range keeps prefix matches on the (token, product) index on every backend, unlike LIKE.
+    return Q(token__gte=prefix, token__lt=prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def ranked_products(terms):
+    """Product ids matching every term (as a token prefix), with a relevance score."""
+    matches = [prefix_range(term) for term in terms]
+    any_match = Q()
+    for match in matches:
+        any_match |= match
+    matched_terms = sum(Max(Case(When(match, then=1), default=0)) for match in matches)
+    return ProductSearchToken.objects.filter(any_match).values('product').annotate(
+        score=Sum(Case(When(token__in=terms, then=F('weight') * 2), default=F('weight'),
+                       output_field=IntegerField())),
+        matched_terms=matched_terms,
+    ).filter(matched_terms=len(terms)).order_by()
+
+
+class MatchAgainst(Func):
+    template = 'MATCH (%(expressions)s) AGAINST (%(query)s IN BOOLEAN MODE)'
+    output_field = FloatField()
+
+    def __init__(self, *expressions, query):
+        super().__init__(*expressions)
+        self.query = query
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = super().as_sql(compiler, connection, query='%s', **extra_context)
+        return sql, params + [self.query]
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """
+    Replaces SearchFilter for product lookups. Every term must match the start of a word in
+    the product code, name or description; results are ranked by relevance unless the client
+    asked for an explicit ``ordering``. Views set ``search_product_path`` to reach the product
+    from their model (e.g. ``'product__'``).
+    """
+    search_param = 'search'
+
+    def get_terms(self, request):
+        return tokenize(request.query_params.get(self.search_param, ''), MAX_QUERY_TERMS)
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_terms(request)
+        if not terms:
+            return queryset
+
+        path = getattr(view, 'search_product_path', '')
+        if search_backend() == 'fulltext':
+            query = ' '.join(f'+{term}*' for term in terms)
+            columns = [F(f'{path}{field}') for field, _ in FIELD_WEIGHTS]
+            queryset = queryset.annotate(search_rank=MatchAgainst(*columns, query=query)) \
+                .filter(search_rank__gt=0)
+        else:
+            ranked = ranked_products(terms)
+            rank = Subquery(ranked.filter(product=OuterRef(f'{path}pk')).values('score')[:1])
+            queryset = queryset.filter(**{f'{path}pk__in': ranked.values('product')}) \
+                .annotate(search_rank=rank)
+
+        if 'ordering' not in request.query_params:
+            queryset = queryset.order_by('-search_rank', 'id')
+        return queryset
+
+
+def rebuild_search_index(batch_size=2000):
+    last_id = 0
+    indexed = 0
+    while True:
+        batch = list(Product.objects.filter(id__gt=last_id).order_by('id')
+                     .only('id', 'product_code', 'name', 'description')[:batch_size])
+        if not batch:
+            return indexed
+        index_products(batch)
+        indexed += len(batch)
+        last_id = batch[-1].id
@@ -1,6 +1,17 @@
+from datetime import timedelta
+
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Product, PurchaseOrder, WarehouseItem, SalesOrder, SalesOrderItem
-from django.db import transaction
+from rest_framework.fields import get_attribute
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import Product, PurchaseOrder, StockMovement, SalesOrder, SalesOrderItem, Job, Reservation, \
+    ReservationItem
+from .checkout import place_sales_order
+from .reservations import reserve
+from .fieldsets import FieldsetSerializerMixin
+from .images import srcset
 from django.contrib.auth.models import User
 
 class UserSerializer(serializers.ModelSerializer):
@@ -10,23 +21,59 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField(required=False, allow_null=True)
+
+    def validate_refresh(self, value):
+        if value is None:
+            return None
+        try:
+            return RefreshToken(value)
+        except TokenError as error:
+            raise serializers.ValidationError(str(error))
+
+
+class ImageSrcsetField(serializers.ReadOnlyField):
+    """``srcset`` strings for the image at ``source``, sized by the image_width and image_height beside it."""
+    sibling_fields = ('image_width', 'image_height')
+
+    def get_attribute(self, instance):
+        owner = get_attribute(instance, self.source_attrs[:-1])
+        return getattr(owner, self.source_attrs[-1]), *(getattr(owner, name) for name in self.sibling_fields)
+
+    def to_representation(self, value):
+        image, width, height = value
+        return srcset(image, self.context.get('request'), width, height)
+
+
+class ProductSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     stock = serializers.IntegerField(read_only=True)
     image = serializers.ImageField(max_length=None, use_url=True, allow_null=True, required=False)
+    image_srcset = ImageSrcsetField(source='image')
 
     class Meta:
         model = Product
-        fields = ['id', 'product_code', 'name', 'description', 'price', 'stock', 'image']
+        fields = ['id', 'product_code', 'name', 'description', 'price', 'stock', 'image', 'image_srcset']
         read_only_fields = ['product_code']
 
 
-class PurchaseOrderProductSerializer(serializers.ModelSerializer):
+class ProductImportSerializer(ProductSerializer):
+    class Meta(ProductSerializer.Meta):
+        fields = ['product_code', 'name', 'description', 'price']
+        read_only_fields = []
+        # Uniqueness is resolved by the importer's upsert rather than one query per row.
+        extra_kwargs = {'product_code': {'validators': []}, 'name': {'validators': []}}
+
+
+class PurchaseOrderProductSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
+    image_srcset = ImageSrcsetField(source='image')
+
     class Meta:
         model = Product
-        fields = ['id', 'name', 'image', 'product_code']
+        fields = ['id', 'name', 'image', 'image_srcset', 'product_code']
 
 
-class PurchaseOrderSerializer(serializers.ModelSerializer):
+class PurchaseOrderSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     product = PurchaseOrderProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), source='product', write_only=True)
 
@@ -35,60 +82,197 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'po_number', 'product', 'product_id', 'supplier', 'quantity', 'unit_price', 'order_date',
                   'status']
         read_only_fields = ['status', 'order_date', 'po_number']
+        expandable_fields = {'product': (ProductSerializer, {'read_only': True})}
+
+
+class PurchaseOrderImportSerializer(PurchaseOrderSerializer):
+    product_id = serializers.IntegerField(min_value=1, required=False)
+    product_code = serializers.CharField(max_length=20, required=False)
+
+    class Meta(PurchaseOrderSerializer.Meta):
+        fields = ['product_id', 'product_code', 'supplier', 'quantity', 'unit_price']
+
+    def validate(self, attrs):
+        if not attrs.get('product_id') and not attrs.get('product_code'):
+            raise serializers.ValidationError({'product': ['Provide a product_id or product_code.']})
+        return attrs
+
+
+class ImportFileSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=['csv', 'ndjson'], required=False)
+
+
+class ReceiveBatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000)
+
+
+class StockPositionSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
+    product = ProductSerializer(source='*', read_only=True)
+    quantity = serializers.IntegerField(read_only=True)
+    added_at = serializers.DateTimeField(read_only=True)
+    purchase_order = serializers.IntegerField(read_only=True)
+    po_number = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'product', 'quantity', 'added_at', 'purchase_order', 'po_number']
 
 
-class WarehouseItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+class StockMovementSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
+    po_number = serializers.CharField(source='purchase_order.po_number', read_only=True, default=None)
+    so_number = serializers.CharField(source='sales_order.so_number', read_only=True, default=None)
 
     class Meta:
-        model = WarehouseItem
-        fields = ['id', 'product', 'quantity', 'added_at']
+        model = StockMovement
+        fields = ['id', 'product', 'kind', 'quantity', 'purchase_order', 'po_number', 'sales_order', 'so_number',
+                  'note', 'created_at']
+        read_only_fields = ['kind', 'purchase_order', 'sales_order', 'created_at']
+        expandable_fields = {'product': (PurchaseOrderProductSerializer, {'read_only': True})}
+
+    def validate_quantity(self, value):
+        if value == 0:
+            raise serializers.ValidationError('Adjustments must change the stock.')
+        return value
+
+
+class ReportQuerySerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    interval = serializers.ChoiceField(choices=['day', 'week', 'month'], default='day')
+    order_by = serializers.ChoiceField(choices=['revenue', 'quantity', 'order_count'], default='revenue')
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    product = serializers.IntegerField(min_value=1, required=False)
+    customer = serializers.CharField(max_length=255, required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault('date_to', timezone.localdate())
+        attrs.setdefault('date_from', attrs['date_to'] - timedelta(days=29))
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError({'date_from': ['Must not be after date_to.']})
+        if (attrs['date_to'] - attrs['date_from']).days > 3660:
+            raise serializers.ValidationError({'date_from': ['Reports cover at most ten years.']})
+        return attrs
+
 
+class BulkProductField(serializers.PrimaryKeyRelatedField):
+    def to_internal_value(self, data):
+        products = getattr(self.parent.parent, 'products_by_pk', None)
+        if products is None:
+            return super().to_internal_value(data)
+        try:
+            return products[int(data)]
+        except (KeyError, TypeError, ValueError):
+            return super().to_internal_value(data)
 
-class SalesOrderItemSerializer(serializers.ModelSerializer):
+
+class SalesOrderItemListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        # Load every product on the order in one query instead of one lookup per line.
+        if isinstance(data, list):
+            product_ids = {item.get('product') for item in data if isinstance(item, dict)}
+            product_ids = {pk for pk in product_ids if str(pk).isdigit()}
+            self.products_by_pk = Product.objects.in_bulk(product_ids)
+        try:
+            return super().to_internal_value(data)
+        finally:
+            self.products_by_pk = None
+
+
+class SalesOrderItemSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
+    product = BulkProductField(queryset=Product.objects.all())
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_image = serializers.ImageField(source='product.image', read_only=True)
+    product_image_srcset = ImageSrcsetField(source='product.image')
 
     class Meta:
         model = SalesOrderItem
-        fields = ['id', 'product', 'product_name', 'product_image', 'quantity', 'price']
+        fields = ['id', 'product', 'product_name', 'product_image', 'product_image_srcset', 'quantity', 'price']
         read_only_fields = ['price', 'product_name', 'product_image']
+        list_serializer_class = SalesOrderItemListSerializer
+        expandable_fields = {'product': (PurchaseOrderProductSerializer, {'read_only': True})}
+
+
+class ReservationField(serializers.PrimaryKeyRelatedField):
+    """An active reservation of the requesting user."""
+
+    def get_queryset(self):
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return Reservation.objects.none()
+        return Reservation.objects.filter(user=user, status=Reservation.Status.ACTIVE, expires_at__gt=timezone.now())
 
 
-class SalesOrderSerializer(serializers.ModelSerializer):
+class SalesOrderSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     items = SalesOrderItemSerializer(many=True)
     total_amount = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    reservation = ReservationField(write_only=True, required=False, error_messages={
+        'does_not_exist': 'Reservation "{pk_value}" does not exist, has expired or was already used.'})
 
     class Meta:
         model = SalesOrder
-        fields = ['id', 'so_number', 'customer_name', 'order_date', 'total_amount', 'items']
+        fields = ['id', 'so_number', 'customer_name', 'order_date', 'total_amount', 'items', 'reservation']
         read_only_fields = ['so_number']
 
-    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items')
-        sales_order = SalesOrder.objects.create(**validated_data)
+        sales_order = place_sales_order(items=items_data, **validated_data)
+        # The lines are read back rather than taken from the bulk insert, which leaves ids unset on MySQL.
+        lines = SalesOrderItem.objects.select_related('product')
+        prefetch_related_objects([sales_order], Prefetch('items', queryset=lines))
+        return sales_order
 
-        for item_data in items_data:
-            product = item_data['product']
-            quantity_to_sell = item_data['quantity']
 
-            if product.stock < quantity_to_sell:
-                raise serializers.ValidationError(
-                    f"Not enough stock for {product.name}. Available: {product.stock}, Requested: {quantity_to_sell}"
-                )
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'task', 'status', 'attempts', 'max_attempts', 'run_after', 'created_at', 'started_at',
+                  'finished_at', 'result', 'error']
+        read_only_fields = fields
 
-            SalesOrderItem.objects.create(sales_order=sales_order, **item_data)
 
-            try:
-                warehouse_item = WarehouseItem.objects.get(product=product)
-                warehouse_item.quantity -= quantity_to_sell
-                warehouse_item.save()
-            except WarehouseItem.DoesNotExist:
-                raise serializers.ValidationError(f"Warehouse inconsistency for product {product.name}.")
+class AvailabilityQuerySerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=500)
+    codes = serializers.ListField(child=serializers.CharField(max_length=20), required=False, max_length=500)
 
-        return sales_order
+    def validate(self, attrs):
+        if not attrs.get('ids') and not attrs.get('codes'):
+            raise serializers.ValidationError('Provide product ids, product codes or both.')
+        return attrs
 
 
+class StockAvailabilitySerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    product_code = serializers.CharField()
+    name = serializers.CharField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    stock = serializers.IntegerField()
+    available = serializers.IntegerField()
 
 
+class ReservationItemSerializer(serializers.ModelSerializer):
+    product = BulkProductField(queryset=Product.objects.all())
+    quantity = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = ReservationItem
+        fields = ['product', 'quantity']
+        list_serializer_class = SalesOrderItemListSerializer
+
+
+class ReservationSerializer(serializers.ModelSerializer):
+    items = ReservationItemSerializer(many=True, allow_empty=False)
+    status = serializers.CharField(source='current_status', read_only=True)
+    ttl = serializers.IntegerField(write_only=True, required=False, min_value=1,
+                                   help_text='Seconds to hold the stock for, up to RESERVATION_MAX_TTL.')
+
+    class Meta:
+        model = Reservation
+        fields = ['id', 'status', 'items', 'ttl', 'created_at', 'expires_at', 'sales_order']
+        read_only_fields = ['created_at', 'expires_at', 'sales_order']
+
+    def create(self, validated_data):
+        ttl = validated_data.get('ttl')
+        return reserve(self.context['request'].user, validated_data['items'],
+                       timedelta(seconds=ttl) if ttl else None)
@@ -0,0 +1,69 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import Signal, receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .authentication import user_cache, mark_revoked
+from .cache import invalidate_products
+from .models import Product, SalesOrder, SalesOrderItem
+from .rollups import schedule_refresh
+
+# Sent with ``product_ids`` after bulk writes that bypass model signals, such as purchase order
+# receipts, stock ledger writes and catalog imports.
+products_changed = Signal()
+
+
+@receiver(products_changed)
+def invalidate_changed_products(sender, product_ids, **kwargs):
+    invalidate_products(product_ids)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    invalidate_products([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=SalesOrderItem)
+def invalidate_product_stock(sender, instance, **kwargs):
+    invalidate_products([instance.product_id])
+
+
+@receiver(post_save, sender=SalesOrder)
+def refresh_edited_order_rollups(sender, instance, created, **kwargs):
+    # New orders are added to the rollups incrementally by place_sales_order.
+    if not created:
+        schedule_refresh(instance.order_date)
+
+
+@receiver(post_delete, sender=SalesOrder)
+def refresh_deleted_order_rollups(sender, instance, **kwargs):
+    schedule_refresh(instance.order_date)
+
+
+@receiver([post_save, post_delete], sender=SalesOrderItem)
+def refresh_order_line_rollups(sender, instance, **kwargs):
+    order_date = SalesOrder.objects.filter(pk=instance.sales_order_id).values_list('order_date', flat=True).first()
+    if order_date is not None:
+        schedule_refresh(order_date)
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    user_cache.discard(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def forget_cached_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        user_cache.discard(instance.pk)
+    else:
+        # A group or permission changed members; every user in it may be cached.
+        user_cache.clear()
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def remember_revoked_token(sender, instance, **kwargs):
+    mark_revoked(instance.token.jti, instance.token.expires_at)
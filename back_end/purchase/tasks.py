@@ -0,0 +1,38 @@
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from .images import generate_renditions
+from .importers import IMPORTERS
+from .jobs import PermanentJobError, task
+from .receiving import receive_purchase_orders
+from .rollups import rebuild_rollups
+
+IMPORT_UPLOADS = 'imports/'
+
+
+@task('images.generate_renditions')
+def generate_image_renditions(name):
+    try:
+        generate_renditions(name)
+    except Image.DecompressionBombError as exc:
+        raise PermanentJobError(str(exc)) from exc
+
+
+@task('purchase_orders.receive')
+def receive_orders(ids):
+    return {'results': receive_purchase_orders(ids)}
+
+
+# Imports commit chunk by chunk, so a failed import is reported rather than run again over the same file.
+@task('imports.run', max_attempts=1)
+def run_import(kind, name, fmt):
+    try:
+        with default_storage.open(name) as handle:
+            return IMPORTERS[kind]().run(handle, fmt)
+    finally:
+        default_storage.delete(name)
+
+
+@task('sales.rebuild_rollups')
+def rebuild_sales_rollups(batch_days=31):
+    return {'days': rebuild_rollups(batch_days)}
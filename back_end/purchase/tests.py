@@ -1,8 +1,57 @@
-from django.test import TestCase
-from rest_framework.test import APITestCase
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+import random
+from unittest import mock, skipUnless
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Sum
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework import status
 from django.contrib.auth.models import User
-from .models import Product, WarehouseItem, PurchaseOrder
+from .models import Product, PurchaseOrder, SalesOrder, SalesOrderItem, DocumentSequence, StockMovement, \
+    StockSnapshot, DailyProductSales, DailyCustomerSales, IdempotencyKey, Job, Reservation, ReservationItem
+from .sequences import allocator
+from .authentication import user_cache
+from .checkout import place_sales_order
+from .receiving import receive_purchase_orders
+from .ledger import adjust_stock, compact_ledger
+from .cache import get_cache
+from .compression import brotli
+from .renderers import FastJSONRenderer, FastJSONParser
+from .routers import choose_replica, health
+from .instrumentation import QueryBudgetExceeded, registry
+from .jobs import TASKS, claim_jobs, enqueue, recover_stale_jobs, run_job, task
+from .views import ProductViewSet, PurchaseOrderViewSet, WarehouseStockViewSet, StockMovementViewSet, \
+    SalesOrderViewSet
+from .urls import router
+from .benchmarks.runner import SCENARIOS
+from .benchmarks.seeding import Seeder
+from .images import generate_renditions, rendition_name, RENDITION_PRESETS, RENDITION_FORMATS
+from django.core.files.storage import default_storage
+from PIL import Image
+
+
+@override_settings(QUERY_BUDGETS_ENFORCED=True)
+class BudgetedAPITestCase(APITestCase):
+    """Fails a test as soon as one of its requests runs more queries than the view's @query_budget."""
 
 
 class ProductModelUnitTests(TestCase):
@@ -14,13 +63,13 @@ class ProductModelUnitTests(TestCase):
 
         self.assertEqual(self.product.stock, 0)
 
-        WarehouseItem.objects.create(product=self.product, quantity=50)
+        adjust_stock(self.product, 50)
 
         self.product.refresh_from_db()
         self.assertEqual(self.product.stock, 50)
 
 
-class AuthIntegrationTests(APITestCase):
+class AuthIntegrationTests(BudgetedAPITestCase):
 
 
     def test_register_user(self):
@@ -45,7 +94,54 @@ class AuthIntegrationTests(APITestCase):
         self.assertTrue('refresh' in response.data)
 
 
-class ProductAPIIntegrationTests(APITestCase):
+
+class CachedJWTAuthenticationTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        user_cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        Product.objects.create(name="Scalpel", price=8)
+        response = self.client.post('/api/token/', {'username': 'testuser', 'password': 'testpassword123'})
+        self.access, self.refresh = response.data['access'], response.data['refresh']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        with self.settings(QUERY_BUDGETS_ENFORCED=False):
+            self.client.get('/api/products/')
+
+    def test_steady_state_reads_run_no_auth_queries(self):
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.request_metrics.queries, 0)
+
+    def test_user_changes_invalidate_the_cache(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/products/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_writes_always_load_the_user(self):
+        # A bulk update sends no signals, so only reads keep trusting the cached user.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/products/').status_code, status.HTTP_200_OK)
+        response = self.client.post('/api/sales-orders/', {'customer_name': 'ArYu', 'items': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout_blacklists_the_access_and_refresh_tokens(self):
+        response = self.client.post('/api/token/logout/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get('/api/products/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials()
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_rotated_refresh_tokens_are_blacklisted(self):
+        self.client.credentials()
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+class ProductAPIIntegrationTests(BudgetedAPITestCase):
 
 
     def setUp(self):
@@ -59,7 +155,7 @@ class ProductAPIIntegrationTests(APITestCase):
         url = '/api/products/'
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_get_products_unauthenticated(self):
 
@@ -75,4 +171,1473 @@ class ProductAPIIntegrationTests(APITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Product.objects.count(), 1)
-        self.assertEqual(Product.objects.get().name, 'New Gadget')
\ No newline at end of file
+        self.assertEqual(Product.objects.get().name, 'New Gadget')
+
+
+class ProductLedgerStockTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+
+    def test_receive_order_updates_stock(self):
+        product = Product.objects.create(name="Syringe", price=1.50)
+        purchase_order = PurchaseOrder.objects.create(product=product, quantity=30, unit_price=1.00)
+
+        response = self.client.post(f'/api/purchase-orders/{purchase_order.id}/receive/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 30)
+
+    def test_product_list_orders_by_stock_in_constant_queries(self):
+        for index, quantity in enumerate([5, 50, 20]):
+            product = Product.objects.create(name=f"Product {index}", price=10)
+            adjust_stock(product, quantity)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/', {'ordering': '-stock'})
+        self.assertEqual([item['stock'] for item in response.data['results']], [50, 20, 5])
+
+    def test_rebuild_stock_command_fixes_drift(self):
+        product = Product.objects.create(name="Gloves", price=3)
+        movement = adjust_stock(product, 12)
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=timezone.now() - timedelta(days=1))
+        # A snapshot written without the movement, as by a transaction committing after compaction.
+        StockSnapshot.objects.create(product=product, quantity=0, taken_at=timezone.now() - timedelta(hours=1))
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stock', '--check', stdout=StringIO())
+
+        call_command('rebuild_stock', stdout=StringIO())
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 12)
+
+
+class DocumentSequenceTests(TestCase):
+
+    def setUp(self):
+        allocator.reset()
+
+    def test_codes_come_from_the_sequence(self):
+        first = Product.objects.create(name="Mask", price=2)
+        second = Product.objects.create(name="Gown", price=8)
+        self.assertEqual(first.product_code, 'PROD-001')
+        self.assertEqual(second.product_code, 'PROD-002')
+
+    def test_spare_numbers_are_pooled_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = SalesOrder.objects.create(customer_name="Grand Hantha")
+        self.assertEqual(order.so_number, 'SO-0001')
+
+        with self.assertNumQueries(1):
+            order = SalesOrder.objects.create(customer_name="ArYu")
+        self.assertEqual(order.so_number, 'SO-0002')
+        allocator.reset()
+
+    def test_reserve_allocates_a_contiguous_block(self):
+        block = allocator.reserve('PO', 50)
+        self.assertEqual(len(block), 50)
+        self.assertEqual(DocumentSequence.objects.get(prefix='PO').last_value, block[-1])
+        self.assertEqual(allocator.reserve('PO', 1)[0], block[-1] + 1)
+
+
+class SalesOrderCheckoutTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        allocator.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+
+    def create_stocked_products(self, count, quantity=10):
+        products = []
+        for index in range(count):
+            product = Product.objects.create(name=f"Item {index}", price=5)
+            adjust_stock(product, quantity)
+            products.append(product)
+        return products
+
+    def post_order(self, products, quantity=1):
+        data = {'customer_name': 'ArYu International',
+                'items': [{'product': product.id, 'quantity': quantity} for product in products]}
+        return self.client.post('/api/sales-orders/', data, format='json')
+
+    def test_order_appends_one_sale_movement_per_product(self):
+        product = Product.objects.create(name="Bandage", price=2)
+        adjust_stock(product, 3)
+        adjust_stock(product, 4)
+
+        response = self.post_order([product, product], quantity=3)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['items']), 2)
+
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 1)
+        sale = product.stock_movements.get(kind=StockMovement.Kind.SALE)
+        self.assertEqual((sale.quantity, sale.sales_order_id), (-6, response.data['id']))
+
+    def test_order_is_rejected_without_touching_stock(self):
+        products = self.create_stocked_products(2, quantity=5)
+
+        response = self.post_order(products, quantity=6)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data), 2)
+        self.assertIn('Available: 5, Requested: 6', response.data[0])
+        self.assertEqual(SalesOrder.objects.count(), 0)
+        self.assertEqual(sum(Product.objects.with_stock().values_list('stock', flat=True)), 10)
+        self.assertFalse(StockMovement.objects.filter(kind=StockMovement.Kind.SALE).exists())
+
+    def test_query_count_does_not_grow_with_lines(self):
+        products = self.create_stocked_products(41)
+        self.post_order(products[:1])
+
+        products = products[1:]
+        with CaptureQueriesContext(connection) as small_order:
+            self.post_order(products[:2])
+        with CaptureQueriesContext(connection) as large_order:
+            self.post_order(products[2:])
+        self.assertEqual(len(small_order), len(large_order))
+
+
+class SalesOrderTotalTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        allocator.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(name="Thermometer", price=12.50)
+        adjust_stock(self.product, 100)
+
+    def test_total_is_stored_on_create(self):
+        data = {'customer_name': 'Grand Hantha', 'items': [{'product': self.product.id, 'quantity': 4}]}
+        response = self.client.post('/api/sales-orders/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_amount'], '50.00')
+        self.assertEqual(SalesOrder.objects.get().total_amount, Decimal('50.00'))
+
+    def test_item_writes_keep_total_in_sync(self):
+        order = SalesOrder.objects.create(customer_name="ArYu")
+        item = SalesOrderItem.objects.create(sales_order=order, product=self.product, quantity=2)
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('25.00'))
+
+        item.delete()
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('0.00'))
+
+    def test_list_orders_by_total_amount(self):
+        for customer, quantity in [('A', 1), ('B', 3), ('C', 2)]:
+            self.client.post('/api/sales-orders/', {
+                'customer_name': customer, 'items': [{'product': self.product.id, 'quantity': quantity}]
+            }, format='json')
+
+        response = self.client.get('/api/sales-orders/', {'ordering': '-total_amount'})
+        self.assertEqual([order['customer_name'] for order in response.data['results']], ['B', 'C', 'A'])
+
+    def test_rebuild_order_totals_command(self):
+        order = SalesOrder.objects.create(customer_name="ArYu")
+        SalesOrderItem.objects.create(sales_order=order, product=self.product, quantity=2)
+        SalesOrder.objects.update(total_amount=0)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_order_totals', '--check', stdout=StringIO())
+
+        call_command('rebuild_order_totals', stdout=StringIO())
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal('25.00'))
+
+
+class PaginationTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        for index in range(5):
+            product = Product.objects.create(name=f"Product {index}", price=10)
+            adjust_stock(product, index % 2 + 1)
+
+    def collect_pages(self, url, params):
+        names = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            names.extend(item['name'] for item in response.data['results'])
+            if not response.data['next']:
+                return names
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_pages_cover_every_product_once(self):
+        names = self.collect_pages('/api/products/', {'page_size': 2})
+        self.assertEqual(names, [f"Product {index}" for index in range(5)])
+
+    def test_cursor_pages_follow_requested_ordering(self):
+        names = self.collect_pages('/api/products/', {'page_size': 2, 'ordering': '-stock'})
+        self.assertEqual(names, ["Product 1", "Product 3", "Product 0", "Product 2", "Product 4"])
+
+    def test_pages_past_ties_are_read_by_key_not_offset(self):
+        first = self.client.get('/api/products/', {'page_size': 1, 'ordering': 'stock'})
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(first.data['next'])
+        self.assertEqual([item['name'] for item in second.data['results']], ["Product 2"])
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+
+    def test_previous_links_walk_back(self):
+        response = self.client.get('/api/products/', {'page_size': 2})
+        response = self.client.get(self.client.get(response.data['next']).data['next'])
+        self.assertEqual([item['name'] for item in response.data['results']], ["Product 4"])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([item['name'] for item in response.data['results']], ["Product 2", "Product 3"])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([item['name'] for item in response.data['results']], ["Product 0", "Product 1"])
+        self.assertIsNone(response.data['previous'])
+
+    def test_cursor_from_another_ordering_is_rejected(self):
+        response = self.client.get('/api/products/', {'page_size': 2})
+        cursor = response.data['next'].split('cursor=')[1].split('&')[0]
+        response = self.client.get('/api/products/', {'page_size': 2, 'ordering': '-stock', 'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_offset_compatibility_mode(self):
+        response = self.client.get('/api/products/', {'offset': 3, 'limit': 10})
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual([item['name'] for item in response.data['results']], ["Product 3", "Product 4"])
+
+
+class ReceiveBatchTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        allocator.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.gloves = Product.objects.create(name="Gloves", price=3)
+        self.masks = Product.objects.create(name="Masks", price=1)
+        adjust_stock(self.gloves, 5)
+
+    def create_order(self, product, quantity):
+        return PurchaseOrder.objects.create(product=product, quantity=quantity, unit_price=1)
+
+    def test_receive_batch_groups_stock_and_reports_each_order(self):
+        first = self.create_order(self.gloves, 10)
+        second = self.create_order(self.gloves, 15)
+        third = self.create_order(self.masks, 7)
+        received = self.create_order(self.masks, 100)
+        received.status = PurchaseOrder.OrderStatus.RECEIVED
+        received.save()
+
+        ids = [first.id, second.id, third.id, received.id, 9999]
+        response = self.client.post('/api/purchase-orders/receive-batch/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['result'] for row in response.data['results']],
+                         ['received', 'received', 'received', 'already_received', 'not_found'])
+
+        self.gloves.refresh_from_db()
+        self.masks.refresh_from_db()
+        self.assertEqual(self.gloves.stock, 30)
+        self.assertEqual(self.masks.stock, 7)
+        receipts = StockMovement.objects.filter(kind=StockMovement.Kind.RECEIPT)
+        self.assertEqual(sorted(receipts.values_list('purchase_order', 'quantity')),
+                         [(first.id, 10), (second.id, 15), (third.id, 7)])
+        self.assertFalse(PurchaseOrder.objects.filter(status=PurchaseOrder.OrderStatus.PENDING).exists())
+
+    def test_receive_batch_query_count_does_not_grow_with_orders(self):
+        few = [self.create_order(self.gloves, 1).id for _ in range(2)]
+        many = [self.create_order(product, 1).id for product in [self.gloves, self.masks] * 20]
+
+        with CaptureQueriesContext(connection) as few_orders:
+            self.client.post('/api/purchase-orders/receive-batch/', {'ids': few}, format='json')
+        with CaptureQueriesContext(connection) as many_orders:
+            self.client.post('/api/purchase-orders/receive-batch/', {'ids': many}, format='json')
+        self.assertLessEqual(len(many_orders), len(few_orders) + 1)
+
+    def test_receive_batch_requires_ids(self):
+        response = self.client.post('/api/purchase-orders/receive-batch/', {'ids': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkImportTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        allocator.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+
+    def test_product_csv_import_upserts_and_reports_errors(self):
+        existing = Product.objects.create(name="Scalpel", price=4)
+        upload = SimpleUploadedFile('catalog.csv', (
+            "product_code,name,description,price\n"
+            f"{existing.product_code},Scalpel,Sterile blade,4.50\n"
+            ",Stethoscope,,80\n"
+            ",Gauze,Roll,not-a-price\n"
+            "PROD-900,Catheter,,12\n"
+        ).encode())
+
+        response = self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(response.data['error_count'], 1)
+        self.assertEqual(response.data['errors'][0]['line'], 4)
+        self.assertIn('price', response.data['errors'][0]['errors'])
+
+        existing.refresh_from_db()
+        self.assertEqual(existing.price, Decimal('4.50'))
+        self.assertEqual(existing.description, 'Sterile blade')
+        self.assertTrue(Product.objects.filter(product_code='PROD-900', name='Catheter').exists())
+        self.assertTrue(Product.objects.get(name='Stethoscope').product_code.startswith('PROD-'))
+
+    def test_imported_product_codes_are_not_issued_again(self):
+        Product.objects.create(name="Scalpel", price=4)
+        upload = SimpleUploadedFile('catalog.csv', (
+            "product_code,name,description,price\n"
+            "PROD-005,Forceps,,9\n"
+            "PROD-040,Catheter,,12\n"
+        ).encode())
+        response = self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['line'], 2)
+        self.assertIn('product_code', response.data['errors'][0]['errors'])
+
+        allocator.reset()
+        codes = []
+        for name in ["Gauze", "Stethoscope", "Syringe"]:
+            response = self.client.post('/api/products/', {'name': name, 'price': '1.00'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            codes.append(response.data['product_code'])
+        self.assertEqual(codes, ['PROD-041', 'PROD-042', 'PROD-043'])
+
+    def test_unreadable_files_are_reported(self):
+        upload = SimpleUploadedFile('catalog.csv', b'\xff\xfe')
+        response = self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(response.data['errors'][0]['line'], 1)
+
+        upload = SimpleUploadedFile('catalog.ndjson', b'{"name": "Gauze", "price": "2"}\n[1, 2]\n{"name": "Lint"\n')
+        response = self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['line'] for error in response.data['errors']], [2, 3])
+        self.assertIn('got list', response.data['errors'][0]['errors']['non_field_errors'][0])
+
+    def test_purchase_order_ndjson_import_command(self):
+        product = Product.objects.create(name="Oxygen Mask", price=6)
+        lines = [
+            {'product_code': product.product_code, 'quantity': 10, 'unit_price': '5.00', 'supplier': 'Acme'},
+            {'product_id': product.id, 'quantity': 3, 'unit_price': '5.00'},
+            {'product_code': 'PROD-404', 'quantity': 1, 'unit_price': '1.00'},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as handle:
+            handle.write('\n'.join(json.dumps(line) for line in lines))
+        self.addCleanup(os.remove, handle.name)
+
+        stdout, stderr = StringIO(), StringIO()
+        call_command('bulk_import', 'purchase-orders', handle.name, chunk_size=2, stdout=stdout, stderr=stderr)
+        self.assertIn('Created 2', stdout.getvalue())
+        self.assertIn('line 3', stderr.getvalue())
+        self.assertEqual(sorted(PurchaseOrder.objects.values_list('quantity', flat=True)), [3, 10])
+        self.assertEqual(len(set(PurchaseOrder.objects.values_list('po_number', flat=True))), 2)
+
+
+class StreamingExportTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        allocator.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(name="Infusion Set", price=7)
+        adjust_stock(self.product, 50)
+
+    def read_stream(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_sales_order_csv_has_one_row_per_line(self):
+        for customer in ['ArYu', 'Grand Hantha']:
+            self.client.post('/api/sales-orders/', {
+                'customer_name': customer,
+                'items': [{'product': self.product.id, 'quantity': 2}, {'product': self.product.id, 'quantity': 1}],
+            }, format='json')
+
+        response = self.client.get('/api/sales-orders/export/', {'format': 'csv', 'customer_name': 'ArYu'})
+        rows = list(csv.DictReader(StringIO(self.read_stream(response))))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual({row['customer_name'] for row in rows}, {'ArYu'})
+        self.assertEqual([row['quantity'] for row in rows], ['2', '1'])
+        self.assertEqual(rows[0]['total_amount'], '21.00')
+
+    def test_purchase_order_ndjson_respects_date_range(self):
+        old = PurchaseOrder.objects.create(product=self.product, quantity=1, unit_price=1)
+        PurchaseOrder.objects.filter(pk=old.pk).update(order_date=timezone.now() - timedelta(days=400))
+        PurchaseOrder.objects.create(product=self.product, quantity=2, unit_price=1)
+
+        since = (timezone.now() - timedelta(days=30)).date().isoformat()
+        response = self.client.get('/api/purchase-orders/export/', {'format': 'ndjson', 'date_from': since})
+        records = [json.loads(line) for line in self.read_stream(response).splitlines()]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['quantity'], 2)
+        self.assertEqual(records[0]['product_code'], self.product.product_code)
+
+    def test_csv_and_ndjson_write_the_same_values(self):
+        order = PurchaseOrder.objects.create(product=self.product, quantity=2, unit_price='1.50')
+        PurchaseOrder.objects.filter(pk=order.pk).update(
+            order_date=datetime(2026, 3, 1, 9, 30, 15, 123456, tzinfo=dt_timezone.utc))
+        self.client.post('/api/sales-orders/', {'customer_name': 'ArYu', 'items': [
+            {'product': self.product.id, 'quantity': 1}]}, format='json')
+
+        for url, fields in [('/api/purchase-orders/export/', ['order_date', 'unit_price']),
+                            ('/api/sales-orders/export/', ['order_date', 'total_amount'])]:
+            with self.subTest(url=url):
+                rows = list(csv.DictReader(StringIO(self.read_stream(self.client.get(url, {'format': 'csv'})))))
+                records = [json.loads(line) for line in
+                           self.read_stream(self.client.get(url, {'format': 'ndjson'})).splitlines()]
+                self.assertEqual([{field: row[field] for field in fields} for row in rows],
+                                 [{field: record[field] for field in fields} for record in records])
+        self.assertEqual(rows[0]['price'], records[0]['items'][0]['price'])
+        self.assertIn('2026-03-01T09:30:15.123456Z', self.read_stream(
+            self.client.get('/api/purchase-orders/export/', {'format': 'csv'})))
+
+    def test_warehouse_export_rejects_bad_dates(self):
+        response = self.client.get('/api/warehouse/export/', {'format': 'csv', 'date_to': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductSearchTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        allocator.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.syringe = Product.objects.create(name="Disposable Syringe 5ml", price=1,
+                                              description="Sterile, single use")
+        self.pump = Product.objects.create(name="Syringe Pump", price=900, description="Infusion device")
+        self.gauze = Product.objects.create(name="Gauze Roll", price=2, description="For syringe-free dressings")
+
+    def search(self, url, term, **params):
+        response = self.client.get(url, {'search': term, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results']
+
+    def test_prefix_terms_all_have_to_match(self):
+        names = [item['name'] for item in self.search('/api/products/', 'syr ster')]
+        self.assertEqual(names, ["Disposable Syringe 5ml"])
+
+    def test_results_are_ranked_by_relevance(self):
+        names = [item['name'] for item in self.search('/api/products/', 'syringe')]
+        self.assertEqual(names[-1], "Gauze Roll")
+        self.assertCountEqual(names[:2], ["Disposable Syringe 5ml", "Syringe Pump"])
+
+        names = [item['name'] for item in self.search('/api/products/', 'syringe', ordering='-price')]
+        self.assertEqual(names, ["Syringe Pump", "Gauze Roll", "Disposable Syringe 5ml"])
+
+    def test_index_follows_product_updates(self):
+        self.pump.name = "Infusion Pump"
+        self.pump.save()
+        names = [item['name'] for item in self.search('/api/products/', 'syringe')]
+        self.assertNotIn("Syringe Pump", names)
+        self.assertEqual([item['name'] for item in self.search('/api/products/', 'infusion pu')], ["Infusion Pump"])
+
+    def test_warehouse_search_by_product_code(self):
+        adjust_stock(self.pump, 2)
+        adjust_stock(self.gauze, 2)
+        results = self.search('/api/warehouse/', self.pump.product_code)
+        self.assertEqual([item['product']['name'] for item in results], ["Syringe Pump"])
+
+
+class CatalogCacheTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        allocator.reset()
+        get_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(name="Pulse Oximeter", price=30)
+        self.other = Product.objects.create(name="Blood Pressure Cuff", price=45)
+        adjust_stock(self.product, 10)
+
+    def test_repeat_requests_skip_the_database(self):
+        first = self.client.get('/api/products/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/products/')
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertIn('Last-Modified', second)
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get(f'/api/products/{self.product.id}/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/products/{self.product.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_deleting_a_product_moves_last_modified(self):
+        last_modified = self.client.get('/api/products/')['Last-Modified']
+        response = self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # A second later, as HTTP dates only have whole seconds.
+        later = mock.Mock(time=mock.Mock(return_value=time.time() + 1))
+        with mock.patch('purchase.cache.time', later), self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/products/{self.other.id}/')
+        response = self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data['results']], [self.product.name])
+
+    def test_stock_changes_invalidate_only_affected_pages(self):
+        self.client.get('/api/products/')
+        self.client.get(f'/api/products/{self.other.id}/')
+        self.client.get('/api/warehouse/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/sales-orders/', {
+                'customer_name': 'ArYu', 'items': [{'product': self.product.id, 'quantity': 4}]
+            }, format='json')
+
+        response = self.client.get('/api/products/')
+        self.assertEqual({item['name']: item['stock'] for item in response.data['results']}[self.product.name], 6)
+        self.assertEqual(self.client.get('/api/warehouse/').data['results'][0]['quantity'], 6)
+        with self.assertNumQueries(0):
+            self.client.get(f'/api/products/{self.other.id}/')
+
+
+class ProductImageRenditionTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_RENDITIONS_EAGER=False)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        get_cache().clear()
+
+        user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=user)
+        self.product = self.create_product('Chair', (1200, 600))
+
+    def create_product(self, name, size):
+        buffer = BytesIO()
+        Image.new('RGB', size, (200, 40, 40)).save(buffer, 'PNG')
+        upload = SimpleUploadedFile(f'{name.lower()}.png', buffer.getvalue(), content_type='image/png')
+        return Product.objects.create(name=name, price=40, image=upload)
+
+    def srcset_widths(self, product):
+        srcset = self.client.get(f'/api/products/{product.id}/').data['image_srcset']
+        return [entry.rsplit(' ', 1)[1] for entry in srcset['jpeg'].split(', ')]
+
+    def test_serializer_exposes_srcset(self):
+        response = self.client.get(f'/api/products/{self.product.id}/')
+        srcset = response.data['image_srcset']
+        self.assertEqual(set(srcset), set(RENDITION_FORMATS))
+        self.assertIn('/api/images/thumb/webp/products/', srcset['webp'])
+        self.assertTrue(srcset['jpeg'].endswith('800w'))
+        self.assertEqual((self.product.image_width, self.product.image_height), (1200, 600))
+
+    def test_srcset_gives_the_real_width_of_portrait_renditions(self):
+        product = self.create_product('Lamp', (600, 1200))
+        self.assertEqual(self.srcset_widths(product), ['32w', '160w', '400w'])
+
+    def test_srcset_leaves_out_presets_larger_than_the_source(self):
+        product = self.create_product('Stool', (200, 100))
+        self.assertEqual(self.srcset_widths(product), ['64w', '200w'])
+
+        self.client.logout()
+        response = self.client.get(f'/api/images/medium/jpeg/{product.image.name}')
+        response.close()
+        with default_storage.open(rendition_name(product.image.name, 'medium', 'jpeg')) as handle, \
+                Image.open(handle) as rendition:
+            self.assertEqual(rendition.size, (200, 100))
+
+    def test_decompression_bombs_are_not_rendered(self):
+        self.client.logout()
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            response = self.client.get(f'/api/images/small/webp/{self.product.image.name}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_rendition_is_generated_on_first_request(self):
+        self.client.logout()
+        response = self.client.get(f'/api/images/small/webp/{self.product.image.name}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('max-age', response['Cache-Control'])
+        response.close()
+        name = rendition_name(self.product.image.name, 'small', 'webp')
+        with default_storage.open(name) as handle, Image.open(handle) as rendition:
+            self.assertEqual(rendition.size, (320, 160))
+
+    def test_unknown_sources_are_rejected(self):
+        for url in ['/api/images/huge/webp/products/x.png', '/api/images/small/webp/products/../secret.png',
+                    '/api/images/small/webp/other/x.png', '/api/images/small/webp/products/missing.png']:
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND, url)
+
+    def test_generate_renditions_creates_every_variant(self):
+        generate_renditions(self.product.image.name)
+        for preset in RENDITION_PRESETS:
+            for fmt in RENDITION_FORMATS:
+                self.assertTrue(default_storage.exists(rendition_name(self.product.image.name, preset, fmt)))
+
+
+class StockLedgerTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        allocator.reset()
+        get_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(name="Catheter", price=4)
+
+    def record(self, quantity, days_ago):
+        movement = adjust_stock(self.product, quantity)
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+
+    def test_stock_as_of_combines_snapshot_and_later_movements(self):
+        self.record(10, days_ago=5)
+        self.record(-3, days_ago=3)
+        self.record(7, days_ago=1)
+
+        self.assertEqual(compact_ledger(taken_at=timezone.now() - timedelta(days=2)), 1)
+        self.assertEqual(compact_ledger(taken_at=timezone.now() - timedelta(days=2, seconds=-1)), 0)
+        self.assertEqual(StockSnapshot.objects.get(product=self.product).quantity, 7)
+
+        self.assertEqual(self.product.stock_at(timezone.now() - timedelta(days=4)), 10)
+        self.assertEqual(self.product.stock_at(timezone.now() - timedelta(days=2)), 7)
+        self.assertEqual(self.product.stock_at(timezone.now()), 14)
+        self.assertFalse(Product.objects.stock_drift().exists())
+
+    def test_adjustments_cannot_take_stock_below_zero(self):
+        self.record(2, days_ago=0)
+        response = self.client.post('/api/stock-movements/', {'product': self.product.id, 'quantity': -3,
+                                                              'note': 'Damaged'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post('/api/stock-movements/', {'product': self.product.id, 'quantity': -2,
+                                                              'note': 'Damaged'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['kind'], StockMovement.Kind.ADJUSTMENT)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+
+    def test_warehouse_lists_stock_as_of_a_date(self):
+        self.record(5, days_ago=3)
+        self.record(-5, days_ago=1)
+        self.assertEqual(self.client.get('/api/warehouse/').data['results'], [])
+
+        as_of = (timezone.now() - timedelta(days=2)).date().isoformat()
+        results = self.client.get('/api/warehouse/', {'as_of': as_of}).data['results']
+        self.assertEqual([(item['product']['name'], item['quantity']) for item in results], [("Catheter", 5)])
+
+    def test_stock_writes_only_append_to_the_ledger(self):
+        updated_at = self.product.updated_at
+        with CaptureQueriesContext(connection) as queries:
+            adjust_stock(self.product, 5)
+        # Stock coming in neither locks nor reads the product.
+        self.assertFalse([query for query in queries if 'purchase_product"' in query['sql']])
+        with CaptureQueriesContext(connection) as queries:
+            adjust_stock(self.product, -2)
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.updated_at), (3, updated_at))
+
+    def test_warehouse_shows_the_order_stock_was_last_received_from(self):
+        orders = [PurchaseOrder.objects.create(product=self.product, supplier='Medline', quantity=quantity,
+                                               unit_price=1) for quantity in (4, 6)]
+        for order in orders:
+            self.client.post(f'/api/purchase-orders/{order.id}/receive/')
+        self.record(-3, days_ago=0)
+        [position] = self.client.get('/api/warehouse/').data['results']
+        received = StockMovement.objects.get(purchase_order=orders[1])
+        self.assertEqual(position['id'], self.product.id)
+        self.assertEqual((position['quantity'], position['purchase_order'], position['po_number']),
+                         (7, orders[1].id, orders[1].po_number))
+        self.assertEqual(parse_datetime(position['added_at']), received.created_at)
+
+    def test_compaction_command(self):
+        self.record(4, days_ago=1)
+        out = StringIO()
+        call_command('compact_stock_ledger', stdout=out)
+        self.assertIn('Wrote 1 stock snapshot(s).', out.getvalue())
+
+
+class SalesRollupTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        allocator.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.gloves = Product.objects.create(name="Gloves", price=3)
+        self.masks = Product.objects.create(name="Masks", price=2)
+        adjust_stock(self.gloves, 100)
+        adjust_stock(self.masks, 100)
+
+    def place_order(self, customer, lines):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/sales-orders/', {
+                'customer_name': customer,
+                'items': [{'product': product.id, 'quantity': quantity} for product, quantity in lines],
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return SalesOrder.objects.get(pk=response.data['id'])
+
+    def rollup_rows(self):
+        return (sorted(DailyProductSales.objects.values_list('product', 'quantity', 'revenue', 'order_count')),
+                sorted(DailyCustomerSales.objects.values_list('customer_name', 'quantity', 'revenue', 'order_count')))
+
+    def test_orders_are_added_incrementally_and_match_a_rebuild(self):
+        self.place_order('ArYu', [(self.gloves, 2), (self.masks, 1), (self.gloves, 1)])
+        self.place_order('ArYu', [(self.gloves, 5)])
+        self.place_order('Medline', [(self.masks, 4)])
+
+        incremental = self.rollup_rows()
+        self.assertEqual(incremental[0], [(self.gloves.id, 8, Decimal('24.00'), 2),
+                                          (self.masks.id, 5, Decimal('10.00'), 2)])
+        self.assertEqual(incremental[1], [('ArYu', 9, Decimal('26.00'), 2), ('Medline', 4, Decimal('8.00'), 1)])
+
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_deleting_an_order_refreshes_its_day(self):
+        order = self.place_order('ArYu', [(self.gloves, 2)])
+        self.place_order('Medline', [(self.gloves, 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/sales-orders/{order.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.rollup_rows(), ([(self.gloves.id, 1, Decimal('3.00'), 1)],
+                                              [('Medline', 1, Decimal('3.00'), 1)]))
+
+    def test_reports_read_only_the_rollups(self):
+        self.place_order('ArYu', [(self.gloves, 2), (self.masks, 1)])
+        self.place_order('Medline', [(self.masks, 10)])
+        today = timezone.localdate().isoformat()
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/reports/sales/', {'date_from': today, 'date_to': today})
+        self.assertEqual([(row['quantity'], row['revenue'], row['order_count']) for row in response.data['results']],
+                         [(13, Decimal('28.00'), 2)])
+
+        response = self.client.get('/api/reports/top-products/', {'order_by': 'quantity', 'limit': 1})
+        self.assertEqual([(row['product_name'], row['quantity']) for row in response.data['results']], [("Masks", 11)])
+
+        response = self.client.get('/api/reports/top-customers/')
+        self.assertEqual([row['customer_name'] for row in response.data['results']], ['Medline', 'ArYu'])
+
+    def test_report_rejects_inverted_range(self):
+        response = self.client.get('/api/reports/sales/', {'date_from': '2026-02-01', 'date_to': '2026-01-01'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class InstrumentationTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        registry.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        Product.objects.create(name="Scalpel", price=8)
+
+    def test_responses_carry_server_timing(self):
+        response = self.client.get('/api/products/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, '
+                                                     r'total;dur=[\d.]+$')
+        self.assertGreater(response.request_metrics.serialize_time, 0)
+
+    def test_detail_and_write_responses_count_serializer_time(self):
+        created = self.client.post('/api/products/', {'name': 'Forceps', 'price': '12.00'}, format='json')
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertGreater(created.request_metrics.serialize_time, 0)
+        response = self.client.get(f"/api/products/{created.data['id']}/")
+        self.assertGreater(response.request_metrics.serialize_time, 0)
+
+    def test_metrics_endpoint_reports_histograms_to_staff(self):
+        self.client.get('/api/products/')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        metrics = self.client.get('/api/metrics/').data['ProductViewSet.list']
+        self.assertEqual(metrics['responses'], {'2xx': 1})
+        self.assertEqual(metrics['latency_ms']['count'], 1)
+        self.assertEqual(metrics['queries']['buckets']['+Inf'], 1)
+
+    def test_exceeding_a_query_budget_fails_the_request(self):
+        message = 'ProductViewSet.list ran 1 queries, over its budget of 0.'
+        with mock.patch.dict(ProductViewSet.query_budgets, {'list': 0}):
+            with self.assertRaisesMessage(QueryBudgetExceeded, message):
+                self.client.get('/api/products/')
+
+
+
+
+class ProjectionEquivalenceTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        allocator.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        gloves = Product.objects.create(name="Nitrile Gloves", description="Box of 100", price=Decimal('3.50'))
+        masks = Product.objects.create(name="Masks", price=2)
+        Product.objects.create(name="Gauze", price=Decimal('0.99'))
+        Product.objects.filter(pk=gloves.pk).update(image='products/gloves.png')
+        adjust_stock(gloves, 40, note='Opening balance')
+        adjust_stock(masks, 5)
+        received = PurchaseOrder.objects.create(product=gloves, supplier='Medline', quantity=10, unit_price=2)
+        PurchaseOrder.objects.create(product=masks, supplier='Terumo', quantity=3, unit_price=Decimal('1.25'))
+        receive_purchase_orders([received.pk])
+        for customer, lines in [('ArYu', [(gloves, 2), (masks, 1)]), ('Medline', [(masks, 2)]), ('Nipro', [])]:
+            with self.captureOnCommitCallbacks(execute=True):
+                place_sales_order(customer, [{'product': product, 'quantity': quantity} for product, quantity in lines])
+
+    def test_list_pages_match_the_serializers(self):
+        paths = {
+            ProductViewSet: ['/api/products/', '/api/products/?search=gloves', '/api/products/?ordering=-stock'],
+            PurchaseOrderViewSet: ['/api/purchase-orders/', '/api/purchase-orders/?status=PENDING'],
+            WarehouseStockViewSet: ['/api/warehouse/', f'/api/warehouse/?as_of={timezone.localdate().isoformat()}'],
+            StockMovementViewSet: ['/api/stock-movements/'],
+            SalesOrderViewSet: ['/api/sales-orders/', '/api/sales-orders/?ordering=-total_amount',
+                                '/api/sales-orders/?offset=1&limit=2'],
+        }
+        for viewset, urls in paths.items():
+            for url in urls:
+                for page in (url, url + ('&' if '?' in url else '?') + 'page_size=2'):
+                    get_cache().clear()
+                    projected = self.client.get(page)
+                    get_cache().clear()
+                    # The serializer path is the reference here, not the thing under budget.
+                    with mock.patch.object(viewset, 'list_projection', None), \
+                            self.settings(QUERY_BUDGETS_ENFORCED=False):
+                        serialized = self.client.get(page)
+                    self.assertEqual(projected.status_code, status.HTTP_200_OK, page)
+                    self.assertEqual(projected.content, serialized.content, page)
+
+    def test_sales_order_items_are_loaded_with_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/sales-orders/')
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(len(queries), 2)
+
+
+class FieldsetTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.gloves = Product.objects.create(name="Nitrile Gloves", description="Box of 100", price=Decimal('3.50'))
+        masks = Product.objects.create(name="Masks", price=2)
+        adjust_stock(self.gloves, 40)
+        adjust_stock(masks, 5)
+        PurchaseOrder.objects.create(product=self.gloves, supplier='Medline', quantity=10, unit_price=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sales_order = place_sales_order('ArYu', [{'product': self.gloves, 'quantity': 2},
+                                                          {'product': masks, 'quantity': 1}])
+
+    def test_sparse_pages_match_the_serializers(self):
+        paths = {
+            ProductViewSet: ['/api/products/?fields=id,name', '/api/products/?omit=description,image,image_srcset'],
+            PurchaseOrderViewSet: ['/api/purchase-orders/?fields=id,product.name',
+                                   '/api/purchase-orders/?expand=product&fields=id,product.stock'],
+            WarehouseStockViewSet: ['/api/warehouse/?fields=product.id,product.name,quantity',
+                                    '/api/warehouse/?fields=id'],
+            StockMovementViewSet: ['/api/stock-movements/?expand=product&omit=note,product.image_srcset'],
+            SalesOrderViewSet: ['/api/sales-orders/?omit=items', '/api/sales-orders/?fields=id,items.product_name',
+                                '/api/sales-orders/?expand=items.product&fields=so_number,items.product.name'],
+        }
+        for viewset, urls in paths.items():
+            for url in urls:
+                get_cache().clear()
+                projected = self.client.get(url)
+                get_cache().clear()
+                with mock.patch.object(viewset, 'list_projection', None), \
+                        self.settings(QUERY_BUDGETS_ENFORCED=False):
+                    serialized = self.client.get(url)
+                self.assertEqual(projected.status_code, status.HTTP_200_OK, url)
+                self.assertEqual(projected.content, serialized.content, url)
+
+    def test_fields_and_omit_select_the_keys(self):
+        response = self.client.get('/api/products/?fields=id,name')
+        self.assertEqual([set(row) for row in response.data['results']], [{'id', 'name'}] * 2)
+        response = self.client.get(f'/api/products/{self.gloves.pk}/?omit=description,image,image_srcset')
+        self.assertEqual(set(response.data), {'id', 'product_code', 'name', 'price', 'stock'})
+        response = self.client.get('/api/warehouse/?fields=product.id,product.name,quantity')
+        self.assertIn({'product': {'id': self.gloves.pk, 'name': 'Nitrile Gloves'}, 'quantity': 38},
+                      response.data['results'])
+
+    def test_expand_swaps_in_the_related_serializer(self):
+        response = self.client.get(f'/api/sales-orders/{self.sales_order.pk}/?expand=items.product'
+                                   '&fields=id,items.quantity,items.product.id,items.product.product_code')
+        self.assertEqual(response.data['items'][0], {
+            'product': {'id': self.gloves.pk, 'product_code': self.gloves.product_code}, 'quantity': 2,
+        })
+        response = self.client.get('/api/purchase-orders/?expand=product&fields=product.stock')
+        self.assertEqual(response.data['results'], [{'product': {'stock': 38}}])
+
+    def test_left_out_relations_are_not_queried(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/sales-orders/?omit=items')
+        self.assertNotIn('items', response.data['results'][0])
+        self.assertEqual(len(queries), 1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/sales-orders/{self.sales_order.pk}/?fields=id,so_number')
+        self.assertEqual(response.data, {'id': self.sales_order.pk, 'so_number': self.sales_order.so_number})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('customer_name', queries[0]['sql'])
+
+    def test_writes_ignore_fieldsets(self):
+        response = self.client.post('/api/sales-orders/?fields=id', {
+            'customer_name': 'Nipro', 'items': [{'product': self.gloves.pk, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('items', response.data)
+
+class IdempotencyTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(name="Nitrile Gloves", price=3)
+        adjust_stock(self.product, 10)
+        self.purchase_order = PurchaseOrder.objects.create(product=self.product, quantity=5, unit_price=2)
+
+    def post(self, url, data=None, key='retry-1'):
+        return self.client.post(url, data or {}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retried_sales_order_is_created_once(self):
+        payload = {'customer_name': 'ArYu', 'items': [{'product': self.product.pk, 'quantity': 4}]}
+        first = self.post('/api/sales-orders/', payload)
+        retry = self.post('/api/sales-orders/', {'items': payload['items'], 'customer_name': 'ArYu'})
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(SalesOrder.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 6)
+
+    def test_retried_receipt_replays_the_first_result(self):
+        url = f'/api/purchase-orders/{self.purchase_order.pk}/receive/'
+        first, retry = self.post(url), self.post(url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual((retry.status_code, retry.json()), (status.HTTP_200_OK, first.json()))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 15)
+        self.assertEqual(self.post(url, key='retry-2').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_keys_are_scoped_to_one_request_and_user(self):
+        url = '/api/purchase-orders/'
+        self.assertEqual(self.post(url, {'product': self.product.pk, 'quantity': 1, 'unit_price': 2}).status_code,
+                         status.HTTP_201_CREATED)
+        response = self.post(url, {'product': self.product.pk, 'quantity': 2, 'unit_price': 2})
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.client.force_authenticate(User.objects.create_user(username='other', password='testpassword123'))
+        response = self.post(url, {'product': self.product.pk, 'quantity': 2, 'unit_price': 2})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(PurchaseOrder.objects.count(), 3)
+
+    def test_failed_requests_release_the_key(self):
+        url = '/api/sales-orders/'
+        response = self.post(url, {'customer_name': 'ArYu', 'items': [{'product': self.product.pk, 'quantity': 50}]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        response = self.post(url, {'customer_name': 'ArYu', 'items': [{'product': self.product.pk, 'quantity': 5}]})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_in_flight_keys_conflict_until_their_lock_expires(self):
+        url = f'/api/purchase-orders/{self.purchase_order.pk}/receive/'
+        running = IdempotencyKey.objects.filter(pk=IdempotencyKey.objects.create(
+            user=self.user, key='retry-1', fingerprint='', locked_until=timezone.now() + timedelta(minutes=1),
+            expires_at=timezone.now() + timedelta(hours=1)).pk)
+        with mock.patch('purchase.idempotency.fingerprint', return_value=''):
+            self.assertEqual(self.post(url).status_code, status.HTTP_409_CONFLICT)
+            running.update(locked_until=timezone.now() - timedelta(seconds=1))
+            self.assertEqual(self.post(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, status.HTTP_200_OK)
+
+    def test_expired_keys_are_purged(self):
+        self.post(f'/api/purchase-orders/{self.purchase_order.pk}/receive/')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class ReservationTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        allocator.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.other = APIClient()
+        self.other.force_authenticate(user=User.objects.create_user(username='other', password='testpassword123'))
+        self.client.force_authenticate(user=self.user)
+        self.gloves = Product.objects.create(name="Gloves", price=3)
+        adjust_stock(self.gloves, 10)
+
+    def reserve(self, quantity, client=None, **extra):
+        return (client or self.client).post('/api/reservations/', {
+            'items': [{'product': self.gloves.id, 'quantity': quantity}], **extra}, format='json')
+
+    def order(self, quantity, client=None, **extra):
+        return (client or self.client).post('/api/sales-orders/', {
+            'customer_name': 'Clinic', 'items': [{'product': self.gloves.id, 'quantity': quantity}], **extra},
+            format='json')
+
+    def available(self):
+        return Product.objects.with_available().get(pk=self.gloves.pk).available
+
+    def test_holds_are_not_available_to_other_orders(self):
+        response = self.reserve(8)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], Reservation.Status.ACTIVE)
+        self.assertEqual(response.data['items'], [{'product': self.gloves.id, 'quantity': 8}])
+        self.assertEqual(self.available(), 2)
+
+        response = self.order(3, client=self.other)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Available: 2', str(response.data))
+        self.assertEqual(self.order(2, client=self.other).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.reserve(1, client=self.other).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_checkout_consumes_its_reservation(self):
+        reservation = self.reserve(10).data['id']
+        self.assertEqual(self.order(1, client=self.other, reservation=reservation).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        response = self.order(10, reservation=reservation)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        stored = Reservation.objects.get(pk=reservation)
+        self.assertEqual((stored.status, stored.sales_order_id), (Reservation.Status.CONSUMED, response.data['id']))
+        self.gloves.refresh_from_db()
+        self.assertEqual((self.gloves.stock, self.available()), (0, 0))
+        self.assertEqual(self.order(1, reservation=reservation).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_checkout_checks_only_what_its_reservation_does_not_cover(self):
+        reservation = self.reserve(8).data['id']
+        self.assertEqual(self.reserve(2, client=self.other).status_code, status.HTTP_201_CREATED)
+
+        response = self.order(9, reservation=reservation)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Available: 0, Requested: 1', str(response.data))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.order(8, reservation=reservation)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # Covered units need neither the stock nor the holds aggregate.
+        self.assertFalse([query for query in queries if 'SUM(' in query['sql']])
+        self.assertEqual((Product.objects.with_stock().get(pk=self.gloves.pk).stock, self.available()), (2, 0))
+
+    def test_expired_and_released_holds_stop_counting(self):
+        expired = self.reserve(6, ttl=60).data['id']
+        ReservationItem.objects.filter(reservation=expired).update(expires_at=timezone.now())
+        Reservation.objects.filter(pk=expired).update(expires_at=timezone.now())
+        self.assertEqual(self.client.get(f'/api/reservations/{expired}/').data['status'], Reservation.Status.EXPIRED)
+        self.assertEqual(self.available(), 10)
+
+        released = self.reserve(10).data['id']
+        self.assertEqual(self.client.delete(f'/api/reservations/{released}/').status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Reservation.objects.get(pk=released).status, Reservation.Status.RELEASED)
+        self.assertEqual(self.available(), 10)
+        self.assertEqual(self.client.get(f'/api/reservations/{released}/').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.other.get(f'/api/reservations/{released}/').status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(RESERVATION_MAX_TTL=timedelta(minutes=5))
+    def test_ttl_is_capped(self):
+        response = self.reserve(1, ttl=86400)
+        expires_at = Reservation.objects.get(pk=response.data['id']).expires_at
+        self.assertLessEqual(expires_at, timezone.now() + timedelta(minutes=5))
+        self.assertEqual(call_command('purge_reservations', days=0, stdout=StringIO()), None)
+        self.assertTrue(Reservation.objects.exists())
+
+
+class StockAvailabilityTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        allocator.reset()
+        get_cache().clear()
+        self.client.force_authenticate(user=User.objects.create_user(username='testuser', password='testpassword123'))
+        self.gloves = Product.objects.create(name="Gloves", price=3)
+        self.masks = Product.objects.create(name="Masks", price=1)
+        adjust_stock(self.gloves, 10)
+        adjust_stock(self.masks, 2)
+
+    def availability(self, **query):
+        response = self.client.post('/api/stock/availability/', query, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_looks_up_ids_and_codes_in_one_query(self):
+        self.client.post('/api/reservations/', {'items': [{'product': self.gloves.id, 'quantity': 4}]}, format='json')
+        data = self.availability(ids=[self.gloves.id, 9999], codes=[self.masks.product_code, 'PROD-404'])
+        self.assertEqual(data['results'], [
+            {'id': self.gloves.id, 'product_code': self.gloves.product_code, 'name': 'Gloves', 'price': '3.00',
+             'stock': 10, 'available': 6},
+            {'id': self.masks.id, 'product_code': self.masks.product_code, 'name': 'Masks', 'price': '1.00',
+             'stock': 2, 'available': 2},
+        ])
+        self.assertEqual(data['not_found'], {'ids': [9999], 'codes': ['PROD-404']})
+        self.assertEqual(self.client.post('/api/stock/availability/', {}, format='json').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(STOCK_AVAILABILITY_CACHE_TTL=30)
+    def test_cached_answers_are_dropped_when_stock_or_holds_change(self):
+        self.assertEqual(self.availability(ids=[self.gloves.id])['results'][0]['available'], 10)
+        # Written past record_movements, so no signal drops the cached answer.
+        StockMovement.objects.create(product=self.gloves, kind=StockMovement.Kind.ADJUSTMENT, quantity=-1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.availability(ids=[self.gloves.id])['results'][0]['available'], 10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/reservations/', {'items': [{'product': self.gloves.id, 'quantity': 4}]},
+                             format='json')
+        self.assertEqual(self.availability(ids=[self.gloves.id])['results'][0]['available'], 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            adjust_stock(self.gloves, 1)
+        self.assertEqual(self.availability(ids=[self.gloves.id])['results'][0]['available'], 6)
+
+
+def run_due_jobs(worker='test-worker'):
+    """Claim and run due jobs on the test's own connection, where the test case's data is visible."""
+    for job_id in claim_jobs(worker, 100):
+        run_job(Job.objects.get(pk=job_id), worker)
+
+
+class JobTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        allocator.reset()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.attempts = []
+
+        def flaky():
+            self.attempts.append(timezone.now())
+            raise RuntimeError('Supplier API unavailable')
+
+        task('tests.flaky')(flaky)
+        self.addCleanup(TASKS.pop, 'tests.flaky')
+
+    def test_receipt_can_be_queued_and_polled(self):
+        order = PurchaseOrder.objects.create(product=Product.objects.create(name="Gloves", price=3), quantity=4,
+                                             unit_price=1)
+        response = self.client.post(f'/api/purchase-orders/{order.id}/receive/', headers={'Prefer': 'respond-async'})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response['Preference-Applied'], 'respond-async')
+        self.assertEqual(response.data['status'], Job.Status.QUEUED)
+        location = response['Location']
+        self.assertTrue(location.endswith(f'/api/jobs/{response.data["id"]}/'))
+        order.refresh_from_db()
+        self.assertEqual(order.status, PurchaseOrder.OrderStatus.PENDING)
+
+        run_due_jobs()
+        job = self.client.get(location).data
+        self.assertEqual((job['status'], job['attempts']), (Job.Status.SUCCEEDED, 1))
+        self.assertEqual(job['result']['results'][0]['result'], 'received')
+        order.product.refresh_from_db()
+        self.assertEqual(order.product.stock, 4)
+
+    @override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_BACKOFF=timedelta(seconds=30))
+    def test_failures_are_retried_with_backoff_until_attempts_run_out(self):
+        job = enqueue('tests.flaky')
+        run_due_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), (Job.Status.QUEUED, 1, ''))
+        self.assertEqual(job.error, 'RuntimeError: Supplier API unavailable')
+        self.assertGreaterEqual(job.run_after, self.attempts[0] + timedelta(seconds=30))
+
+        run_due_jobs()
+        self.assertEqual(len(self.attempts), 1)
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        run_due_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, len(self.attempts)), (Job.Status.FAILED, 2, 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_claimed_jobs_are_not_claimed_again_until_their_lease_expires(self):
+        first, second = enqueue('sales.rebuild_rollups'), enqueue('sales.rebuild_rollups')
+        self.assertEqual(claim_jobs('worker-a', 1), [first.pk])
+        self.assertEqual(claim_jobs('worker-b', 5), [second.pk])
+        self.assertEqual(claim_jobs('worker-b', 5), [])
+
+        Job.objects.filter(pk=first.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(recover_stale_jobs(), 1)
+        self.assertEqual(claim_jobs('worker-b', 5), [first.pk])
+        first.refresh_from_db()
+        self.assertEqual((first.locked_by, first.attempts), ('worker-b', 2))
+
+    def test_users_only_see_their_own_jobs(self):
+        mine = enqueue('sales.rebuild_rollups', created_by=self.user)
+        other = enqueue('sales.rebuild_rollups', created_by=User.objects.create_user(username='other', password='x'))
+        response = self.client.get('/api/jobs/')
+        self.assertEqual([job['id'] for job in response.data['results']], [mine.id])
+        self.assertEqual(self.client.get(f'/api/jobs/{other.id}/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class JobWorkerTests(TransactionTestCase):
+
+    def setUp(self):
+        allocator.reset()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_queued_import_runs_on_the_worker_pool(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username='testuser', password='testpassword123'))
+        upload = SimpleUploadedFile('catalog.csv', b"name,price\nScalpel,4.50\nGauze,1\n")
+        response = client.post('/api/products/import/', {'file': upload}, format='multipart',
+                               headers={'Prefer': 'respond-async'})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(Product.objects.exists())
+
+        stdout = StringIO()
+        call_command('run_jobs', once=True, concurrency=1, stdout=stdout)
+        self.assertIn('Ran 1 job(s).', stdout.getvalue())
+        job = Job.objects.get(pk=response.data['id'])
+        self.assertEqual((job.status, job.result['created']), (Job.Status.SUCCEEDED, 2))
+        self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), ['Gauze', 'Scalpel'])
+        self.assertFalse(default_storage.exists(job.payload['name']))
+
+
+class FastJSONTests(TestCase):
+
+    def setUp(self):
+        self.data = {
+            'price': Decimal('12.50'), 'created_at': timezone.now(), 'day': timezone.localdate(),
+            'name': 'Gaze \u2028 \u2603', 'items': [{'quantity': 2, 'total': Decimal('0.10')}], 1: None,
+        }
+
+    def test_renders_like_the_stdlib_renderer(self):
+        expected = JSONRenderer().render(self.data)
+        self.assertEqual(FastJSONRenderer().render(self.data), expected)
+        with mock.patch('purchase.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), expected)
+        self.assertEqual(FastJSONRenderer().render(self.data, 'application/json; indent=4'),
+                         JSONRenderer().render(self.data, 'application/json; indent=4'))
+
+    def test_parses_json(self):
+        self.assertEqual(FastJSONParser().parse(BytesIO(b'{"items": [{"quantity": 2}]}')), {'items': [{'quantity': 2}]})
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(BytesIO(b'{"items": '))
+
+
+class CompressionTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        for index in range(30):
+            product = Product.objects.create(name=f'Nitrile Gloves {index}', description='Box of 100', price=3)
+            PurchaseOrder.objects.create(product=product, supplier='Medline', quantity=10, unit_price=2)
+
+    def test_large_responses_are_gzipped(self):
+        plain = self.client.get('/api/products/')
+        response = self.client.get('/api/products/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(response['ETag'], f'W/{plain["ETag"]}')
+        revalidated = self.client.get('/api/products/', HTTP_ACCEPT_ENCODING='gzip',
+                                      HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_small_or_unaccepted_responses_are_left_alone(self):
+        product = Product.objects.first()
+        response = self.client.get(f'/api/products/{product.pk}/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get('/api/products/', HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streamed_exports_are_compressed_as_they_stream(self):
+        response = self.client.get('/api/purchase-orders/export/', {'format': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 30)
+
+    @skipUnless(brotli, 'Brotli is not installed')
+    def test_brotli_is_preferred_when_accepted(self):
+        plain = self.client.get('/api/products/')
+        response = self.client.get('/api/products/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+
+
+def add_sqlite_database(alias, path):
+    configured = connections.configure_settings({DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+                                                 alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}})
+    connections.settings[alias] = configured[alias]
+
+
+@override_settings(DATABASE_PRIMARY='primary', DATABASE_REPLICAS={'replica': 1})
+class ReplicaRoutingTests(SimpleTestCase):
+    """Routes between two SQLite databases standing in for a primary and a replica that is not replicated to."""
+    databases = {DEFAULT_DB_ALIAS}
+    aliases = ('primary', 'replica', 'broken')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added after the test database checks, which only know the databases in settings.
+        cls.databases = cls.databases | set(cls.aliases)
+        cls.directory = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.directory)
+        cls.addClassCleanup(cls.remove_databases)
+        for alias in cls.aliases[:2]:
+            add_sqlite_database(alias, os.path.join(cls.directory, f'{alias}.sqlite3'))
+        add_sqlite_database('broken', os.path.join(cls.directory, 'missing', 'broken.sqlite3'))
+        call_command('migrate', database='primary', verbosity=0)
+        connections['primary'].close()
+        shutil.copy(os.path.join(cls.directory, 'primary.sqlite3'), os.path.join(cls.directory, 'migrated.sqlite3'))
+
+    @classmethod
+    def remove_databases(cls):
+        for alias in cls.aliases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+
+    def setUp(self):
+        for alias in self.aliases[:2]:
+            connections[alias].close()
+            shutil.copy(os.path.join(self.directory, 'migrated.sqlite3'),
+                        os.path.join(self.directory, f'{alias}.sqlite3'))
+            Product.objects.using(alias).bulk_create([Product(product_code='P-1', name='Gauze', price=3)])
+        self.product = Product.objects.using('primary').get()
+        health.reset()
+        get_cache().clear()
+        self.addCleanup(health.reset)
+        self.user = User(pk=1, username='testuser')
+
+    def client_for(self, token):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def order_count(self, client):
+        response = client.get('/api/purchase-orders/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(response.data['results'])
+
+    def test_reads_use_the_replica_until_a_client_writes(self):
+        writer, reader = self.client_for('writer'), self.client_for('reader')
+        order = {'product': self.product.id, 'quantity': 5, 'unit_price': '2.00'}
+        response = writer.post('/api/purchase-orders/', order, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(PurchaseOrder.objects.using('primary').count(), 1)
+        self.assertEqual(PurchaseOrder.objects.using('replica').count(), 0)
+
+        self.assertEqual(self.order_count(reader), 0)
+        self.assertEqual(self.order_count(writer), 1)
+        get_cache().clear()
+        self.assertEqual(self.order_count(writer), 0)
+
+    def test_unreachable_replica_falls_back_to_the_primary(self):
+        PurchaseOrder.objects.create(product=self.product, quantity=5, unit_price=2)
+        client = self.client_for('reader')
+        broken = connections['broken']
+        with override_settings(DATABASE_REPLICAS={'broken': 1}), \
+                mock.patch.object(broken, 'ensure_connection', wraps=broken.ensure_connection) as connect:
+            self.assertEqual(self.order_count(client), 1)
+            self.assertEqual(self.order_count(client), 1)
+        self.assertEqual(connect.call_count, 1)
+        self.assertFalse(health.is_up('broken'))
+
+    def test_replicas_are_picked_by_weight(self):
+        rng = random.Random(7)
+        with override_settings(DATABASE_REPLICAS={'primary': 3, 'replica': 1, 'broken': 0}):
+            picks = [choose_replica(rng) for _ in range(2000)]
+        self.assertEqual(set(picks), {'primary', 'replica'})
+        self.assertAlmostEqual(picks.count('primary') / len(picks), 0.75, delta=0.03)
+
+
+@override_settings(ASYNC_READ_CONCURRENT_QUERIES=False)
+class AsyncReadTests(BudgetedAPITestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword123')
+        self.client.force_authenticate(user=self.user)
+        self.gloves = Product.objects.create(name="Nitrile Gloves", price=3)
+        self.masks = Product.objects.create(name="Masks", price=2)
+        adjust_stock(self.gloves, 40)
+        adjust_stock(self.masks, 2)
+        self.sales_order = SalesOrder.objects.create(customer_name='ArYu', total_amount=Decimal('6.00'))
+
+    def test_lists_match_the_sync_endpoints_and_add_a_summary(self):
+        summaries = {
+            '/api/products/?search=gloves': {'products': 1, 'units': 40},
+            '/api/products/?ordering=-stock': {'products': 2, 'units': 42},
+            '/api/warehouse/': {'products': 2, 'units': 42},
+            '/api/sales-orders/': {'orders': 1, 'revenue': Decimal('6.00')},
+        }
+        for path, summary in summaries.items():
+            response = self.client.get(path.replace('/api/', '/api/async/'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK, path)
+            self.assertEqual(response.data['summary'], summary)
+            self.assertEqual(response.data['results'], self.client.get(path).data['results'])
+
+    def test_detail_matches_the_sync_endpoint(self):
+        response = self.client.get(f'/api/async/products/{self.gloves.id}/')
+        self.assertEqual(response.json(), self.client.get(f'/api/products/{self.gloves.id}/').json())
+        self.assertEqual(self.client.get('/api/async/products/999999/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get('/api/async/products/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_served_and_instrumented_by_the_async_handler(self):
+        client = AsyncClient()
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        with self.settings(QUERY_BUDGETS_ENFORCED=False):
+            # The first request with a token loads the user and checks the blacklist.
+            self.assertEqual((await client.get('/api/async/warehouse/', headers=headers)).request_metrics.queries, 4)
+        response = await client.get('/api/async/warehouse/?page_size=1', headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['summary'], {'products': 2, 'units': 42})
+        self.assertEqual(response.request_metrics.queries, 2)
+        self.assertEqual((await client.get('/api/products/', headers=headers)).request_metrics.queries, 1)
+
+
+class ConcurrentAsyncReadTests(TransactionTestCase):
+
+    def test_page_and_summary_queries_run_on_their_own_connections(self):
+        user = User.objects.create_user(username='testuser', password='testpassword123')
+        adjust_stock(Product.objects.create(name="Scalpel", price=8), 5)
+        client = APIClient()
+        client.force_authenticate(user=user)
+        response = client.get('/api/async/products/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['summary'], {'products': 1, 'units': 5})
+        self.assertEqual([product['name'] for product in response.data['results']], ['Scalpel'])
+
+@override_settings(ASYNC_READ_CONCURRENT_QUERIES=False)
+class BenchmarkTests(TestCase):
+
+    def setUp(self):
+        allocator.reset()
+        Seeder(products=20, purchase_orders=30, sales_lines=40, lines_per_order=4, customers=5, days=10,
+               batch_size=10).run()
+
+    def test_seeded_history_is_consistent(self):
+        self.assertEqual(Product.objects.count(), 20)
+        self.assertEqual(PurchaseOrder.objects.count(), 30)
+        self.assertEqual(SalesOrder.objects.count(), 10)
+        self.assertFalse(Product.objects.stock_drift().exists())
+        self.assertFalse(Product.objects.with_stock().filter(stock__lt=0).exists())
+        self.assertEqual(DailyCustomerSales.objects.aggregate(total=Sum('order_count'))['total'], 10)
+        self.assertEqual(len(set(SalesOrder.objects.values_list('so_number', flat=True))), 10)
+
+    def test_runner_covers_every_endpoint_without_errors(self):
+        prefixes = {name.split('.')[0] for name in (scenario.name for scenario in SCENARIOS)}
+        self.assertEqual(prefixes, {prefix for prefix, _, _ in router.registry})
+
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('run_benchmarks', requests=2, warmup=0, output=output.name, stderr=StringIO())
+            report = json.load(output)
+
+        self.assertEqual(report['meta']['mode'], 'in-process')
+        self.assertEqual(report['meta']['rows']['Product'], 20)
+        self.assertEqual(set(report['scenarios']), {scenario.name for scenario in SCENARIOS})
+        for name, result in report['scenarios'].items():
+            self.assertEqual((result['requests'], result['errors']), (2, 0), name)
+            self.assertIsNotNone(result['p99_ms'], name)
+            self.assertIsNotNone(result['queries_max'], name)
@@ -1,17 +1,33 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import ProductViewSet, PurchaseOrderViewSet, WarehouseItemViewSet, SalesOrderViewSet, CreateUserView
+from .async_views import ProductListView, ProductDetailView, WarehouseListView, SalesOrderListView
+from .views import ProductViewSet, PurchaseOrderViewSet, WarehouseStockViewSet, StockMovementViewSet, \
+    SalesOrderViewSet, ReportViewSet, JobViewSet, ReservationViewSet, StockViewSet, MetricsView, CreateUserView, \
+    LogoutView, image_rendition
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
 router.register(r'purchase-orders', PurchaseOrderViewSet)
-router.register(r'warehouse', WarehouseItemViewSet, basename='warehouse')
+router.register(r'warehouse', WarehouseStockViewSet, basename='warehouse')
+router.register(r'stock-movements', StockMovementViewSet)
 router.register(r'sales-orders', SalesOrderViewSet)
+router.register(r'reports', ReportViewSet, basename='reports')
+router.register(r'jobs', JobViewSet)
+router.register(r'reservations', ReservationViewSet)
+router.register(r'stock', StockViewSet, basename='stock')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('user/register/', CreateUserView.as_view(), name='register'),
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/logout/', LogoutView.as_view(), name='token_logout'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    # Async versions of the read-heavy endpoints, for deployments served through backend.asgi.
+    path('async/products/', ProductListView.as_view(), name='async-product-list'),
+    path('async/products/<int:pk>/', ProductDetailView.as_view(), name='async-product-detail'),
+    path('async/warehouse/', WarehouseListView.as_view(), name='async-warehouse-list'),
+    path('async/sales-orders/', SalesOrderListView.as_view(), name='async-sales-order-list'),
+    path('images/<str:preset>/<str:fmt>/<path:name>', image_rendition, name='image-rendition'),
 ]
\ No newline at end of file
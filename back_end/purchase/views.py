@@ -1,43 +1,175 @@
 # your_app_name/views.py
 
-from rest_framework import viewsets, status, filters, generics
+from rest_framework import viewsets, status, filters, generics, mixins, views
 from rest_framework.decorators import action
+from rest_framework.reverse import reverse
 from rest_framework.response import Response
 from django.db import transaction, models
-from .models import Product, PurchaseOrder, WarehouseItem, SalesOrder
-from .serializers import ProductSerializer, PurchaseOrderSerializer, WarehouseItemSerializer, SalesOrderSerializer, \
-    UserSerializer
+from .models import Product, PurchaseOrder, StockMovement, SalesOrder, Job, Reservation, ledger_stock
+from .serializers import ProductSerializer, PurchaseOrderSerializer, StockPositionSerializer, SalesOrderSerializer, \
+    UserSerializer, ReceiveBatchSerializer, ImportFileSerializer, StockMovementSerializer, ReportQuerySerializer, \
+    LogoutSerializer, JobSerializer, ReservationSerializer, AvailabilityQuerySerializer, StockAvailabilitySerializer
+from .authentication import revoke_token
+from .availability import stock_availability
+from .importers import IMPORTERS, guess_format
+from .exports import ExportMixin, SalesOrderExportMixin, parse_bound
+from .idempotency import idempotent
+from .jobs import enqueue, prefers_async
+from .ledger import record_movements
+from .rollups import sales_series, top_products, top_customers
+from .instrumentation import TimedCreateModelMixin, TimedModelViewSet, TimedReadOnlyModelViewSet, query_budget, \
+    registry, serialized
+from .search import ProductSearchFilter
+from .cache import CachedResponseMixin
+from .fieldsets import FieldsetMixin
+from .projections import Projection, ProjectedListMixin
+from .renderers import FastJSONParser
+from .receiving import receive_purchase_orders, RECEIVED
+from .reservations import release_reservation
+from .tasks import IMPORT_UPLOADS
+from .images import RENDITION_PRESETS, RENDITION_FORMATS, ensure_rendition, is_valid_source, schedule_renditions
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
+from django.views.decorators.http import require_GET
+from PIL import Image, UnidentifiedImageError
 from rest_framework.parsers import MultiPartParser, FormParser
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from django.contrib.auth.models import User
 
 
+def queued_response(request, task, payload):
+    """202 Accepted for work queued as a job, pointing at the job's status."""
+    job = enqueue(task, payload, created_by=request.user)
+    location = reverse('job-detail', args=[job.pk], request=request)
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED,
+                    headers={'Location': location, 'Preference-Applied': 'respond-async'})
+
+
+def import_response(request, kind):
+    serializer = ImportFileSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    upload = serializer.validated_data['file']
+    fmt = serializer.validated_data.get('format') or guess_format(upload.name)
+    if prefers_async(request):
+        name = default_storage.save(IMPORT_UPLOADS + upload.name, upload)
+        return queued_response(request, 'imports.run', {'kind': kind, 'name': name, 'fmt': fmt})
+    report = IMPORTERS[kind]().run(upload.file, fmt)
+    return Response(report, status=status.HTTP_200_OK)
+
+
+@require_GET
+def image_rendition(request, preset, fmt, name):
+    if preset not in RENDITION_PRESETS or fmt not in RENDITION_FORMATS or not is_valid_source(name):
+        raise Http404('Unknown image rendition.')
+    try:
+        rendition = ensure_rendition(name, preset, fmt)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        # Missing and unreadable sources alike, including ones too large to decode safely.
+        raise Http404('Image not found.')
+    response = FileResponse(default_storage.open(rendition), content_type=RENDITION_FORMATS[fmt][1])
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+
+class MetricsView(views.APIView):
+    """Per-view latency, DB time, serializer time and query count histograms for this process."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(registry.snapshot())
+
+
 class CreateUserView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class LogoutView(views.APIView):
+    """Blacklist the access token of the request and, when given, the session's refresh token."""
     permission_classes = [IsAuthenticated]
-    queryset = Product.objects.all().order_by('name')
+
+    def post(self, request):
+        serializer = LogoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            if request.auth is not None:
+                revoke_token(request.auth)
+            if serializer.validated_data.get('refresh') is not None:
+                revoke_token(serializer.validated_data['refresh'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+# Query budgets count every statement a request runs, savepoints included. JWT authentication adds
+# none to reads once the user and token checks are cached, and one user lookup to writes.
+# Constant-query actions keep the same budget however many rows or lines they touch, and creates allow
+# for refilling the document number block. Actions marked @idempotent may run idempotency.KEY_QUERIES
+# more with an Idempotency-Key, which the budget check allows for.
+@query_budget(list=2, retrieve=1, create=15, update=8, partial_update=8, destroy=10)
+class ProductViewSet(CachedResponseMixin, FieldsetMixin, ProjectedListMixin, TimedModelViewSet):
+    permission_classes = [IsAuthenticated]
+    queryset = Product.objects.with_stock().order_by('name')
     serializer_class = ProductSerializer
-    parser_classes = (MultiPartParser, FormParser)
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    list_projection = Projection(ProductSerializer)
+    parser_classes = (FastJSONParser, MultiPartParser, FormParser)
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, ProductSearchFilter]
     filterset_fields = ['name']
-    search_fields = ['name', 'product_code', 'description']
     ordering_fields = ['name', 'price', 'stock']
+    ordering = ['name', 'id']
+    cache_namespace = 'products'
+    cache_detail_by_object = True
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        # A new product has no stock movements yet.
+        serializer.instance.stock = 0
+        schedule_renditions(serializer.instance.image)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        if 'image' in serializer.validated_data:
+            schedule_renditions(serializer.instance.image)
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_products(self, request):
+        return import_response(request, 'products')
 
-class PurchaseOrderViewSet(viewsets.ModelViewSet):
+
+@query_budget(list=1, retrieve=1, create=10, update=4, partial_update=4, destroy=4, receive_order=9,
+              receive_batch=8)
+class PurchaseOrderViewSet(ExportMixin, FieldsetMixin, ProjectedListMixin, TimedModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = PurchaseOrder.objects.select_related('product').all().order_by('-order_date')
     serializer_class = PurchaseOrderSerializer
+    list_projection = Projection(PurchaseOrderSerializer)
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['status', 'product__name']
     ordering_fields = ['order_date', 'supplier']
+    ordering = ['-order_date', 'id']
+    export_date_field = 'order_date'
+    export_fields = {
+        'po_number': 'po_number',
+        'product_code': 'product__product_code',
+        'product_name': 'product__name',
+        'supplier': 'supplier',
+        'quantity': 'quantity',
+        'unit_price': 'unit_price',
+        'order_date': 'order_date',
+        'status': 'status',
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fieldset = self.get_fieldset()
+        if fieldset is not None and fieldset.includes('product') and fieldset.expands('product'):
+            product_fieldset = fieldset.child('product')
+            if product_fieldset is None or product_fieldset.includes('stock'):
+                # Read by the list projection as the expanded product's stock column.
+                queryset = queryset.annotate(product__stock=ledger_stock(product='product'))
+        return queryset
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         data = request.data.copy()
         if 'product' in data and 'product_id' not in data:
@@ -46,46 +178,193 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
-        headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        data = serialized(serializer)
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
 
     @action(detail=True, methods=['post'], url_path='receive')
-    @transaction.atomic
+    @idempotent
     def receive_order(self, request, pk=None):
         purchase_order = self.get_object()
 
         if purchase_order.status == 'RECEIVED':
             return Response({'error': 'This order has already been received.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        purchase_order.status = PurchaseOrder.OrderStatus.RECEIVED
-        purchase_order.save()
-
-        warehouse_item, created = WarehouseItem.objects.get_or_create(
-            product=purchase_order.product,
-            defaults={'quantity': 0}
-        )
-        warehouse_item.quantity += purchase_order.quantity
-        warehouse_item.purchase_order = purchase_order
-        warehouse_item.save()
+        if prefers_async(request):
+            return queued_response(request, 'purchase_orders.receive', {'ids': [purchase_order.pk]})
+        result = receive_purchase_orders([purchase_order.pk])[0]
+        if result['result'] != RECEIVED:
+            return Response({'error': 'This order has already been received.'}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({'status': 'Order received and stock updated.'}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_orders(self, request):
+        return import_response(request, 'purchase-orders')
+
+    @action(detail=False, methods=['post'], url_path='receive-batch')
+    def receive_batch(self, request):
+        serializer = ReceiveBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if prefers_async(request):
+            return queued_response(request, 'purchase_orders.receive', {'ids': serializer.validated_data['ids']})
+        results = receive_purchase_orders(serializer.validated_data['ids'])
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+
+@query_budget(list=1, retrieve=1)
+class WarehouseStockViewSet(CachedResponseMixin, ExportMixin, FieldsetMixin, ProjectedListMixin,
+                            TimedReadOnlyModelViewSet):
+    """
+    Stock on hand per product, or as of the ``as_of`` date/time from the stock ledger. Positions
+    are keyed by product id; ``added_at`` is when stock last came in, and ``purchase_order`` and
+    ``po_number`` the purchase order it was last received from.
+    """
+    permission_classes = [IsAuthenticated]
+    queryset = Product.objects.with_stock()
+    serializer_class = StockPositionSerializer
+    list_projection = Projection(StockPositionSerializer)
+    filter_backends = [ProductSearchFilter]
+    ordering = ['-added_at', 'id']
+    export_date_field = 'added_at'
+    export_fields = {
+        'id': 'id',
+        'product_code': 'product_code',
+        'product_name': 'name',
+        'quantity': 'quantity',
+        'po_number': 'po_number',
+        'added_at': 'added_at',
+    }
+    cache_namespace = 'warehouse'
+
+    def get_queryset(self):
+        as_of = self.request.query_params.get('as_of')
+        when = parse_bound(as_of, end_of_day=True) if as_of else None
+        quantity = ledger_stock(when) if when else models.F('stock')
+        movements = StockMovement.objects.filter(product=models.OuterRef('pk')).order_by('-created_at', '-id')
+        if when:
+            movements = movements.filter(created_at__lte=when)
+        queryset = super().get_queryset().annotate(
+            added_at=models.Subquery(movements.filter(quantity__gt=0).values('created_at')[:1]))
+        if self.requests_field('purchase_order') or self.requests_field('po_number'):
+            received = movements.filter(purchase_order__isnull=False)
+            queryset = queryset.annotate(
+                purchase_order=models.Subquery(received.values('purchase_order')[:1]),
+                po_number=models.Subquery(received.values('purchase_order__po_number')[:1]))
+        # Sparse requests that leave out the quantity still filter on it, without selecting it.
+        queryset = queryset.annotate(quantity=quantity) if self.requests_field('quantity') else \
+            queryset.alias(quantity=quantity)
+        return queryset.filter(quantity__gt=0)
+
 
-class WarehouseItemViewSet(viewsets.ReadOnlyModelViewSet):
+@query_budget(list=1, retrieve=1, create=7)
+class StockMovementViewSet(FieldsetMixin, ProjectedListMixin, TimedCreateModelMixin, TimedReadOnlyModelViewSet):
+    """The stock ledger; new entries posted here are recorded as adjustments."""
     permission_classes = [IsAuthenticated]
-    queryset = WarehouseItem.objects.select_related('product').filter(quantity__gt=0).order_by('-added_at')
-    serializer_class = WarehouseItemSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['product__name', 'product__product_code']
+    queryset = StockMovement.objects.select_related('purchase_order', 'sales_order')
+    serializer_class = StockMovementSerializer
+    list_projection = Projection(StockMovementSerializer)
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['product', 'kind', 'purchase_order', 'sales_order']
+    ordering = ['-id']
 
+    def perform_create(self, serializer):
+        movement = StockMovement(kind=StockMovement.Kind.ADJUSTMENT, **serializer.validated_data)
+        record_movements([movement])
+        serializer.instance = movement
 
-class SalesOrderViewSet(viewsets.ModelViewSet):
+
+@query_budget(list=3, retrieve=3, create=21, update=7, partial_update=7, destroy=10)
+class SalesOrderViewSet(SalesOrderExportMixin, FieldsetMixin, ProjectedListMixin, TimedModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = SalesOrder.objects.prefetch_related('items__product').all().order_by('-order_date')
     serializer_class = SalesOrderSerializer
+    list_projection = Projection(SalesOrderSerializer)
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['customer_name']
     ordering_fields = ['order_date', 'total_amount']
+    ordering = ['-order_date', 'id']
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+
+@query_budget(availability=1)
+class StockViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    @action(detail=False, methods=['post'])
+    def availability(self, request):
+        """Stock, available stock and price of many products at once, looked up by ``ids`` and/or ``codes``."""
+        serializer = AvailabilityQuerySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = stock_availability(serializer.validated_data.get('ids', ()), serializer.validated_data.get('codes', ()))
+        results = serialized(StockAvailabilitySerializer(data['results'], many=True))
+        return Response({'results': results, 'not_found': data['not_found']})
+
+
+@query_budget(list=2, retrieve=2, create=9, destroy=6)
+class ReservationViewSet(TimedCreateModelMixin, mixins.DestroyModelMixin, TimedReadOnlyModelViewSet):
+    """
+    Stock held for a checkout. Holds expire on their own after the reservation's TTL; deleting a
+    reservation releases its stock early, and placing a sales order with it consumes it.
+    """
+    permission_classes = [IsAuthenticated]
+    queryset = Reservation.objects.all()
+    serializer_class = ReservationSerializer
+    ordering = ['-id']
+
+    def get_queryset(self):
+        queryset = super().get_queryset().filter(user=self.request.user)
+        return queryset if self.action == 'destroy' else queryset.prefetch_related('items')
+
+    def perform_destroy(self, instance):
+        release_reservation(instance)
+
+
+@query_budget(list=1, retrieve=1)
+class JobViewSet(TimedReadOnlyModelViewSet):
+    """Status of background jobs: users see the jobs they queued, staff every job."""
+    permission_classes = [IsAuthenticated]
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['task', 'status']
+    ordering = ['-id']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return queryset if self.request.user.is_staff else queryset.filter(created_by=self.request.user)
+
+
+@query_budget(sales=1, top_products=1, top_customers=1)
+class ReportViewSet(viewsets.ViewSet):
+    """Sales reports served from the daily rollup tables rather than the order history."""
+    permission_classes = [IsAuthenticated]
+
+    def get_query(self, request):
+        serializer = ReportQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    def report_response(self, query, rows):
+        return Response({'date_from': query['date_from'], 'date_to': query['date_to'], 'results': list(rows)})
 
+    @action(detail=False, methods=['get'])
+    def sales(self, request):
+        query = self.get_query(request)
+        rows = sales_series(query['date_from'], query['date_to'], query['interval'],
+                            product=query.get('product'), customer=query.get('customer'))
+        return self.report_response(query, rows)
 
+    @action(detail=False, methods=['get'], url_path='top-products')
+    def top_products(self, request):
+        query = self.get_query(request)
+        return self.report_response(query, top_products(query['date_from'], query['date_to'],
+                                                        query['order_by'], query['limit']))
 
+    @action(detail=False, methods=['get'], url_path='top-customers')
+    def top_customers(self, request):
+        query = self.get_query(request)
+        return self.report_response(query, top_customers(query['date_from'], query['date_to'],
+                                                         query['order_by'], query['limit']))
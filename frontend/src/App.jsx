@@ -6,15 +6,19 @@ const API_BASE_URL = import.meta.env.VITE_API_ROOT_URL;
 // const API_BASE_URL = 'http://localhost:8000/api';
 
 // --- API Service ---
+const fetchJson = async (url) => {
+    const response = await fetch(url, {
+        headers: { 'Authorization': `Bearer ${localStorage.getItem('access_token')}` }
+    });
+    if (!response.ok) throw new Error('Network response was not ok');
+    return response.json();
+};
+
 const apiService = {
     get: async (endpoint, params = {}) => {
         const url = new URL(`${API_BASE_URL}${endpoint}`);
         Object.keys(params).forEach(key => url.searchParams.append(key, params[key]));
-        const response = await fetch(url, {
-            headers: { 'Authorization': `Bearer ${localStorage.getItem('access_token')}` }
-        });
-        if (!response.ok) throw new Error('Network response was not ok');
-        return response.json();
+        return fetchJson(url);
     },
     post: async (endpoint, data, isFormData = false) => {
         const headers = { 'Authorization': `Bearer ${localStorage.getItem('access_token')}` };
@@ -109,6 +113,73 @@ const SearchBar = ({ onSearch }) => {
     );
 };
 
+// List endpoints are cursor paginated. Tables show one page at a time and move with the page's
+// `next` and `previous` links; pickers start with one page and load more on demand.
+const EMPTY_PAGE = { results: [], next: null, previous: null };
+
+const usePagedList = (endpoint) => {
+    const [page, setPage] = useState(EMPTY_PAGE);
+    const [loading, setLoading] = useState(true);
+    const [error, setError] = useState(null);
+    const [searchTerm, setSearchTerm] = useState('');
+
+    const load = useCallback(async (request) => {
+        setLoading(true);
+        setError(null);
+        try {
+            setPage(await request());
+        } catch (err) {
+            setError(err.message);
+        } finally {
+            setLoading(false);
+        }
+    }, []);
+
+    const search = useCallback((term = '') => {
+        setSearchTerm(term);
+        return load(() => apiService.get(endpoint, term ? { search: term } : {}));
+    }, [endpoint, load]);
+
+    const goTo = useCallback((url) => load(() => fetchJson(url)), [load]);
+    const reload = useCallback(() => search(searchTerm), [search, searchTerm]);
+
+    useEffect(() => {
+        search();
+    }, [search]);
+
+    return { items: page.results, page, loading, error, search, goTo, reload };
+};
+
+const useLoadMoreList = (endpoint, params) => {
+    const [items, setItems] = useState([]);
+    const [next, setNext] = useState(null);
+
+    const append = useCallback(async (request) => {
+        try {
+            const page = await request();
+            setItems(current => [...current, ...page.results]);
+            setNext(page.next);
+        } catch (err) {
+            console.error(err);
+        }
+    }, []);
+
+    useEffect(() => {
+        setItems([]);
+        append(() => apiService.get(endpoint, params));
+    }, [endpoint, params, append]);
+
+    const loadMore = useCallback(() => next && append(() => fetchJson(next)), [next, append]);
+    return { items, hasMore: !!next, loadMore };
+};
+
+const Pager = ({ page, onPage }) => (page.previous || page.next) ? (
+    <div className="pager">
+        <button type="button" className="btn btn-secondary" disabled={!page.previous} onClick={() => onPage(page.previous)}>Previous</button>
+        <button type="button" className="btn btn-secondary" disabled={!page.next} onClick={() => onPage(page.next)}>Next</button>
+    </div>
+) : null;
+
 // --- Authentication Components ---
 function LoginPage({ onLogin, onSwitchToRegister }) {
     const [username, setUsername] = useState('');
@@ -249,29 +320,10 @@ function DashboardPage({ setCurrentPage }) {
 }
 
 function ProductPage() {
-    const [products, setProducts] = useState([]);
-    const [loading, setLoading] = useState(true);
-    const [error, setError] = useState(null);
+    const { items: products, page, loading, error: fetchError, search, goTo, reload } = usePagedList('/products/');
     const [isModalOpen, setIsModalOpen] = useState(false);
     const [selectedProduct, setSelectedProduct] = useState(null);
-
-    const fetchProducts = useCallback(async (searchTerm = '') => {
-        setLoading(true);
-        setError(null);
-        try {
-            const params = searchTerm ? { search: searchTerm } : {};
-            const data = await apiService.get('/products/', params);
-            setProducts(data);
-        } catch (err) {
-            setError(`Could not fetch products. Please ensure the Django server is running and accessible. Error: ${err.message}`);
-        } finally {
-            setLoading(false);
-        }
-    }, []);
-
-    useEffect(() => {
-        fetchProducts();
-    }, [fetchProducts]);
+    const error = fetchError && `Could not fetch products. Please ensure the Django server is running and accessible. Error: ${fetchError}`;
 
     const handleFormSubmit = async (productFormData) => {
         const isEdit = !!productFormData.get('id');
@@ -279,7 +331,7 @@ function ProductPage() {
         const method = isEdit ? 'patch' : 'post';
         try {
             await apiService[method](url, productFormData, true);
-            fetchProducts();
+            reload();
             setIsModalOpen(false);
         } catch (err) {
             alert(`Error: ${err.message}`);
@@ -290,7 +342,7 @@ function ProductPage() {
         if (!window.confirm("Are you sure you want to delete this product?")) return;
         try {
             await apiService.delete(`/products/${productId}/`);
-            fetchProducts();
+            reload();
         } catch (err) {
             alert(`Error: ${err.message}`);
         }
@@ -299,7 +351,7 @@ function ProductPage() {
     return (
         <div className="container">
             <PageHeader title="Products" subtitle="Manage all products in your system.">
-                <SearchBar onSearch={fetchProducts} />
+                <SearchBar onSearch={search} />
                 <button onClick={() => { setSelectedProduct(null); setIsModalOpen(true); }} className="btn btn-primary">
                     Add New Product
                 </button>
@@ -325,7 +377,7 @@ function ProductPage() {
                                 <tr key={product.id}>
                                     <td>
                                         {product.image ?
-                                            <img src={product.image} alt={product.name} className="product-image" /> :
+                                            <img src={product.image} srcSet={product.image_srcset?.webp} sizes="64px" loading="lazy" alt={product.name} className="product-image" /> :
                                             <div className="product-image-placeholder">No Image</div>
                                         }
                                     </td>
@@ -345,6 +397,7 @@ function ProductPage() {
                     </tbody>
                 </table>
             </div>
+            <Pager page={page} onPage={goTo} />
             {isModalOpen && <ProductFormModal product={selectedProduct} onClose={() => setIsModalOpen(false)} onSubmit={handleFormSubmit} />}
         </div>
     );
@@ -426,33 +479,13 @@ const ProductFormModal = ({ product, onClose, onSubmit }) => {
 
 
 function WarehousePage() {
-    const [items, setItems] = useState([]);
-    const [loading, setLoading] = useState(true);
-    const [error, setError] = useState(null);
-
-    const fetchItems = useCallback(async (searchTerm = '') => {
-        setLoading(true);
-        setError(null);
-        try {
-            const params = searchTerm ? { search: searchTerm } : {};
-            const data = await apiService.get('/warehouse/', params);
-            setItems(data);
-        } catch (err) {
-                 const detailedError = `Could not connect to the API. Error: ${err.message}`;
-                setError(detailedError);
-        } finally {
-            setLoading(false);
-        }
-    }, []);
-
-    useEffect(() => {
-        fetchItems();
-    }, [fetchItems]);
+    const { items, page, loading, error: fetchError, search, goTo } = usePagedList('/warehouse/');
+    const error = fetchError && `Could not connect to the API. Error: ${fetchError}`;
 
     return (
         <div className="container">
             <PageHeader title="Warehouse Inventory" subtitle="All items currently in stock.">
-                <SearchBar onSearch={fetchItems} />
+                <SearchBar onSearch={search} />
             </PageHeader>
             {error && <ErrorMessage message={error} />}
             <div className="table-container">
@@ -462,25 +495,27 @@ function WarehousePage() {
                             <th>Image</th>
                             <th>Product</th>
                             <th>Quantity</th>
+                            <th>Purchase Order</th>
                             <th>Date Added</th>
                         </tr>
                     </thead>
                     <tbody>
                         {loading && !error ? (
-                            <tr><td colSpan="4"><LoadingSpinner text="Loading inventory..." /></td></tr>
+                            <tr><td colSpan="5"><LoadingSpinner text="Loading inventory..." /></td></tr>
                         ) : items.length === 0 && !error ? (
-                            <tr><td colSpan="4" style={{textAlign: 'center', padding: '2.5rem'}}>Warehouse is empty.</td></tr>
+                            <tr><td colSpan="5" style={{textAlign: 'center', padding: '2.5rem'}}>Warehouse is empty.</td></tr>
                         ) : (
                             items.map(item => (
                                 <tr key={item.id}>
                                     <td>
                                         {item.product.image ?
-                                            <img src={item.product.image} alt={item.product.name} className="product-image" /> :
+                                            <img src={item.product.image} srcSet={item.product.image_srcset?.webp} sizes="64px" loading="lazy" alt={item.product.name} className="product-image" /> :
                                             <div className="product-image-placeholder">No Image</div>
                                         }
                                     </td>
                                     <td>{item.product.name}</td>
                                     <td>{item.quantity}</td>
+                                    <td>{item.po_number || '-'}</td>
                                     <td>{new Date(item.added_at).toLocaleDateString()}</td>
                                 </tr>
                             ))
@@ -488,38 +523,20 @@ function WarehousePage() {
                     </tbody>
                 </table>
             </div>
+            <Pager page={page} onPage={goTo} />
         </div>
     );
 }
 
 function PurchaseOrderPage() {
-    const [orders, setOrders] = useState([]);
-    const [loading, setLoading] = useState(true);
-    const [error, setError] = useState(null);
+    const { items: orders, page, loading, error: fetchError, search, goTo, reload } = usePagedList('/purchase-orders/');
     const [isModalOpen, setIsModalOpen] = useState(false);
-
-    const fetchOrders = useCallback(async (searchTerm = '') => {
-        setLoading(true);
-        setError(null);
-        try {
-            const params = searchTerm ? { search: searchTerm } : {};
-            const data = await apiService.get('/purchase-orders/', params);
-            setOrders(data);
-        } catch (err) {
-            setError(`Could not fetch purchase orders. Error: ${err.message}`);
-        } finally {
-            setLoading(false);
-        }
-    }, []);
-
-    useEffect(() => {
-        fetchOrders();
-    }, [fetchOrders]);
+    const error = fetchError && `Could not fetch purchase orders. Error: ${fetchError}`;
 
     const handleFormSubmit = async (orderData) => {
         try {
             await apiService.post('/purchase-orders/', orderData);
-            fetchOrders();
+            reload();
             setIsModalOpen(false);
         } catch (err) {
             alert(`Error creating purchase order: ${err.message}`);
@@ -530,7 +547,7 @@ function PurchaseOrderPage() {
         if (!window.confirm("Mark this order as received? This will add its items to the warehouse.")) return;
         try {
             await apiService.post(`/purchase-orders/${orderId}/receive/`);
-            fetchOrders();
+            reload();
         } catch (err) {
             alert(`Error: ${err.message}`);
         }
@@ -539,7 +556,7 @@ function PurchaseOrderPage() {
     return (
         <div className="container">
             <PageHeader title="Purchase Orders" subtitle="Orders placed with suppliers.">
-                 <SearchBar onSearch={fetchOrders} />
+                 <SearchBar onSearch={search} />
                  <button onClick={() => setIsModalOpen(true)} className="btn btn-primary">
                     Add Purchase Order
                 </button>
@@ -569,7 +586,7 @@ function PurchaseOrderPage() {
                                     <td>{order.po_number}</td>
                                      <td>
                                         {order.product.image ?
-                                            <img src={order.product.image} alt={order.product.name} className="product-image" /> :
+                                            <img src={order.product.image} srcSet={order.product.image_srcset?.webp} sizes="64px" loading="lazy" alt={order.product.name} className="product-image" /> :
                                             <div className="product-image-placeholder">No Image</div>
                                         }
                                     </td>
@@ -594,13 +611,16 @@ function PurchaseOrderPage() {
                     </tbody>
                 </table>
             </div>
+            <Pager page={page} onPage={goTo} />
             {isModalOpen && <PurchaseOrderFormModal onClose={() => setIsModalOpen(false)} onSubmit={handleFormSubmit} />}
         </div>
     );
 }
 
+const PRODUCT_PICKER_PARAMS = { fields: 'id,name' };
+
 const PurchaseOrderFormModal = ({ onClose, onSubmit }) => {
-    const [products, setProducts] = useState([]);
+    const { items: products, hasMore, loadMore } = useLoadMoreList('/products/', PRODUCT_PICKER_PARAMS);
     const [formData, setFormData] = useState({
         product: '',
         supplier: '',
@@ -608,18 +628,6 @@ const PurchaseOrderFormModal = ({ onClose, onSubmit }) => {
         unit_price: 0,
     });
 
-    useEffect(() => {
-        const fetchProductsForForm = async () => {
-            try {
-                const data = await apiService.get('/products/');
-                setProducts(data);
-            } catch (err) {
-                console.error(err);
-            }
-        };
-        fetchProductsForForm();
-    }, []);
-
     const handleChange = (e) => {
         const { name, value } = e.target;
         setFormData(prev => ({ ...prev, [name]: value }));
@@ -642,6 +650,7 @@ const PurchaseOrderFormModal = ({ onClose, onSubmit }) => {
                             <option value="">Select a product</option>
                             {products.map(p => <option key={p.id} value={p.id}>{p.name}</option>)}
                         </select>
+                        {hasMore && <button type="button" onClick={loadMore} className="add-item-btn">Load more products</button>}
                     </div>
                     <div className="form-group">
                         <label htmlFor="supplier">Supplier Name</label>
@@ -667,33 +676,14 @@ const PurchaseOrderFormModal = ({ onClose, onSubmit }) => {
 
 
 function SalesOrderPage() {
-    const [orders, setOrders] = useState([]);
-    const [loading, setLoading] = useState(true);
-    const [error, setError] = useState(null);
+    const { items: orders, page, loading, error: fetchError, search, goTo, reload } = usePagedList('/sales-orders/');
     const [isModalOpen, setIsModalOpen] = useState(false);
-
-    const fetchOrders = useCallback(async (searchTerm = '') => {
-        setLoading(true);
-        setError(null);
-        try {
-            const params = searchTerm ? { search: searchTerm } : {};
-            const data = await apiService.get('/sales-orders/', params);
-            setOrders(data);
-        } catch (err) {
-            setError(`Could not fetch sales orders. Error: ${err.message}`);
-        } finally {
-            setLoading(false);
-        }
-    }, []);
-
-    useEffect(() => {
-        fetchOrders();
-    }, [fetchOrders]);
+    const error = fetchError && `Could not fetch sales orders. Error: ${fetchError}`;
 
     const handleFormSubmit = async (orderData) => {
         try {
             await apiService.post('/sales-orders/', orderData);
-            fetchOrders();
+            reload();
             setIsModalOpen(false);
         } catch (err) {
             alert(`Error creating sales order: ${err.message}`);
@@ -703,7 +693,7 @@ function SalesOrderPage() {
     return (
         <div className="container">
             <PageHeader title="Sales Orders" subtitle="Orders from customers.">
-                 <SearchBar onSearch={fetchOrders} />
+                 <SearchBar onSearch={search} />
                  <button onClick={() => setIsModalOpen(true)} className="btn btn-success">
                     Create Sales Order
                 </button>
@@ -735,7 +725,7 @@ function SalesOrderPage() {
                                             {order.items.map(item => (
                                                 <li key={item.id}>
                                                     {item.product_image ?
-                                                        <img src={item.product_image} alt={item.product_name} className="table-product-image-small" /> :
+                                                        <img src={item.product_image} srcSet={item.product_image_srcset?.webp} sizes="64px" loading="lazy" alt={item.product_name} className="table-product-image-small" /> :
                                                         <div className="table-product-image-placeholder-small"></div>
                                                     }
                                                     <span>{item.quantity} x {item.product_name}</span>
@@ -751,28 +741,19 @@ function SalesOrderPage() {
                     </tbody>
                 </table>
             </div>
+            <Pager page={page} onPage={goTo} />
             {isModalOpen && <SalesOrderFormModal onClose={() => setIsModalOpen(false)} onSubmit={handleFormSubmit} />}
         </div>
     );
 }
 
+const STOCK_PICKER_PARAMS = { fields: 'product.id,product.name,quantity' };
+
 const SalesOrderFormModal = ({ onClose, onSubmit }) => {
-    const [warehouseStock, setWarehouseStock] = useState([]);
+    const { items: warehouseStock, hasMore, loadMore } = useLoadMoreList('/warehouse/', STOCK_PICKER_PARAMS);
     const [customerName, setCustomerName] = useState('');
     const [items, setItems] = useState([{ product: '', quantity: 1 }]);
 
-    useEffect(() => {
-        const fetchWarehouseStock = async () => {
-            try {
-                const data = await apiService.get('/warehouse/');
-                setWarehouseStock(data);
-            } catch (err) {
-                console.error(err);
-            }
-        };
-        fetchWarehouseStock();
-    }, []);
-
     const handleItemChange = (index, field, value) => {
         const newItems = [...items];
         newItems[index][field] = value;
@@ -802,12 +783,28 @@ const SalesOrderFormModal = ({ onClose, onSubmit }) => {
         setItems(newItems);
     };
 
-    const handleSubmit = (e) => {
+    const handleSubmit = async (e) => {
         e.preventDefault();
         const orderData = {
             customer_name: customerName,
             items: items.filter(item => item.product && item.quantity > 0).map(item => ({product: item.product, quantity: item.quantity}))
         };
+        // Re-check every line against current stock in one request before submitting.
+        try {
+            const requested = {};
+            orderData.items.forEach(item => {
+                requested[item.product] = (requested[item.product] || 0) + Number(item.quantity);
+            });
+            const { results } = await apiService.post('/stock/availability/', { ids: Object.keys(requested).map(Number) });
+            const stock = Object.fromEntries(results.map(row => [row.id, row]));
+            const shortages = Object.entries(requested).filter(([id, quantity]) => quantity > (stock[id]?.available ?? 0));
+            if (shortages.length) {
+                alert(shortages.map(([id]) => `${stock[id]?.name ?? id}: only ${stock[id]?.available ?? 0} available`).join('\n'));
+                return;
+            }
+        } catch (err) {
+            console.error(err);
+        }
         onSubmit(orderData);
     };
 
@@ -847,6 +844,7 @@ const SalesOrderFormModal = ({ onClose, onSubmit }) => {
                     </div>
 
                     <button type="button" onClick={handleAddItem} className="add-item-btn">+ Add another item</button>
+                    {hasMore && <button type="button" onClick={loadMore} className="add-item-btn">Load more products</button>}
 
                     <div className="form-actions">
                         <button type="button" onClick={onClose} className="btn btn-secondary">Cancel</button>
@@ -872,6 +870,15 @@ export default function App() {
     };
 
     const handleLogout = () => {
+        // Revoke the tokens server side; the local session ends whether or not this succeeds.
+        fetch(`${API_BASE_URL}/token/logout/`, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${localStorage.getItem('access_token')}`,
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ refresh: localStorage.getItem('refresh_token') }),
+        }).catch(() => {});
         localStorage.removeItem('access_token');
         localStorage.removeItem('refresh_token');
         setIsAuthenticated(false);